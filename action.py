@@ -1,90 +1,477 @@
+import journal
 import os
+import planner
+import template
+import time
 
-from openpyxl import Workbook
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from typing import Iterable, Iterator
 
-from utils import Type, Strings
+from utils import Conflict, Type, Strings
 
+# What an action did, for the summary and the exit code
+Outcome = namedtuple("Outcome", ["done", "skipped", "failed"])
 
-def rename(workbook: Workbook,
+PROBE = 64  # Sources looked up by a dry run, to estimate the apply time
+
+REASONS = {
+    Conflict.EXISTS: Strings.reason_exists,
+    Conflict.DUPLICATE: Strings.reason_duplicate,
+    Conflict.CASE: Strings.reason_case,
+}
+
+
+def rename(workbook: Iterable[tuple],
            entry_dir: str,
            entry_type: Type,
-           entries: list):
+           entries: list,
+           suffix: bool = False,
+           workers: int = None,
+           journal_path: str = None,
+           dry_run: bool = False) -> Outcome:
     """
     This action executes rename after the user saves the changes.
 
+    The rows are planned first, so swaps and chains of renames work and
+    conflicts are found before anything is renamed. When a rename fails,
+    the renames waiting for its name are skipped, so nothing is overwritten.
+    With workers, chains that share no names run at the same time, which
+    hides the round-trips of a network share. With a journal, the run can
+    be resumed after a crash and undone afterwards. A dry run loads and
+    plans the rows the same way, then prints the plan instead.
+
     Args:
-        workbook (Workbook):    The spreadsheet object.
+        workbook (Iterable):    The (name, rename) rows loaded from the spreadsheet.
         entry_dir (str):        The user defined directory for files or folders.
         entry_type (Type):      The data type to manage.
-        entries (list):         The list of data to manage.
+        entries (EntryTable):   The files or folders to manage (a list of entries also works).
+        suffix (bool):          Rename to "name (2)" when a new name is taken.
+        workers (int):          The renames to run at once (None = one at a time).
+        journal_path (str):     The journal file to write (None = no journal).
+        dry_run (bool):         Only print the plan, counts and timings.
     Returns:
-        None
+        Outcome:                The number of renamed, skipped and failed rows.
     """
     print()
-    rename_count = 0
+    if dry_run:
+        return _preview_rename(workbook, entry_dir, entry_type, entries, suffix, workers)
+    rename_plan = planner.plan(workbook, entries, entry_dir, entry_type=entry_type, suffix=suffix)
+    for skip in rename_plan.skipped:
+        print(_skip_message(skip, entry_type))
+
+    if journal_path is None:
+        return _apply(rename_plan, entry_type, workers, None, len(rename_plan.skipped))
+    with journal.Journal.start(journal_path, entry_dir, entry_type, rename_plan.chains) as run_journal:
+        return _apply(rename_plan, entry_type, workers, run_journal, len(rename_plan.skipped))
+
+
+def _preview_rename(workbook, entry_dir, entry_type, entries, suffix, workers) -> Outcome:
+    """
+    Prints what rename would do: a diff of the names, the skipped rows
+    with their reason, the counts and how long each phase took. The apply
+    time is estimated from the latency of looking up the first sources.
+    """
+    timings = {}
+    with _timed(timings, "load"):
+        rows = list(workbook)
+    with _timed(timings, "plan"):
+        rename_plan = planner.plan(rows, entries, entry_dir, entry_type=entry_type, suffix=suffix)
+    moves = rename_plan.moves
+    with _timed(timings, "probe"):
+        probed = _probe(rename_plan.path(move.source) for move in moves[:PROBE])
+    if probed:
+        timings["apply (estimate)"] = timings["probe"] / probed * len(moves) / max(workers or 1, 1)
+
+    print(Strings.dry_run_header)
+    temps = {}  # A cycle shows as the renames, not the temporary name
+    for move in moves:
+        if move.temp:
+            temps[move.target] = move.source
+        else:
+            print(Strings.dry_run_rename.format(old=temps.pop(move.source, move.source), new=move.target))
+    for skip in rename_plan.skipped:
+        print(Strings.dry_run_skip.format(old=skip.name, new=skip.target, reason=REASONS[skip.conflict]))
+    print(Strings.dry_run_counts.format(done=len(rename_plan), action="rename", skipped=len(rename_plan.skipped),
+                                        steps=len(moves), rows=len(rows)))
+    _print_timings(timings)
+    return Outcome(len(rename_plan), len(rename_plan.skipped), 0)
+
+
+def resume(journal_path: str, workers: int = None) -> Outcome:
+    """
+    Finishes an interrupted rename from its journal, without a rescan: only
+    the moves without a done marker are looked at.
+
+    Args:
+        journal_path (str):     The journal of the interrupted run.
+        workers (int):          The renames to run at once (None = one at a time).
+    Returns:
+        Outcome:                The number of renamed, skipped and failed moves.
+    """
+    print()
+    contents = journal.read(journal_path)
+    chains = {}
+    for operation in contents.operations:
+        move = planner.Move(operation.source, operation.target, operation.temp)
+        chains.setdefault(operation.chain, []).append((operation.seq, move))
+    with journal.Journal(journal_path, marker="D") as run_journal:
+        return _replay(contents, chains.values(), contents.done, run_journal, workers)
+
+
+def undo(journal_path: str, workers: int = None) -> Outcome:
+    """
+    Reverts the done moves of a journal, last move first. Undoing is
+    journalled too, so an interrupted undo can simply be run again.
+
+    Args:
+        journal_path (str):     The journal of the run to revert.
+        workers (int):          The renames to run at once (None = one at a time).
+    Returns:
+        Outcome:                The number of renamed, skipped and failed moves.
+    """
+    print()
+    contents = journal.read(journal_path)
+    chains = {}
+    for operation in reversed(contents.operations):
+        if operation.seq in contents.done:
+            move = planner.Move(operation.target, operation.source, operation.temp)
+            chains.setdefault(operation.chain, []).append((operation.seq, move))
+    with journal.Journal(journal_path, marker="U") as run_journal:
+        return _replay(contents, chains.values(), contents.undone, run_journal, workers)
+
+
+def _replay(contents: journal.Contents, chains, marked: set, run_journal: journal.Journal, workers: int) -> Outcome:
+    """
+    Runs journalled chains again from where they stopped. The moves that
+    ran before their marker reached the disk are marked without renaming.
+    A chain whose next name is taken is left alone, as renaming would
+    overwrite it.
+    """
+    rename_plan = planner.Plan(contents.dir)
+    skipped = 0
+    for chain in chains:
+        for seq, move in chain:
+            run_journal.track(move, seq)
+        moves = [move for _, move in chain]
+        start = 0
+        while start < len(moves) and chain[start][0] in marked:
+            start += 1
+        ran = _progress(rename_plan, moves, start)
+        for move in moves[start:ran]:
+            run_journal.mark(move)
+        moves = moves[ran:]
+        if moves and os.path.lexists(rename_plan.path(moves[0].target)):
+            for move in moves:
+                print(_skip_message(planner.Skip(move.source, move.target, Conflict.EXISTS), contents.entry_type))
+            skipped += len(moves)
+        elif moves:
+            rename_plan.chains.append(moves)
+    return _apply(rename_plan, contents.entry_type, workers, run_journal, skipped)
+
+
+def _progress(rename_plan: planner.Plan, moves: list, marked: int) -> int:
+    """
+    Returns how many moves of a journalled chain have run, of which the
+    first marked ones are known to. Each move frees the source of the one
+    before it, so once a chain has started, only the source of its last
+    move that ran is missing: the chain is read from its end. A cycle
+    without its temporary name has either not started or finished; the
+    marker of its first move is synced before the next one runs, which
+    tells the two apart.
+    """
+    def exists(name: str) -> bool:
+        return os.path.lexists(rename_plan.path(name))
+
+    if _is_cycle(moves) and not exists(moves[0].target):
+        return len(moves) if marked else 0
+    for index in range(len(moves) - 1, marked - 1, -1):
+        if not exists(moves[index].source) and exists(moves[index].target):
+            return index + 1
+    return marked
 
-    match entry_type:
-        case Type.FILE:
-            rename_col = 5  # rename is at 5th col
-        case Type.FOLDER:
-            rename_col = 3  # rename is at 3rd col
-        case _:
-            rename_col = 0
-    list_dict = {entry.name: entry.dir for entry in entries}
-
-    for row in workbook:
-        name = row[0]
-        renamed_entry = row[rename_col]
-        if name in list_dict.keys():
-            try:
-
-                if renamed_entry is not None:
-                    old_dir = list_dict.get(name)
-                    new_dir = os.path.join(entry_dir, str(renamed_entry))
-
-                    if entry_type == Type.FILE and os.path.isfile(new_dir):
-                        print(Strings.err_file_exists.format(name=renamed_entry))
-                    elif entry_type == Type.FOLDER and os.path.isdir(new_dir):
-                        print(Strings.err_folder_exists.format(name=renamed_entry))
-                    else:
-                        os.rename(old_dir, new_dir)
-                        rename_count += 1
-            except FileNotFoundError:
-                print(Strings.err_dir_not_found.format(dir=entry_dir))
-            except FileExistsError:
-                print(Strings.err_dir_already_exists.format(dir=entry_dir))
-            except PermissionError:
-                print(Strings.err_permission_denied.format(dir=entry_dir))
-            except OSError as e:
-                print(Strings.err_occurred.format(err=e))
+
+def _is_cycle(moves: list) -> bool:
+    """
+    Returns:
+        bool:   The chain goes through a temporary name: its last move is out of the name its first took.
+    """
+    return len(moves) > 1 and moves[0].target == moves[-1].source
+
+
+def _apply(rename_plan: planner.Plan, entry_type: Type, workers: int, run_journal, skipped: int) -> Outcome:
+    """
+    Runs the chains of a plan and prints the messages and the summary.
+    """
+    rename_count = 0
+    failed = 0
+    rename_chain = partial(_rename_chain, rename_plan, entry_type, run_journal)
+    for done, chain_failed, messages in _run(rename_chain, rename_plan.chains, workers):
+        for message in messages:
+            print(message)
+        rename_count += done
+        failed += chain_failed
     entry_type = "File(s)" if entry_type == Type.FILE else "Folder(s)"
     print(Strings.result_renaming_successful.format(num=rename_count, type=entry_type))
+    return Outcome(rename_count, skipped, failed)
 
 
-def create(workbook: Workbook,
-           input_dir: str):
+def _rename_chain(rename_plan: planner.Plan, entry_type: Type, run_journal, chain: list) -> tuple:
+    """
+    Renames the moves of one chain in order. Messages are returned rather
+    than printed, so the output of chains running at once does not mix.
+    """
+    entry_dir = rename_plan.dir
+    done = 0
+    failed = 0
+    messages = []
+    stuck = set()  # Names still taken after a failed rename
+    cycle = _is_cycle(chain)
+    for move in chain:
+        if move.target.casefold() in stuck:
+            messages.append(_skip_message(planner.Skip(move.source, move.target, Conflict.EXISTS), entry_type))
+            stuck.add(move.source.casefold())
+            failed += 1
+            continue
+        try:
+            os.rename(rename_plan.path(move.source), rename_plan.path(move.target))
+            if run_journal is not None:
+                run_journal.mark(move, sync=cycle and move is chain[0])
+            done += not move.temp
+            continue
+        except FileNotFoundError:
+            messages.append(Strings.err_dir_not_found.format(dir=entry_dir))
+        except FileExistsError:
+            messages.append(Strings.err_dir_already_exists.format(dir=entry_dir))
+        except PermissionError:
+            messages.append(Strings.err_permission_denied.format(dir=entry_dir))
+        except OSError as e:
+            messages.append(Strings.err_occurred.format(err=e))
+        stuck.add(move.source.casefold())
+        failed += 1
+    return done, failed, messages
+
+
+def _skip_message(skip: planner.Skip, entry_type: Type) -> str:
+    match skip.conflict:
+        case Conflict.DUPLICATE:
+            return Strings.err_name_taken.format(name=skip.target)
+        case Conflict.CASE:
+            return Strings.err_name_case.format(name=skip.target)
+    if entry_type == Type.FILE:
+        return Strings.err_file_exists.format(name=skip.target)
+    return Strings.err_folder_exists.format(name=skip.target)
+
+
+def create(workbook: Iterable[tuple],
+           input_dir: str,
+           workers: int = None,
+           dry_run: bool = False) -> Outcome:
     """
     This action executes create after the user saves the changes.
 
+    The names are normalized and deduped first, so a repeated name costs
+    nothing, and a path such as "2024/Q1/invoices" creates its missing
+    parents, each shared parent once. A name with braces is a template,
+    such as "Client_{001..500}/{raw,processed,export}"; it is expanded one
+    path at a time as the folders are created, so memory stays the same
+    for a million folders. With workers, folders are created at the same
+    time, each after its parent. A dry run prints the folders that would
+    be created instead.
+
     Args:
-        workbook (Workbook):    The spreadsheet object.
+        workbook (Iterable):    The (name,) rows loaded from the spreadsheet.
         input_dir (str):        The user defined directory of files and folders.
+        workers (int):          The folders to create at once (None = one at a time).
+        dry_run (bool):         Only print the plan, counts and timings.
     Returns:
-        None
+        Outcome:                The number of created, existing and failed folders.
     """
     print()
-    create_count = 0
-    for row in workbook:
-        folder_name = row[0]  # name column
-        if folder_name is not None:
-            folder_path = os.path.join(input_dir, folder_name)
-            try:
-                os.mkdir(folder_path)
-                create_count += 1
-            except FileExistsError:
-                print(Strings.err_folder_exists.format(name=folder_name))
-            except PermissionError:
-                print(Strings.err_permission_denied.format(dir=folder_name))
-            except OSError as e:
-                print(Strings.err_occurred.format(err=e))
-    print(Strings.result_creating_successful.format(num=create_count))
+    if dry_run:
+        return _preview_create(workbook, input_dir)
+    counts = Counter()
+
+    def invalid(name):
+        print(Strings.err_invalid_folder.format(name=name))
+        counts["failed"] += 1
+
+    failed = set()  # Only the folders that could not be created
+    mkdir = partial(_mkdir, input_dir)
+    workers = max(workers or 1, 1)
+    with ThreadPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as pool:
+        pending = deque()  # Futures in the order of the folders, so the messages are too
+        in_flight = set()
+
+        def finish():
+            parts, result, message = pending.popleft().result()
+            in_flight.discard(parts)
+            if result == "failed":
+                failed.add(parts)
+            if message:
+                print(message)
+            counts[result] += 1
+
+        for parts, requested in _folders(workbook, invalid):
+            while pending and (parts[:-1] in in_flight or len(pending) >= 2 * workers):
+                finish()  # The parent first, and only a few folders at a time
+            if parts[:-1] in failed:  # No syscall for what can not work
+                failed.add(parts)
+                counts["failed"] += 1
+                print(Strings.err_parent_failed.format(name=os.path.join(*parts)))
+                continue
+            if pool is None:
+                pending.append(_Done(mkdir((parts, requested))))
+            else:
+                pending.append(pool.submit(mkdir, (parts, requested)))
+                in_flight.add(parts)
+            while pending and pending[0].done():
+                finish()
+        while pending:
+            finish()
+    print(Strings.result_creating_summary.format(created=counts["done"],
+                                                 existing=counts["existing"],
+                                                 failed=counts["failed"]))
+    return Outcome(counts["done"], counts["existing"], counts["failed"])
+
+
+def _folders(workbook: Iterable[tuple], invalid) -> Iterator[tuple[tuple, bool]]:
+    """
+    Streams the (parts, requested) folders to create for the rows, parents
+    first: the sorted and deduped names, then each template as it expands.
+    """
+    templates = []
+
+    def names():
+        for row in workbook:
+            name = row[0]  # name column
+            if template.is_template(name):
+                templates.append(name)
+            else:
+                yield name
+
+    folder_plan = planner.plan_folders(names())
+    for name in folder_plan.invalid:
+        invalid(name)
+    yield from planner.walk_folders(folder_plan.paths)
+    for text in templates:
+        yield from planner.walk_folders(_template_paths(text, invalid))
+
+
+def _template_paths(text: str, invalid) -> Iterator[tuple]:
+    for path in template.expand(text):
+        parts = planner.folder_parts(path)
+        if parts is None:
+            invalid(path)
+        elif parts:
+            yield parts
+
+
+def _preview_create(workbook, input_dir) -> Outcome:
+    """
+    Prints the folders create would make, the ones that exist, the counts
+    and how long each phase took. Templates are expanded as they are
+    printed, so the plan phase includes the lookups.
+    """
+    timings = {}
+    with _timed(timings, "load"):
+        rows = list(workbook)
+
+    print(Strings.dry_run_header)
+    counts = Counter()
+
+    def invalid(name):
+        print(Strings.dry_run_skip.format(old=name, new=name, reason=Strings.reason_invalid))
+        counts["invalid"] += 1
+
+    with _timed(timings, "plan"):
+        for parts, requested in _folders(rows, invalid):
+            name = os.path.join(*parts)
+            if not os.path.lexists(os.path.join(input_dir, name)):
+                print(Strings.dry_run_create.format(name=name))
+                counts["created"] += 1
+            elif requested:
+                print(Strings.dry_run_skip.format(old=name, new=name, reason=Strings.reason_exists))
+                counts["existing"] += 1
+    print(Strings.dry_run_counts.format(done=counts["created"], action="create",
+                                        skipped=counts["existing"] + counts["invalid"],
+                                        steps=counts["created"], rows=len(rows)))
+    _print_timings(timings)
+    return Outcome(counts["created"], counts["existing"], counts["invalid"])
+
+
+class _Done:
+    """
+    A finished result that looks like a future, for the work done without a pool.
+    """
+
+    def __init__(self, result):
+        self._result = result
+
+    def done(self) -> bool:
+        return True
+
+    def result(self):
+        return self._result
+
+
+@contextmanager
+def _timed(timings: dict, phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - start
+
+
+def _probe(paths) -> int:
+    """
+    Looks the paths up without changing anything; returns how many.
+    """
+    count = 0
+    for path in paths:
+        os.path.lexists(path)
+        count += 1
+    return count
+
+
+def _print_timings(timings: dict) -> None:
+    for phase, seconds in timings.items():
+        print(Strings.dry_run_timing.format(phase=phase, seconds=seconds))
+    print()
+
+
+def _mkdir(input_dir: str, folder: tuple) -> tuple:
+    """
+    Creates one folder. A parent that exists is fine; only a requested
+    folder that exists is reported.
+    """
+    parts, requested = folder
+    folder_name = os.path.join(*parts)
+    try:
+        os.mkdir(os.path.join(input_dir, folder_name))
+        return parts, "done", None
+    except FileExistsError:
+        if not os.path.isdir(os.path.join(input_dir, folder_name)):  # A file of that name
+            return parts, "failed", Strings.err_file_exists.format(name=folder_name)
+        if not requested:
+            return parts, "parent", None
+        return parts, "existing", Strings.err_folder_exists.format(name=folder_name)
+    except PermissionError:
+        return parts, "failed", Strings.err_permission_denied.format(dir=folder_name)
+    except OSError as e:
+        return parts, "failed", Strings.err_occurred.format(err=e)
+
+
+def _run(function, items: Iterable, workers: int = None):
+    """
+    Calls the function on every item, on a bounded pool of threads when
+    there are workers. Results come back in the order of the items.
+    """
+    if not workers or workers < 2:
+        yield from map(function, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(function, items)
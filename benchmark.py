@@ -0,0 +1,423 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+import entry
+from utils import Type
+
+
+def legacy_get_entries(type, dir):
+    """
+    The former listdir + isfile/isdir + getctime/getmtime/getsize scan.
+    Kept here only as a reference point for the benchmarks.
+    """
+    entries = []
+    for name in os.listdir(dir):
+        if name.startswith("."):
+            continue
+        _dir = os.path.join(dir, name)
+        match type:
+            case Type.FILE:
+                if os.path.isfile(_dir):
+                    entries.append((name,
+                                    os.path.getctime(_dir),
+                                    os.path.getmtime(_dir),
+                                    os.path.getsize(_dir)))
+            case Type.FOLDER:
+                if os.path.isdir(_dir):
+                    entries.append((name,
+                                    os.path.getctime(_dir),
+                                    os.path.getmtime(_dir),
+                                    os.path.getsize(_dir),
+                                    len(os.listdir(_dir))))
+    return sorted(entries)
+
+
+class SyscallCounter:
+    """
+    Counts the os.stat/os.listdir/os.scandir calls made from Python code.
+
+    DirEntry.stat() runs in C and is not visible here: it costs one stat per
+    entry on POSIX (zero on Windows, where FindNextFile already returned it).
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self._originals = {}
+
+    def __enter__(self):
+        for name in ("stat", "lstat", "listdir", "scandir"):
+            original = getattr(os, name)
+            self._originals[name] = original
+            setattr(os, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._originals.items():
+            setattr(os, name, original)
+
+    def _wrap(self, name, original):
+        def wrapper(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return original(*args, **kwargs)
+        return wrapper
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+def populate(dir, files, folders=0):
+    for i in range(files):
+        with open(os.path.join(dir, f"file_{i:07d}.txt"), "w") as f:
+            f.write("x" * (i % 100))
+    for i in range(folders):
+        os.mkdir(os.path.join(dir, f"folder_{i:07d}"))
+
+
+def bench_scan(files=20000, folders=0):
+    """
+    Compares the legacy scan with entry.get_entries: wall time and syscalls.
+    """
+    with tempfile.TemporaryDirectory() as dir:
+        populate(dir, files, folders)
+        entry_type = Type.FOLDER if folders else Type.FILE
+        count = folders or files
+
+        with SyscallCounter() as legacy:
+            start = time.perf_counter()
+            legacy_get_entries(entry_type, dir)
+            legacy_time = time.perf_counter() - start
+
+        with SyscallCounter() as scan:
+            start = time.perf_counter()
+            entry.get_entries(entry_type, dir)
+            scan_time = time.perf_counter() - start
+        scan_total = scan.total() + (count if os.name != "nt" else 0)  # DirEntry.stat()
+
+        print(f"scan {count} {entry_type.value.lower()}s")
+        print(f"  legacy:  {legacy_time:8.3f}s  {legacy.total():8d} syscalls  {legacy.counts}")
+        print(f"  scandir: {scan_time:8.3f}s  {scan_total:8d} syscalls  {scan.counts} + DirEntry.stat()")
+        print(f"  saved:   {legacy.total() - scan_total} syscalls "
+              f"({(legacy.total() - scan_total) / count:.1f} per entry)")
+
+
+def bench_workers(files=2000, latency=0.002, workers=16):
+    """
+    Simulates a network mount by adding latency to every stat, then compares
+    the sequential scan with the thread-pooled one.
+    """
+    original = entry._stat
+
+    def slow_stat(dir_entry):
+        time.sleep(latency)  # One round-trip
+        return original(dir_entry)
+
+    with tempfile.TemporaryDirectory() as dir:
+        populate(dir, files)
+        entry._stat = slow_stat
+        try:
+            start = time.perf_counter()
+            entry.get_entries(Type.FILE, dir)
+            sequential_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            entry.get_entries(Type.FILE, dir, workers=workers)
+            pooled_time = time.perf_counter() - start
+        finally:
+            entry._stat = original
+
+    print(f"stat {files} files at {latency * 1000:.0f} ms per round-trip")
+    print(f"  sequential: {sequential_time:8.3f}s")
+    print(f"  {workers:2d} workers: {pooled_time:8.3f}s  ({sequential_time / pooled_time:.1f}x)")
+
+
+def bench_actions(files=2000, latency=0.002, workers=16):
+    """
+    Simulates a network share by adding latency to every rename, then
+    compares action.rename one at a time with the worker pool.
+    """
+    import action
+
+    original = os.rename
+
+    def slow_rename(source, target):
+        time.sleep(latency)  # One round-trip
+        original(source, target)
+
+    with tempfile.TemporaryDirectory() as dir, open(os.devnull, "w") as devnull:
+        populate(dir, files)
+        timings = []
+        os.rename = slow_rename
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            for prefix, pool in (("a_", None), ("b_", workers)):
+                entries = entry.get_entries(Type.FILE, dir)
+                rows = [(name, prefix + name) for name in entries.names]
+                start = time.perf_counter()
+                action.rename(rows, dir, Type.FILE, entries, workers=pool)
+                timings.append(time.perf_counter() - start)
+        finally:
+            os.rename = original
+            sys.stdout = stdout
+
+    print(f"rename {files} files at {latency * 1000:.0f} ms per round-trip")
+    print(f"  sequential: {timings[0]:8.3f}s")
+    print(f"  {workers:2d} workers: {timings[1]:8.3f}s  ({timings[0] / timings[1]:.1f}x)")
+
+
+def bench_template(text="Client_{000001..100000}/{raw,processed,export}"):
+    """
+    Expands a template to hundreds of thousands of folder paths, as
+    action.create does but without creating them, and shows that the
+    memory does not grow.
+    """
+    import action
+    import planner
+    import template
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    folders = sum(1 for _ in planner.walk_folders(action._template_paths(text, print)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"template {text}")
+    print(f"  {template.count(text)} paths, {folders} folders: {elapsed:8.3f}s  peak {peak / 2 ** 10:.0f} KiB")
+
+
+def synthetic_table(rows, kind=entry.KIND_FILE):
+    """
+    Builds an EntryTable without touching the disk, for the sheet benchmarks.
+    """
+    table = entry.EntryTable(tempfile.gettempdir())
+    table.file_counts = array("q", [0]) * rows  # Folder counts are not on disk either
+    now = time.time()
+    for i in range(rows):
+        stat = os.stat_result((0o100644, i, 0, 1, 0, 0, i * 37, now, now - i, now - 2 * i))
+        table.append(f"file_{i:07d}.txt", kind, stat)
+    return table
+
+
+def bench_index(dirs=500, files=200):
+    """
+    Fills an index with synthetic directories, then times a listing and a
+    filtered query across all of them, and a rescan that changed nothing.
+    """
+    import index
+
+    with tempfile.TemporaryDirectory() as tmp, index.Index(os.path.join(tmp, "index.sqlite3")) as entry_index:
+        table = synthetic_table(files)
+        start = time.perf_counter()
+        for i in range(dirs):
+            table.dir = os.path.join(tmp, f"client_{i:05d}")
+            entry_index.update(Type.FILE, table)
+        timings = {"update": time.perf_counter() - start}
+        start = time.perf_counter()
+        entry_index.update(Type.FILE, table)
+        timings["update unchanged"] = time.perf_counter() - start
+        start = time.perf_counter()
+        listed = entry_index.entries(Type.FILE, table.dir)
+        timings["list one dir"] = time.perf_counter() - start
+        start = time.perf_counter()
+        found = entry_index.query(ext=".txt", min_size=files * 37 // 2, modified_after=time.time() - files)
+        timings["query"] = time.perf_counter() - start
+    print(f"index {dirs} dirs x {files} files, {len(listed)} listed, {len(found)} found")
+    for phase, seconds in timings.items():
+        print(f"  {phase:<18}{seconds * 1000:10.1f} ms")
+
+
+def bench_classify(files=20000):
+    """
+    Classifies a directory by content twice: the first run reads the head
+    of every file through the thread pool, the second is served by the
+    (inode, mtime) cache.
+    """
+    import classify
+
+    with tempfile.TemporaryDirectory() as dir, tempfile.TemporaryDirectory() as cache:
+        populate(dir, files)
+        entries = entry.get_entries(Type.FILE, dir)
+        print(f"classify {files} files")
+        for run in ("cold", "cached"):
+            start = time.perf_counter()
+            classify.Classifier(sniff=True, cache_dir=cache).classify(entries)
+            print(f"  {run:<8}{time.perf_counter() - start:8.3f}s")
+
+
+def bench_duplicates(files=20000, copies=200):
+    """
+    Finds the duplicates of a directory twice: the first run hashes the
+    ends of the many small files of a shared size and the large files
+    whole, the second is served by the (inode, mtime, size) cache.
+    """
+    import duplicates
+
+    with tempfile.TemporaryDirectory() as dir, tempfile.TemporaryDirectory() as cache:
+        populate(dir, files)
+        for number in range(copies):
+            with open(os.path.join(dir, f"copy_{number:05d}.bin"), "wb") as f:
+                f.write(bytes(256 * 1024) + number.to_bytes(4, "big") + bytes(256 * 1024))  # Same ends
+        entries = entry.get_entries(Type.FILE, dir)
+        print(f"duplicates {files} files + {copies} of the same size")
+        for run in ("cold", "cached"):
+            start = time.perf_counter()
+            found = sum(1 for cell in duplicates.Duplicates(cache_dir=cache).find(entries) if cell)
+            print(f"  {run:<8}{time.perf_counter() - start:8.3f}s  {found} duplicates")
+
+
+def bench_rules(rows=100000):
+    """
+    Computes the new names of a synthetic table with a chain of rules,
+    the step that replaces editing the sheet by hand.
+    """
+    import rules
+
+    table = synthetic_table(rows)
+    chain = rules.Rules([rules.Regex(r"^file_", "doc-"),
+                         rules.Extension(".md", old=".txt"),
+                         rules.DatePrefix(),
+                         rules.Sequence(by="date_modified")])
+    start = time.perf_counter()
+    renamed = sum(1 for _ in chain.rows(table))
+    elapsed = time.perf_counter() - start
+    print(f"rules {rows} rows, {renamed} renamed: {elapsed:8.3f}s")
+
+
+SHEET_TARGET = 100000  # Rows per second Sheet.rename should write
+
+
+def bench_sheet(rows=100000, runs=3):
+    """
+    Measures Sheet.rename throughput for each writer, best of a few runs,
+    then its peak Python memory in one more run (tracemalloc slows
+    everything down, so it is kept out of the timing). The target is
+    SHEET_TARGET rows per second.
+    """
+    from sheet import Sheet
+    from utils import Format
+
+    table = synthetic_table(rows)
+    headers = entry.header_rename(Type.FILE)
+    print(f"sheet {rows} rows")
+    with tempfile.TemporaryDirectory() as dir:
+        for format in (Format.XLSX, Format.ODS):
+            sheet = Sheet(format)
+            sheet.filepath, sheet.filename = dir, os.path.join(dir, f"bench.{format.value}")
+            elapsed = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                sheet.rename(input_dir=table.dir, entries=table, headers=headers)
+                elapsed.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            sheet.rename(input_dir=table.dir, entries=table, headers=headers)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            speed = rows / min(elapsed)
+            verdict = "meets" if speed >= SHEET_TARGET else "below"
+            print(f"  {format.value}: {min(elapsed):8.3f}s  {speed:10.0f} rows/s  peak {peak / 2 ** 20:.1f} MiB"
+                  f"  {verdict} the {SHEET_TARGET} rows/s target")
+
+
+def bench_styles(rows=100000):
+    """
+    Times writing the rename sheet of a 100k-entry table, before and after
+    the style registry: the baseline builds the sheet as the repo first did,
+    an openpyxl cell at a time with Font/Alignment/Border objects of its
+    own, and Sheet.rename streams the rows with the registry styles.
+    """
+    import openpyxl
+    from openpyxl.styles import Alignment, Border, Font, Side
+    from sheet import Sheet, font
+    from utils import Colors
+
+    def baseline(filename, headers):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        border = Border(left=Side(style="thin", color=Colors.gray_light),
+                        right=Side(style="thin", color=Colors.gray_light),
+                        top=Side(style="thin", color=Colors.gray_light),
+                        bottom=Side(style="thin", color=Colors.gray_light))
+        for col, header in enumerate(headers, start=1):
+            sheet.cell(row=2, column=col).value = header
+        for row, values in enumerate(entry.format_rows(table), start=3):
+            for col, value in enumerate(values, start=1):
+                if col == 1:
+                    font_color, horizontal = Colors.gray_dark, "left"
+                elif col == len(headers):
+                    font_color, horizontal = Colors.purple, "left"
+                else:
+                    font_color, horizontal = Colors.gray_dark_medium, "right"
+                cell = sheet.cell(row=row, column=col)
+                cell.value = value
+                cell.font = Font(name=font, color=font_color)
+                cell.alignment = Alignment(horizontal=horizontal, vertical="center")
+                cell.border = border
+                cell.number_format = "@"
+        workbook.save(filename)
+
+    table = synthetic_table(rows)
+    headers = entry.header_rename(Type.FILE)
+    with tempfile.TemporaryDirectory() as dir:
+        start = time.perf_counter()
+        baseline(os.path.join(dir, "baseline.xlsx"), headers)
+        before = time.perf_counter() - start
+
+        sheet = Sheet()
+        sheet.filepath, sheet.filename = dir, os.path.join(dir, "registry.xlsx")
+        start = time.perf_counter()
+        sheet.rename(input_dir=table.dir, entries=table, headers=headers)
+        after = time.perf_counter() - start
+
+    print(f"rename sheet of {rows} rows")
+    print(f"  per-cell styles (baseline): {before:8.3f}s")
+    print(f"  style registry:             {after:8.3f}s  {before / after:.0f}x faster")
+
+
+STARTUP_BUDGET = 0.050  # Seconds from the interpreter start to the first prompt
+
+
+def bench_startup(runs=10):
+    """
+    Times the start of the program up to the first prompt: the import of
+    project, measured by python -X importtime, and the whole interpreter
+    run. The best of a few runs is taken, as the first one fills the disk
+    cache.
+    """
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    imports, wall = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import project"],
+                                cwd=here, capture_output=True, text=True, check=True)
+        wall.append(time.perf_counter() - start)
+        line = [line for line in result.stderr.splitlines() if line.endswith("| project")][-1]
+        imports.append(int(line.split("|")[1]) / 1e6)  # Cumulative microseconds
+    verdict = "within" if min(wall) <= STARTUP_BUDGET else "over"
+    print(f"startup, best of {runs}")
+    print(f"  import project: {min(imports) * 1000:8.1f} ms")
+    print(f"  interpreter:    {min(wall) * 1000:8.1f} ms  {verdict} the {STARTUP_BUDGET * 1000:.0f} ms budget")
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bench_startup()
+    bench_scan(files=files)
+    bench_workers()
+    bench_actions()
+    bench_sheet()
+    bench_styles()
+    bench_template()
+    bench_index()
+    bench_rules()
+    bench_classify()
+    bench_duplicates()
+
+
+if __name__ == "__main__":
+    main()
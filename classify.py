@@ -0,0 +1,138 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+
+from entry import KIND_FOLDER, cache_key
+from utils import WORKERS, Strings, cache_path, file_extensions, load_cache, read_ends, save_cache, suffix_type
+
+SNIFF_BYTES = 512  # Read from the start of a file; the tar magic sits at 257
+VERSION = 1
+
+# (offset, magic bytes, type), first match wins
+_MAGIC = [
+    (0, b"%PDF-", file_extensions[".pdf"]),
+    (0, b"\x89PNG\r\n\x1a\n", file_extensions[".png"]),
+    (0, b"\xff\xd8\xff", file_extensions[".jpg"]),
+    (0, b"GIF87a", file_extensions[".gif"]),
+    (0, b"GIF89a", file_extensions[".gif"]),
+    (0, b"BM", file_extensions[".bmp"]),
+    (0, b"II*\x00", file_extensions[".tif"]),
+    (0, b"MM\x00*", file_extensions[".tif"]),
+    (0, b"8BPS", file_extensions[".psd"]),
+    (0, b"\x00\x00\x01\x00", file_extensions[".ico"]),
+    (0, b"AT&TFORM", file_extensions[".djvu"]),
+    (8, b"WEBP", file_extensions[".webp"]),
+    (8, b"WAVE", file_extensions[".wav"]),
+    (8, b"AVI ", file_extensions[".avi"]),
+    (0, b"ID3", file_extensions[".mp3"]),
+    (0, b"fLaC", file_extensions[".flac"]),
+    (4, b"ftypqt", file_extensions[".mov"]),
+    (4, b"ftyp", file_extensions[".mp4"]),
+    (0, b"\x1a\x45\xdf\xa3", file_extensions[".mkv"]),
+    (0, b"FLV\x01", file_extensions[".flv"]),
+    (0, b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", file_extensions[".wmv"]),
+    (0, b"{\\rtf", file_extensions[".rtf"]),
+    (0, b"SQLite format 3\x00", file_extensions[".sqlite"]),
+    (0, b"MZ", file_extensions[".exe"]),
+    (0, b"wOFF", file_extensions[".woff"]),
+    (0, b"wOF2", file_extensions[".woff2"]),
+    (0, b"OTTO", file_extensions[".otf"]),
+    (0, b"\x00\x01\x00\x00\x00", file_extensions[".ttf"]),
+    (60, b"BOOKMOBI", file_extensions[".mobi"]),
+    (0, b"\x1f\x8b", file_extensions[".gz"]),
+    (0, b"7z\xbc\xaf\x27\x1c", file_extensions[".7z"]),
+    (0, b"Rar!\x1a\x07", file_extensions[".rar"]),
+    (257, b"ustar", file_extensions[".tar"]),
+    (30, b"mimetypeapplication/epub+zip", file_extensions[".epub"]),
+    (30, b"mimetypeapplication/vnd.oasis.opendocument.text", file_extensions[".odt"]),
+    (30, b"mimetypeapplication/vnd.oasis.opendocument.spreadsheet", file_extensions[".ods"]),
+    (30, b"mimetypeapplication/vnd.oasis.opendocument.presentation", file_extensions[".odp"]),
+    (0, b"PK\x03\x04", file_extensions[".zip"]),
+]
+
+# Where a known extension tells more than the magic: zip and gzip files are
+# the inside of many formats, and two bytes also start many text files
+_WEAK = {file_extensions[".zip"]} | {file_type for _, magic, file_type in _MAGIC if len(magic) < 3}
+
+
+class Classifier:
+    """
+    Tells the type of files from their names and, if asked, their contents.
+
+    Compound suffixes such as ".tar.gz" match, in any case. With sniffing,
+    the first SNIFF_BYTES of each file are read, many files at a time, and
+    matched against known magic bytes, so a file without an extension, or
+    with the wrong one, still gets its type. What a file holds is cached by
+    its (inode, mtime) per directory, so classifying an unchanged directory
+    again reads no file.
+    """
+
+    def __init__(self, sniff: bool = False, workers: int = WORKERS, cache_dir: str = None):
+        self.sniff = sniff
+        self.workers = workers
+        self.cache_dir = cache_dir or cache_path("types")
+
+    def classify(self, entries) -> list[str]:
+        """
+        Sets the type of each file of the table, which the sheet rows then show.
+
+        Args:
+            entries (EntryTable):   The entries of a scan.
+        Returns:
+            list:                   The type of each row, "" for folders.
+        """
+        magic = self._sniff(entries) if self.sniff else {}
+        types = []
+        for index, name in enumerate(entries.names):
+            if entries.kinds[index] == KIND_FOLDER:
+                types.append("")
+                continue
+            by_name = suffix_type(name)
+            by_content = magic.get((entries.inodes[index], entries.mtimes[index]))
+            if by_content and not (by_name and by_content in _WEAK):
+                types.append(by_content)
+            else:
+                types.append(by_name or Strings.document_file)
+        entries.types = types
+        return types
+
+    def _sniff(self, entries) -> dict:
+        """
+        Returns:
+            dict:   The type the contents tell, or None, keyed by (inode, mtime) of each file.
+        """
+        path = self._path(entries)
+        cache = load_cache(path, VERSION) or {}
+        keys = {}
+        for index, kind in enumerate(entries.kinds):
+            if kind != KIND_FOLDER:
+                keys.setdefault((entries.inodes[index], entries.mtimes[index]), index)
+        missing = [key for key in keys if key not in cache]
+        if missing:
+            paths = [entries.path(keys[key]) for key in missing]
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for key, head in zip(missing, pool.map(read_ends, paths, repeat(SNIFF_BYTES))):
+                    if head is not None:  # A file that could not be read is tried again next time
+                        cache[key] = magic_type(head)
+        known = {key: cache[key] for key in keys if key in cache}
+        if len(known) != len(cache) or any(key in known for key in missing):
+            save_cache(path, known, VERSION)  # Files gone from the directory are dropped
+        return known
+
+    def _path(self, entries) -> str:
+        return os.path.join(self.cache_dir, cache_key(entries) + ".types")
+
+
+def magic_type(head: bytes | None) -> str | None:
+    """
+    Returns:
+        str:    The type the first bytes of a file tell, or None.
+    """
+    if not head:
+        return None
+    for offset, magic, file_type in _MAGIC:
+        if head.startswith(magic, offset):
+            return file_type
+    return None
+
@@ -0,0 +1,63 @@
+import csv
+
+
+class CsvWriter:
+    """
+    A row-at-a-time CSV writer with the same interface as XlsxWriter.
+
+    Plain text is the fastest format to write and to parse, so layout and
+    styles are accepted and ignored. The file is UTF-8 with a BOM, which
+    Excel needs to detect the encoding.
+    """
+    delimiter = ","
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", newline="", encoding="utf-8-sig")
+        self._writer = csv.writer(self._file, delimiter=self.delimiter)
+
+    def style(self, cell_style) -> int:
+        return 0
+
+    def styles(self, registry: dict) -> dict:
+        return {role: 0 for role in registry}
+
+    def add_sheet(self, title: str, widths=(), merged=()) -> None:
+        pass  # A single table per file
+
+    def append(self, values, styles, height=None) -> None:
+        self._writer.writerow(["" if value is None else value for value in values])
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TsvWriter(CsvWriter):
+    delimiter = "\t"
+
+
+def read_rows(path: str, min_row: int = 1, max_col: int = None, delimiter: str = ","):
+    """
+    Streams the value rows of a CSV or TSV file.
+
+    Args:
+        path (str):         The file.
+        min_row (int):      The first row to return, starting at 1.
+        max_col (int):      The number of columns to return (None = all).
+        delimiter (str):    "," or a tab.
+    Returns:
+        Generator:          Tuples padded to max_col, with None for empty cells.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        for row_idx, row in enumerate(csv.reader(file, delimiter=delimiter), start=1):
+            if row_idx < min_row:
+                continue
+            if max_col is not None:
+                row = row[:max_col] + [""] * (max_col - len(row))
+            yield tuple(value if value != "" else None for value in row)
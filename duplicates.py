@@ -0,0 +1,146 @@
+import hashlib
+import os
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from entry import EntryTable, Folder, KIND_FOLDER, cache_key
+from utils import WORKERS, Strings, cache_path, load_cache, read_ends, save_cache
+
+BLOCK = 64 * 1024  # Bytes hashed at each end of a file in the second stage
+CHUNK = 1024 * 1024  # Bytes read at a time by a full hash
+VERSION = 1
+
+
+class Duplicates:
+    """
+    Finds the files with the same content, in three stages, each one only
+    looking at what the one before could not tell apart:
+
+        1. Files are grouped by the size the scan already has; a file with
+           a size of its own is unique without being read.
+        2. Files of a shared size hash their first and last BLOCK bytes,
+           threads files at a time. A file of up to two blocks is read
+           whole, so this is its full hash.
+        3. Files whose ends still match are hashed whole, CHUNK bytes at a
+           time, in workers processes (None = one per CPU).
+
+    The hashes are cached by (inode, mtime, size) per directory, so finding
+    the duplicates of an unchanged directory again reads no file. Empty
+    files are left out; they are all the same.
+    """
+
+    def __init__(self, workers: int = None, threads: int = WORKERS, cache_dir: str = None):
+        self.workers = workers
+        self.threads = threads
+        self.cache_dir = cache_dir or cache_path("hashes")
+
+    def find(self, entries) -> list[str]:
+        """
+        Args:
+            entries (EntryTable):   The files of a scan (a list of entries also works).
+        Returns:
+            list:                   The Duplicate cell of each row, "" for a unique file.
+        """
+        paths, sizes, keys = _columns(entries)
+        path = self._path(entries)
+        cache = load_cache(path, VERSION) or {}
+        known = {}  # The hashes of this scan: (ends, whole or None) by key
+
+        by_size = defaultdict(list)
+        for index, size in enumerate(sizes):
+            if size > 0:
+                by_size[size].append(index)
+
+        # Stage 2: the ends of the files of a shared size
+        unread = []
+        for group in by_size.values():
+            if len(group) < 2:
+                continue
+            for index in group:
+                if keys[index] in cache:
+                    known[keys[index]] = cache[keys[index]]
+                else:
+                    unread.append(index)
+        if unread:
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                for index, digest in zip(unread, pool.map(_ends, [paths[index] for index in unread])):
+                    if digest is not None:  # A file that could not be read is no duplicate
+                        known[keys[index]] = (digest, digest if sizes[index] <= 2 * BLOCK else None)
+
+        # Stage 3: whole files, for the ends that still match
+        by_ends = defaultdict(list)
+        for index in range(len(paths)):
+            if keys[index] in known and sizes[index] > 0:
+                by_ends[sizes[index], known[keys[index]][0]].append(index)
+        unhashed = {}
+        for group in by_ends.values():
+            if len(group) > 1:
+                for index in group:
+                    if known[keys[index]][1] is None:
+                        unhashed.setdefault(keys[index], index)
+        if unhashed:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                hashed = pool.map(_hash, [paths[index] for index in unhashed.values()])
+                for key, digest in zip(list(unhashed), hashed):
+                    if digest is not None:
+                        known[key] = (known[key][0], digest)
+
+        if known != cache:
+            save_cache(path, known, VERSION)  # Files gone from the directory are dropped
+
+        groups = defaultdict(list)
+        for group in by_ends.values():
+            if len(group) > 1:
+                for index in group:
+                    digest = known[keys[index]][1]
+                    if digest is not None:
+                        groups[sizes[index], digest].append(index)
+        cells = [""] * len(paths)
+        copies = sorted((group for group in groups.values() if len(group) > 1), key=lambda group: group[0])
+        for number, group in enumerate(copies, start=1):
+            for index in group:
+                cells[index] = Strings.duplicate_group.format(group=number, count=len(group))
+        return cells
+
+    def _path(self, entries) -> str:
+        return os.path.join(self.cache_dir, cache_key(entries) + ".hashes")
+
+
+def _columns(entries) -> tuple[list, list, list]:
+    """
+    Returns:
+        tuple:  The path, size and cache key of each row; folders get size 0, so they are left out.
+    """
+    if isinstance(entries, EntryTable):
+        paths = [entries.path(index) for index in range(len(entries))]
+        sizes = [0 if kind == KIND_FOLDER else size for kind, size in zip(entries.kinds, entries.sizes)]
+        return paths, sizes, list(zip(entries.inodes, entries.mtimes, entries.sizes))
+    paths, sizes, keys = [], [], []
+    for view in entries:
+        paths.append(view.dir)
+        sizes.append(0 if isinstance(view, Folder) else view.size)
+        keys.append((view.table.inodes[view.index], view.date_modified, view.size))
+    return paths, sizes, keys
+
+
+def _ends(path: str) -> str | None:
+    """
+    Hashes the first and last BLOCK bytes of a file, or all of a small one.
+    """
+    data = read_ends(path, BLOCK, BLOCK)
+    return None if data is None else hashlib.blake2b(data).hexdigest()
+
+
+def _hash(path: str) -> str | None:
+    """
+    Hashes a whole file in chunks. Module level, so that worker processes can run it.
+    """
+    digest = hashlib.blake2b()
+    try:
+        with open(path, "rb", buffering=0) as file:
+            while chunk := file.read(CHUNK):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
@@ -1,102 +1,434 @@
+import hashlib
+import operator
 import os
 import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from utils import Type, Strings, file_extensions
+from functools import lru_cache
+from itertools import repeat
+from utils import Type, Strings, lazy_import, suffix_type
+
+# Optional, the columns fall back to plain Python; loaded on the first
+# sort on a stat column or filter, as a listing by name does not need it
+numpy = lazy_import("numpy")
+
+FILE_COUNT_LIMIT = 10000  # Folders with more entries show "10000+"
+SCAN_WORKERS = None  # Stat threads of the interactive scan; e.g. 32 for NFS/SMB mounts (None = one after another)
 
 
 class Entry:
-    def __init__(self, dir):
-        self.dir = dir
-        self.name = os.path.basename(dir)
-        self.date_created = os.path.getctime(dir)
-        self.date_modified = os.path.getmtime(dir)
-        self.size = os.path.getsize(dir)
+    """
+    A lightweight view over one row of an EntryTable.
+    """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @classmethod
+    def from_path(cls, dir, count_limit=None):
+        """
+        Stats a single path into a one-row table and returns its view.
+
+        Args:
+            dir (str):          The path of the file or folder.
+            count_limit (int):  Cap for the lazy folder file count.
+        Returns:
+            Entry:              The view of the new row.
+        """
+        table = EntryTable(os.path.dirname(dir), count_limit=count_limit)
+        kind = KIND_FOLDER if cls is Folder else KIND_FILE
+        table.append(os.path.basename(dir), kind, os.stat(dir))
+        return table[0]
 
     @property
-    def date_modified(self):
-        return datetime.fromtimestamp(self._date_modified).strftime(
-            "%b %d, %Y at %I:%M %p"
-        )
+    def dir(self):
+        return self.table.path(self.index)
 
-    @date_modified.setter
-    def date_modified(self, value):
-        self._date_modified = value
+    @property
+    def name(self):
+        return self.table.names[self.index]
 
     @property
     def date_created(self):
-        return datetime.fromtimestamp(self._date_created).strftime(
-            "%b %d, %Y at %I:%M %p"
-        )
+        return self.table.ctimes[self.index]
 
-    @date_created.setter
-    def date_created(self, value):
-        self._date_created = value
+    @property
+    def date_modified(self):
+        return self.table.mtimes[self.index]
 
     @property
     def size(self):
-        if self._size == 0:
-            return "Zero bytes"
-        elif self._size < 1024:
-            return f"{self._size} B"
-        elif self._size < 1024 * 1024:
-            return f"{self._size / 1024:.0f} KB"
-        elif self._size < 1024 * 1024 * 1024:
-            return f"{self._size / (1024 * 1024):.1f} MB"
-        else:
-            return f"{self._size / (1024 * 1024 * 1024):.1f} GB"
-
-    @size.setter
-    def size(self, value):
-        self._size = value
+        return self.table.sizes[self.index]
 
 
 class Folder(Entry):
-    def __init__(self, file_path):
-        super().__init__(file_path)
-        self.file_count = len(os.listdir(file_path))
+    __slots__ = ()
 
     @property
     def file_count(self):
-        return "" if self._file_count == 0 else str(self._file_count)
-
-    @file_count.setter
-    def file_count(self, count):
-        self._file_count = count
+        count = self.table.file_count(self.index)
+        limit = self.table.count_limit
+        if count == 0:
+            return ""
+        elif limit is not None and count > limit:
+            return f"{limit}+"
+        return str(count)
 
     def values(self):
         return list([
             self.name,
-            self.date_modified,
+            format_date(self.date_modified),
             self.file_count,
             ""])
 
     def list(self):
-        folders = []
-        for entry in os.listdir(self.dir):
-            _dir = os.path.join(self.dir, entry)
-            if os.path.isdir(_dir) and not entry.startswith("."): # Don't include system folders
-                print(os.path.basename(_dir))
-                folders.append(Folder(_dir))
-        return sorted(folders, key=lambda folder: folder.name)
+        folders = get_entries(Type.FOLDER, self.dir)
+        for folder in folders:
+            print(folder.name)
+        return folders
 
 
 class File(Entry):
-    def __init__(self, file_path):
-        super().__init__(file_path)
-        self.type = os.path.splitext(file_path)[1]
+    __slots__ = ()
+
+    @property
+    def type(self):
+        """
+        Returns:
+            str:    The Type column: the classified type, else the one the name tells.
+        """
+        types = self.table.types
+        return (None if types is None else types[self.index]) or suffix_type(self.name) or Strings.document_file
 
     def values(self):
-        type = file_extensions.get(self.type, Strings.document_file)
-        return list([
-            self.name,
-            self.date_created,
-            self.date_modified,
-            self.size,
-            type,
-            ""])
+        return _file_values(self.name, self.date_created, self.date_modified, self.size, self.type)
+
+
+def _file_values(name, date_created, date_modified, size, type=None):
+    return [
+        name,
+        _format_minute(int(date_created // 60)),
+        _format_minute(int(date_modified // 60)),
+        format_size(size),
+        type or suffix_type(name) or Strings.document_file,
+        ""]
+
+
+KIND_FILE = 0
+KIND_FOLDER = 1
+
+COLUMNS = {
+    # Sort/filter key: (attribute, array typecode, numpy dtype)
+    "size": ("sizes", "q", "int64"),
+    "date_modified": ("mtimes", "d", "float64"),
+    "date_created": ("ctimes", "d", "float64"),
+    "kind": ("kinds", "b", "int8"),
+    "inode": ("inodes", "Q", "uint64"),
+}
+
+
+class EntryTable:
+    """
+    Columnar storage for the entries of one directory.
+
+    Names are kept in a list and the stat values in parallel typed arrays,
+    so a million rows cost a few bytes per number instead of one object with
+    a __dict__ each. Iterating or indexing yields File/Folder views. Sort,
+    filter and aggregate run on NumPy views of the arrays when NumPy is
+    installed, and fall back to plain Python otherwise.
+    """
+    __slots__ = ("dir", "names", "sizes", "mtimes", "ctimes", "kinds", "inodes",
+                 "file_counts", "types", "count_limit", "errors")
+
+    def __init__(self, dir, count_limit=None):
+        self.dir = dir
+        self.names = []
+        self.sizes = array("q")
+        self.mtimes = array("d")
+        self.ctimes = array("d")
+        self.kinds = array("b")
+        self.inodes = array("Q")
+        self.file_counts = None  # Folder file counts, filled on first access
+        self.types = None  # File types from classify.Classifier, else told by the name
+        self.count_limit = count_limit
+        self.errors = []  # (name, OSError) of the entries that could not be stat'ed
+
+    @classmethod
+    def from_rows(cls, dir, rows, count_limit=None):
+        """
+        Builds a table from raw values, e.g. those of the index or of a list of entries.
+
+        Args:
+            dir (str):          The directory the names are relative to.
+            rows (Iterable):    (name, kind, size, mtime, ctime, inode, type) tuples; type None is told by the name.
+            count_limit (int):  Cap for the lazy folder file count.
+        Returns:
+            EntryTable:         The new table.
+        """
+        table = cls(dir, count_limit=count_limit)
+        types = []
+        for name, kind, size, mtime, ctime, inode, type in rows:
+            table.names.append(name)
+            table.kinds.append(kind)
+            table.sizes.append(size)
+            table.mtimes.append(mtime)
+            table.ctimes.append(ctime)
+            table.inodes.append(inode)
+            types.append(type)
+        if any(type is not None for type in types):
+            table.types = types
+        return table
+
+    def append(self, name, kind, stat):
+        self.names.append(name)
+        self.sizes.append(stat.st_size)
+        self.mtimes.append(stat.st_mtime)
+        self.ctimes.append(stat.st_ctime)
+        self.kinds.append(kind)
+        self.inodes.append(stat.st_ino)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        view = Folder if self.kinds[index] == KIND_FOLDER else File
+        return view(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.names)):
+            yield self[index]
+
+    def rows(self):
+        """
+        Formats every row straight from the columns, without building views.
+
+        Returns:
+            Generator:  One list of cell values per entry.
+        """
+        types = self.types or repeat(None)
+        columns = zip(self.names, self.kinds, self.ctimes, self.mtimes, self.sizes, types)
+        for index, (name, kind, date_created, date_modified, size, type) in enumerate(columns):
+            if kind == KIND_FOLDER:
+                yield Folder(self, index).values()
+            else:
+                yield _file_values(name, date_created, date_modified, size, type)
+
+    def path(self, index) -> str:
+        return os.path.join(self.dir, self.names[index])
+
+    def path_map(self) -> dict:
+        """
+        Returns:
+            dict:   The path of every entry, keyed by name.
+        """
+        join, dir = os.path.join, self.dir
+        return {name: join(dir, name) for name in self.names}
+
+    def file_count(self, index) -> int:
+        if self.file_counts is None:
+            self.file_counts = array("q", [-1]) * len(self.names)
+        if self.file_counts[index] < 0:
+            self.file_counts[index] = count_entries(self.path(index), limit=self.count_limit)
+        return self.file_counts[index]
+
+    def column(self, key):
+        """
+        Returns a stat column, as a zero-copy NumPy array when available.
+
+        Args:
+            key (str):  A key of COLUMNS.
+        Returns:
+            The column values.
+        """
+        attribute, _, dtype = COLUMNS[key]
+        values = getattr(self, attribute)
+        if numpy is not None:
+            return numpy.frombuffer(values, dtype=dtype) if len(values) else numpy.empty(0, dtype)
+        return values
+
+    def take(self, indices):
+        """
+        Builds a new table from the given row indices, in that order. A
+        list, as a name sort gives, is taken in plain Python, so a plain
+        listing never loads NumPy; a NumPy array is taken with NumPy.
+
+        Args:
+            indices:        A list or NumPy array of row numbers.
+        Returns:
+            EntryTable:     The new table.
+        """
+        table = EntryTable(self.dir, count_limit=self.count_limit)
+        table.errors = self.errors
+        names = self.names
+        if not isinstance(indices, list):
+            indices = numpy.asarray(indices, dtype="int64")
+            table.names = [names[i] for i in indices.tolist()]
+            for key, (attribute, _, _) in COLUMNS.items():
+                getattr(table, attribute).frombytes(self.column(key)[indices].tobytes())
+        else:
+            table.names = [names[i] for i in indices]
+            for attribute, typecode, _ in COLUMNS.values():
+                column = getattr(self, attribute)
+                setattr(table, attribute, array(typecode, [column[i] for i in indices]))
+        if self.file_counts is not None:
+            counts = self.file_counts
+            table.file_counts = array("q", [counts[i] for i in list(indices)])
+        if self.types is not None:
+            table.types = [self.types[i] for i in list(indices)]
+        return table
+
+    def sort(self, by="name", reverse=False):
+        """
+        Args:
+            by (str):       "name" or a key of COLUMNS, compared on raw values.
+            reverse (bool): Sort in descending order.
+        Returns:
+            EntryTable:     A new sorted table.
+        """
+        if by == "name":
+            order = sorted(range(len(self.names)), key=self.names.__getitem__, reverse=reverse)
+        elif numpy is not None:
+            column = self.column(by)
+            if reverse:  # Sorting the reversed column keeps tied rows in table order, as sorted() does
+                order = len(column) - 1 - numpy.argsort(column[::-1], kind="stable")[::-1]
+            else:
+                order = numpy.argsort(column, kind="stable")
+        else:
+            order = sorted(range(len(self.names)), key=self.column(by).__getitem__, reverse=reverse)
+        return self.take(order)
 
+    def filter(self, mask):
+        """
+        Args:
+            mask:           One boolean per row, e.g. table.column("size") > 1024.
+        Returns:
+            EntryTable:     A new table with the selected rows.
+        """
+        if numpy is not None:
+            return self.take(numpy.flatnonzero(numpy.asarray(mask, dtype=bool)))
+        return self.take([index for index, keep in enumerate(mask) if keep])
 
-def header_rename(type) -> list[str]:
+    def where(self,
+              min_size=None,
+              max_size=None,
+              modified_after=None,
+              modified_before=None,
+              kind=None):
+        """
+        Filters on the stat columns; every given condition must match.
+
+        Returns:
+            EntryTable:     A new table with the matching rows.
+        """
+        conditions = [
+            ("size", min_size, operator.ge),
+            ("size", max_size, operator.le),
+            ("date_modified", modified_after, operator.ge),
+            ("date_modified", modified_before, operator.le),
+            ("kind", kind, operator.eq),
+        ]
+        mask = None
+        for key, value, compare in conditions:
+            if value is None:
+                continue
+            column = self.column(key)
+            if numpy is not None:
+                selected = compare(column, value)
+                mask = selected if mask is None else mask & selected
+            else:
+                selected = [compare(item, value) for item in column]
+                mask = selected if mask is None else [a and b for a, b in zip(mask, selected)]
+        return self if mask is None else self.filter(mask)
+
+    def aggregate(self, key, how="sum"):
+        """
+        Args:
+            key (str):  A key of COLUMNS.
+            how (str):  "sum", "min", "max" or "mean".
+        Returns:
+            The aggregated value, or None for an empty table.
+        """
+        if not self.names:
+            return None
+        column = self.column(key)
+        if numpy is not None:
+            return getattr(column, how)().item()
+        match how:
+            case "sum":
+                return sum(column)
+            case "min":
+                return min(column)
+            case "max":
+                return max(column)
+            case "mean":
+                return sum(column) / len(column)
+        raise ValueError(how)
+
+
+def format_date(timestamp) -> str:
+    """
+    Formats a raw stat timestamp, e.g. 'Jan 02, 2024 at 09:05 AM'.
+
+    Args:
+        timestamp (float):  Seconds since the epoch.
+    Returns:
+        str:                The human-readable date.
+    """
+    return _format_minute(int(timestamp // 60))
+
+
+@lru_cache(maxsize=4096)
+def _format_minute(minute: int) -> str:
+    # The format has minute resolution, so every timestamp within the same
+    # minute shares one cached string.
+    return datetime.fromtimestamp(minute * 60).strftime("%b %d, %Y at %I:%M %p")
+
+
+def format_size(size) -> str:
+    """
+    Formats a raw size in bytes, e.g. '12 KB'.
+
+    Args:
+        size (int): The size in bytes.
+    Returns:
+        str:        The human-readable size.
+    """
+    if size == 0:
+        return "Zero bytes"
+    elif size < 1024:
+        return f"{size} B"
+    elif size < 1024 * 1024:
+        return f"{size / 1024:.0f} KB"
+    elif size < 1024 * 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    else:
+        return f"{size / (1024 * 1024 * 1024):.1f} GB"
+
+
+def format_rows(entries):
+    """
+    Formats the entries into sheet rows in one pass, as they are emitted.
+
+    Args:
+        entries (list): The files or folders.
+    Returns:
+        Generator:      One list of cell values per entry.
+    """
+    if isinstance(entries, EntryTable):
+        yield from entries.rows()
+    else:
+        for entry in entries:
+            yield entry.values()
+
+
+def header_rename(type, duplicates: bool = False) -> list[str]:
+    """
+    Returns:
+        list:   The headers of the rename sheet; with duplicates, files get a Duplicate column after Rename.
+    """
     match type:
         case Type.FILE:
             headers = [
@@ -106,7 +438,7 @@ def header_rename(type) -> list[str]:
                 Strings.file_size,
                 Strings.file_type,
                 Strings.rename,
-            ]
+            ] + ([Strings.duplicate] if duplicates else [])
         case Type.FOLDER:
             headers = [
                 Strings.folder_name,
@@ -123,17 +455,187 @@ def header_create():
     return [Strings.folder_name]
 
 
-def get_entries(type, dir):
-    entries = []
-    for entry in os.listdir(dir):
-        if entry.startswith("."): # Skip system directories
+def count_entries(dir, limit=None) -> int:
+    """
+    Counts the entries of a directory without building the list of names.
+
+    Args:
+        dir (str):      The directory to count.
+        limit (int):    Stop counting after this many entries (None = no cap).
+    Returns:
+        int:            The count, or limit + 1 when the cap was reached.
+    """
+    count = 0
+    try:
+        with os.scandir(dir) as it:
+            for _ in it:
+                count += 1
+                if limit is not None and count > limit:
+                    break
+    except OSError:  # Unreadable child folder, show it as empty
+        return 0
+    return count
+
+
+def get_entries(type, dir, count_limit=None, sort_by="name", reverse=False, workers=None, snapshots=None):
+    """
+    Scans the directory in a single pass.
+
+    The entry type comes from the directory entry itself (d_type on POSIX),
+    and the File or Folder is built from the one cached stat result. With
+    workers, the stat calls fan out over a thread pool instead, which hides
+    the round-trip latency of NFS/SMB mounts. Entries that fail to stat are
+    recorded in EntryTable.errors and the scan goes on.
+
+    Args:
+        type (Type):        The data type to list.
+        dir (str):          The directory to scan.
+        count_limit (int):  Cap for the lazy folder file count, e.g. 10000 shows "10000+".
+        sort_by (str):      "name" or a key of COLUMNS, compared on the raw stat values.
+        reverse (bool):     Sort in descending order.
+        workers (int):      Number of stat threads (None = stat one after another).
+        snapshots:          A snapshot.Snapshots to scan through (None = scan the directory).
+    Returns:
+        EntryTable:         The sorted files or folders.
+    """
+    if snapshots is not None:
+        entries = snapshots.scan(type, dir, count_limit, workers)
+    else:
+        entries = _scan(type, dir, "", count_limit, workers)
+    return entries.sort(by=sort_by, reverse=reverse)
+
+
+def iter_entries(type,
+                 dir,
+                 max_depth=None,
+                 count_limit=None,
+                 sort_by="name",
+                 reverse=False,
+                 workers=None,
+                 errors=None):
+    """
+    Walks the directory tree and yields its files or folders level by level.
+
+    Only one folder's table is held at a time, so a whole tree can be written
+    to a sheet while it is still being scanned. Names are relative to dir,
+    e.g. 'photos/2024/a.jpg'. A folder reached twice through symlinks (same
+    device and inode) is only walked once, which also breaks symlink loops.
+
+    Args:
+        type (Type):        The data type to list.
+        dir (str):          The root directory.
+        max_depth (int):    Levels to descend below dir (None = no limit, 0 = dir only).
+        count_limit (int):  Cap for the lazy folder file count.
+        sort_by (str):      Sort key within each folder, see get_entries.
+        reverse (bool):     Sort in descending order.
+        workers (int):      Number of stat threads, see get_entries.
+        errors (list):      Collects (name, OSError) of what could not be read.
+    Returns:
+        Generator:          File or Folder views, each folder's entries before its subfolders.
+    """
+    root = os.stat(dir)
+    visited = {(root.st_dev, root.st_ino)}
+    stack = [("", 0)]
+    while stack:
+        prefix, depth = stack.pop()
+        subdirs = [] if max_depth is None or depth < max_depth else None
+        try:
+            table = _scan(type, dir, prefix, count_limit, workers, subdirs)
+        except OSError as e:  # Unreadable subfolder, keep walking the rest
+            if errors is not None:
+                errors.append((prefix.rstrip(os.sep), e))
             continue
-        _dir = os.path.join(dir, entry)
-        match type:
-            case Type.FILE:
-                if os.path.isfile(_dir):
-                    entries.append(File(_dir))
-            case Type.FOLDER:
-                if os.path.isdir(_dir):
-                    entries.append(Folder(_dir))
-    return sorted(entries, key=lambda data: data.name)
+        if errors is not None:
+            errors.extend(table.errors)
+        yield from table.sort(by=sort_by, reverse=reverse)
+        for name, stat in sorted(subdirs or [], reverse=True):  # Popped in ascending order
+            key = (stat.st_dev, stat.st_ino)
+            if key not in visited:
+                visited.add(key)
+                stack.append((prefix + name + os.sep, depth + 1))
+
+
+def _scan(type, root, prefix, count_limit=None, workers=None, subdirs=None):
+    """
+    Lists one folder into a table whose names are prefixed with its path
+    relative to root. When subdirs is a list, the (name, stat) of every
+    subfolder is collected into it during the same pass.
+    """
+    entries = EntryTable(root, count_limit=count_limit)
+    kind = KIND_FOLDER if type == Type.FOLDER else KIND_FILE
+    with os.scandir(os.path.join(root, prefix)) as it:
+        matches = _filter(type, it, subdirs)
+        if workers:
+            matches = list(matches)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                _append_stats(entries, kind, prefix, zip(matches, pool.map(_stat, matches)))
+        else:
+            _append_stats(entries, kind, prefix, ((dir_entry, _stat(dir_entry)) for dir_entry in matches))
+    return entries
+
+
+def _filter(type, dir_entries, subdirs=None):
+    for dir_entry in dir_entries:
+        if subdirs is not None and not dir_entry.name.startswith(".") and dir_entry.is_dir():
+            stat = _stat(dir_entry)  # Cached by the DirEntry, reused below
+            if not isinstance(stat, OSError):
+                subdirs.append((dir_entry.name, stat))
+        if _matches(type, dir_entry):
+            yield dir_entry
+
+
+def _matches(type, dir_entry) -> bool:
+    if dir_entry.name.startswith("."): # Skip system directories
+        return False
+    match type:
+        case Type.FILE:
+            return dir_entry.is_file()
+        case Type.FOLDER:
+            return dir_entry.is_dir()
+    return False
+
+
+def _stat(dir_entry):
+    try:
+        return dir_entry.stat()
+    except OSError as e:  # Removed or unreadable since it was listed
+        return e
+
+
+def _append_stats(entries, kind, prefix, results):
+    for dir_entry, stat in results:
+        if isinstance(stat, OSError):
+            entries.errors.append((prefix + dir_entry.name, stat))
+        else:
+            entries.append(prefix + dir_entry.name, kind, stat)
+
+
+def path_map(entries) -> dict:
+    """
+    Maps entry names to their paths, for an EntryTable or a list of entries.
+
+    Args:
+        entries:    The files or folders.
+    Returns:
+        dict:       The path of every entry, keyed by name.
+    """
+    if isinstance(entries, EntryTable):
+        return entries.path_map()
+    return {entry.name: entry.dir for entry in entries}
+
+
+def cache_key(entries) -> str:
+    """
+    Keys the per-folder caches of a scan, e.g. the types and hashes of its
+    files, so that every cache of the same rows is found under one key.
+
+    Args:
+        entries:    The files or folders, an EntryTable or a list of entries.
+    Returns:
+        str:        The hash of the folder of the first row: a table of a recursive walk holds one subfolder.
+    """
+    if isinstance(entries, EntryTable):
+        dir = os.path.dirname(entries.path(0)) if entries.names else entries.dir
+    else:
+        dir = os.path.dirname(entries[0].dir) if entries else ""
+    return hashlib.sha1(os.path.abspath(dir).encode("utf-8", "surrogateescape")).hexdigest()
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import time
+
+from itertools import repeat
+
+from entry import EntryTable, KIND_FILE, KIND_FOLDER
+from utils import Type, Strings, cache_path, suffix_type
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    ctime REAL NOT NULL,
+    ext TEXT NOT NULL,
+    type TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_dir ON entries (dir, kind, name);
+CREATE INDEX IF NOT EXISTS entries_ext ON entries (ext, size);
+CREATE INDEX IF NOT EXISTS entries_mtime ON entries (mtime);
+CREATE TABLE IF NOT EXISTS dirs (
+    dir TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    scanned REAL NOT NULL,
+    PRIMARY KEY (dir, kind)
+) WITHOUT ROWID;
+"""
+
+_SIGNED = 1 << 63  # SQLite integers are signed, large inodes wrap around
+
+
+class Index:
+    """
+    A local SQLite index of the scanned entries of many directories.
+    The type of a file is the one classify.Classifier set on the table,
+    else the one its name tells.
+
+    Every scan replaces what the index knows of the directory, and only the
+    rows that changed are written. Listings and filtered queries, such as
+    all PDF files over 100 MB modified this month, are then answered from
+    the index without touching the disk. The index is only as fresh as the
+    last scan of each directory.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or default_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(_SCHEMA)
+
+    def update(self, type: Type, entries: EntryTable) -> int:
+        """
+        Brings the index of one directory up to date with a scan of it.
+
+        Args:
+            type (Type):            The data type of the scan.
+            entries (EntryTable):   The entries of a get_entries scan.
+        Returns:
+            int:                    The number of rows added, changed or removed.
+        """
+        dir = os.path.abspath(entries.dir)
+        kind = _kind(type)
+        with self.db:
+            known = {name: values for name, *values in self.db.execute(
+                "SELECT name, inode, size, mtime, ctime, type FROM entries WHERE dir = ? AND kind = ?", (dir, kind))}
+            rows = []
+            types = entries.types or repeat(None)
+            columns = zip(entries.names, entries.inodes, entries.sizes, entries.mtimes, entries.ctimes, types)
+            for name, inode, size, mtime, ctime, file_type in columns:
+                if kind == KIND_FILE:
+                    file_type = file_type or suffix_type(name) or Strings.document_file
+                values = [_signed(inode), size, mtime, ctime, file_type or ""]
+                if known.pop(name, None) != values:
+                    ext = os.path.splitext(name)[1].lower() if kind == KIND_FILE else ""
+                    rows.append((os.path.join(dir, name), dir, name, kind, *values[:4], ext, values[4]))
+            self.db.executemany("DELETE FROM entries WHERE path = ?",
+                                ((os.path.join(dir, name),) for name in known))
+            self.db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (dir, kind, time.time()))
+        return len(rows) + len(known)
+
+    def entries(self, type: Type, dir: str, count_limit=None) -> EntryTable | None:
+        """
+        Lists a directory from the index, as get_entries would have at its last scan.
+
+        Args:
+            type (Type):        The data type to list.
+            dir (str):          The directory.
+            count_limit (int):  Cap for the lazy folder file count.
+        Returns:
+            EntryTable:         The entries sorted by name, or None when the directory was never indexed.
+        """
+        dir = os.path.abspath(dir)
+        kind = _kind(type)
+        if self.db.execute("SELECT 1 FROM dirs WHERE dir = ? AND kind = ?", (dir, kind)).fetchone() is None:
+            return None
+        cursor = self.db.execute("SELECT name, inode, size, mtime, ctime, type FROM entries "
+                                 "WHERE dir = ? AND kind = ? ORDER BY name", (dir, kind))
+        return _table(dir, kind, cursor, count_limit)
+
+    def query(self,
+              type: Type = Type.FILE,
+              under: str = None,
+              ext: str = None,
+              min_size: int = None,
+              max_size: int = None,
+              modified_after: float = None,
+              modified_before: float = None,
+              count_limit=None) -> EntryTable:
+        """
+        Finds the indexed entries that match every given condition.
+
+        Args:
+            type (Type):                The data type to find.
+            under (str):                Only entries inside this directory, at any depth.
+            ext (str):                  The file extension, e.g. ".pdf", in any case.
+            min_size (int):             The smallest size in bytes.
+            max_size (int):             The largest size in bytes.
+            modified_after (float):     The earliest modification time, in seconds since the epoch.
+            modified_before (float):    The latest modification time.
+            count_limit (int):          Cap for the lazy folder file count.
+        Returns:
+            EntryTable:                 The entries sorted by path; names are relative to under.
+        """
+        conditions = ["kind = ?"]
+        parameters = [_kind(type)]
+        root = ""
+        if under is not None:
+            root = os.path.abspath(under)
+            prefix = os.path.join(root, "")
+            # A range on the primary key instead of LIKE, which can not use it
+            conditions.append("path >= ? AND path < ?")
+            parameters += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        for condition, value in (("ext = ?", ext and "." + ext.lower().lstrip(".")),
+                                 ("size >= ?", min_size),
+                                 ("size <= ?", max_size),
+                                 ("mtime >= ?", modified_after),
+                                 ("mtime <= ?", modified_before)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        cursor = self.db.execute("SELECT path, inode, size, mtime, ctime, type FROM entries WHERE "
+                                 + " AND ".join(conditions) + " ORDER BY path", parameters)
+        if root:
+            start = len(os.path.join(root, ""))
+            cursor = ((path[start:], *values) for path, *values in cursor)
+        return _table(root, _kind(type), cursor, count_limit)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def default_path() -> str:
+    """
+    Returns:
+        str:    The index file, in the user cache folder of the platform.
+    """
+    return cache_path("index.sqlite3")
+
+
+def _table(dir: str, kind: int, rows, count_limit=None) -> EntryTable:
+    return EntryTable.from_rows(dir, ((name, kind, size, mtime, ctime, inode % (1 << 64), file_type)
+                                      for name, inode, size, mtime, ctime, file_type in rows), count_limit)
+
+
+def _kind(type: Type) -> int:
+    return KIND_FOLDER if type == Type.FOLDER else KIND_FILE
+
+
+def _signed(inode: int) -> int:
+    return inode - (1 << 64) if inode >= _SIGNED else inode
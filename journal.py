@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from collections import namedtuple
+
+from utils import Type, cache_path
+
+VERSION = 1
+SYNC_EVERY = 256  # Markers written per fsync
+SYNC_SECONDS = 1.0  # ...or one fsync at least this often
+KEEP = 20  # Journals kept in the default folder, the newest ones
+
+# A journalled move: its place in the journal, its chain and the move itself
+Operation = namedtuple("Operation", ["seq", "chain", "source", "target", "temp"])
+
+# What a journal says about its run
+Contents = namedtuple("Contents", ["dir", "entry_type", "operations", "done", "undone"])
+
+
+class Journal:
+    """
+    An append-only record of one apply run, one JSON array per line:
+    a header, every planned move, then a marker for each move once it is
+    done (or undone).
+
+    The plan is synced to disk before the first rename. Each marker is
+    flushed as it is written, so a crash of the process loses none, and
+    synced in batches, so the cost is one fsync per few hundred moves. A
+    marker lost with the machine is recovered from the disk on resume.
+    """
+
+    def __init__(self, path: str, marker: str = "D", mode: str = "a"):
+        self.path = path
+        self.marker = marker
+        self._file = open(path, mode, encoding="utf-8")
+        if self._file.tell() and not _ends_with_newline(path):
+            self._file.write("\n")  # End the line a crash tore, markers go on the next one
+        self._lock = threading.Lock()
+        self._seqs = {}
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    @classmethod
+    def start(cls, path: str, dir: str, entry_type: Type, chains: list):
+        """
+        Creates a journal holding the whole plan, synced to disk. An
+        existing file is refused with FileExistsError, never added to.
+
+        Args:
+            path (str):         The journal file, which must not exist yet.
+            dir (str):          The directory of the moves.
+            entry_type (Type):  The data type, for the messages of later runs.
+            chains (list):      The chains of moves of the plan.
+        Returns:
+            Journal:            The journal, ready for done markers.
+        """
+        journal = cls(path, mode="x")
+        lines = [_line("J", VERSION, os.path.abspath(dir), entry_type.value)]
+        seq = 0
+        for chain_id, chain in enumerate(chains):
+            for move in chain:
+                journal.track(move, seq)
+                lines.append(_line("P", seq, chain_id, move.source, move.target, move.temp))
+                seq += 1
+        journal._file.write("".join(lines))
+        journal.sync()
+        _sync_dir(os.path.dirname(os.path.abspath(path)))  # The new file itself
+        return journal
+
+    def track(self, move, seq: int) -> None:
+        self._seqs[move.source, move.target] = seq
+
+    def mark(self, move, sync: bool = False) -> None:
+        """
+        Records a move as done; thread-safe, flushed at once and synced in
+        batches, or right away with sync.
+        """
+        with self._lock:
+            self._file.write(_line(self.marker, self._seqs[move.source, move.target]))
+            self._file.flush()
+            self._unsynced += 1
+            if sync or self._unsynced >= SYNC_EVERY or time.monotonic() - self._synced_at >= SYNC_SECONDS:
+                self._sync()
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+
+def new_path(dir: str = None) -> str:
+    """
+    Returns a new journal file name. The default folder, in the user cache
+    folder, keeps only the last KEEP journals: the oldest ones are removed
+    to make room for the new one.
+
+    Args:
+        dir (str):  The folder of the journal (None = the default folder).
+    Returns:
+        str:        The journal file name.
+    """
+    if dir is None:
+        dir = default_dir()
+        os.makedirs(dir, exist_ok=True)
+        prune(dir, KEEP - 1)
+    name = time.strftime("rename-%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6] + ".journal"
+    return os.path.join(dir, name)
+
+
+def default_dir() -> str:
+    """
+    Returns:
+        str:    The journal folder, in the user cache folder of the platform.
+    """
+    return cache_path("journals")
+
+
+def prune(dir: str, keep: int) -> None:
+    """
+    Removes all but the newest keep journals of the folder; the names sort by time.
+    """
+    names = sorted(name for name in os.listdir(dir) if name.startswith("rename-") and name.endswith(".journal"))
+    for name in names[:max(len(names) - keep, 0)]:
+        try:
+            os.remove(os.path.join(dir, name))
+        except OSError:  # Removed by another run
+            pass
+
+
+def read(path: str) -> Contents:
+    """
+    Reads a journal; lines torn by a crash are ignored.
+
+    Args:
+        path (str):     The journal file.
+    Returns:
+        Contents:       The directory, data type, operations and markers.
+    """
+    dir = entry_type = None
+    operations = []
+    done = set()
+    undone = set()
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            match record[0]:
+                case "J":
+                    _, _, dir, entry_type = record
+                case "P":
+                    operations.append(Operation(*record[1:]))
+                case "D":
+                    done.add(record[1])
+                case "U":
+                    undone.add(record[1])
+    return Contents(dir, Type(entry_type), operations, done, undone)
+
+
+def _line(*record) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+def _sync_dir(dir: str) -> None:
+    try:
+        fd = os.open(dir, os.O_RDONLY)
+    except OSError:  # Windows can not open a directory
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,302 @@
+import re
+import shutil
+import tempfile
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from xlsx import CellStyle
+
+MIMETYPE = "application/vnd.oasis.opendocument.spreadsheet"
+
+_NS = {
+    "office": "urn:oasis:names:tc:opendocument:xmlns:office:1.0",
+    "style": "urn:oasis:names:tc:opendocument:xmlns:style:1.0",
+    "text": "urn:oasis:names:tc:opendocument:xmlns:text:1.0",
+    "table": "urn:oasis:names:tc:opendocument:xmlns:table:1.0",
+    "fo": "urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0",
+    "number": "urn:oasis:names:tc:opendocument:xmlns:datastyle:1.0",
+}
+_XMLNS = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in _NS.items())
+_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+_ALIGN = {"left": "start", "right": "end", "center": "center"}
+_VERTICAL = {"center": "middle", "top": "top", "bottom": "bottom"}
+
+# Characters XML needs escaped, and control characters XML 1.0 does not allow
+_ESCAPE = {ord("&"): "&amp;", ord("<"): "&lt;", ord(">"): "&gt;"}
+_ESCAPE.update({code: None for code in range(32) if code not in (9, 10)})
+_NEEDS_CARE = re.compile(r"[&<>\x00-\x1f]|^ | $|  ").search
+_NEEDS_ESCAPE = re.compile(r"[&<>\x00-\x1f]").search  # The spaces are checked apart, much faster
+_SPACES = re.compile(r"^ +| +$| {2,}")
+_CHUNK_ROWS = 1000  # Rows joined per write to the body file
+
+# Qualified names used by the reader
+_TABLE = f"{{{_NS['table']}}}table"
+_ROW = f"{{{_NS['table']}}}table-row"
+_CELL = f"{{{_NS['table']}}}table-cell"
+_COVERED = f"{{{_NS['table']}}}covered-table-cell"
+_ROWS_REPEATED = f"{{{_NS['table']}}}number-rows-repeated"
+_COLUMNS_REPEATED = f"{{{_NS['table']}}}number-columns-repeated"
+_P = f"{{{_NS['text']}}}p"
+_S = f"{{{_NS['text']}}}s"
+_C = f"{{{_NS['text']}}}c"
+_TAB = f"{{{_NS['text']}}}tab"
+_LINE_BREAK = f"{{{_NS['text']}}}line-break"
+
+
+class OdsWriter:
+    """
+    A row-at-a-time OpenDocument spreadsheet writer, the native format of
+    LibreOffice, with the same interface as XlsxWriter.
+
+    ODF wants the automatic styles ahead of the tables, so rows are streamed
+    to a temporary file and copied into content.xml behind the styles once
+    the last row is in. Merged ranges may span columns of a single row.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        self._zip.writestr(zipfile.ZipInfo("mimetype"), MIMETYPE, compress_type=zipfile.ZIP_STORED)  # Must be first
+        self._styles = {CellStyle(): 0}  # Index 0 is the default style
+        self._widths = {}
+        self._heights = {}
+        self._body = tempfile.TemporaryFile()
+        self._buffer = []
+        self._in_table = False
+        self._spans = {}
+        self._row = 0
+        self._templates = {}
+
+    def style(self, cell_style: CellStyle) -> int:
+        return self._styles.setdefault(cell_style, len(self._styles))
+
+    def styles(self, registry: dict) -> dict:
+        return {role: self.style(cell_style) for role, cell_style in registry.items()}
+
+    def add_sheet(self, title: str, widths=(), merged=()) -> None:
+        self._end_table()
+        self._in_table = True
+        self._row = 0
+        self._spans = {}
+        for ref in merged:
+            start, end = ref.split(":")
+            row, first = _cell_position(start)
+            _, last = _cell_position(end)
+            self._spans[row] = (first, last - first + 1)
+        columns = "".join(
+            f'<table:table-column table:style-name="co{self._widths.setdefault(width, len(self._widths))}"/>'
+            for width in widths)
+        self._buffer.append(f'<table:table table:name="{title.translate(_ESCAPE)}">{columns}')
+
+    def append(self, values, styles, height=None) -> None:
+        self._row += 1
+        span = self._spans.get(self._row)
+        if not span and not height:
+            texts = [value for value in values if value is not None and value != ""]
+            try:
+                joined = "|".join(texts)
+            except TypeError:  # Not only strings
+                joined = None
+            if joined is not None and not _NEEDS_ESCAPE(joined) and "  " not in joined \
+                    and list(map(str.strip, texts)) == texts:
+                # Fast path, as in XlsxWriter: one template per style and
+                # empty-cell combination, filled with the whole row at once
+                key = (tuple(styles), tuple(map(bool, values)))
+                template = self._templates.get(key)
+                if template is None:
+                    template = self._templates[key] = "<table:table-row>" + "".join(
+                        (f'<table:table-cell table:style-name="ce{style}" office:value-type="string">'
+                         "<text:p>%s</text:p></table:table-cell>" if present else
+                         f'<table:table-cell table:style-name="ce{style}"/>') if style else
+                        ('<table:table-cell office:value-type="string"><text:p>%s</text:p></table:table-cell>'
+                         if present else "<table:table-cell/>")
+                        for style, present in zip(styles, key[1])) + "</table:table-row>"
+                self._buffer.append(template % tuple(texts))
+                if len(self._buffer) >= _CHUNK_ROWS:
+                    self._flush()
+                return
+        row_style = f' table:style-name="ro{self._heights.setdefault(height, len(self._heights))}"' if height else ""
+        parts = [f"<table:table-row{row_style}>"]
+        for col, (value, style) in enumerate(zip(values, styles), start=1):
+            style_name = f' table:style-name="ce{style}"' if style else ""
+            spanned = ""
+            if span and span[0] == col and span[1] > 1:
+                spanned = f' table:number-columns-spanned="{span[1]}"'
+            if value is None or value == "":
+                parts.append(f"<table:table-cell{style_name}{spanned}/>")
+            else:
+                parts.append(f'<table:table-cell{style_name}{spanned} office:value-type="string">'
+                             f"{_paragraphs(str(value))}</table:table-cell>")
+            if spanned:
+                parts.append(f'<table:covered-table-cell table:number-columns-repeated="{span[1] - 1}"/>')
+        parts.append("</table:table-row>")
+        self._buffer.append("".join(parts))
+        if len(self._buffer) >= _CHUNK_ROWS:
+            self._flush()
+
+    def close(self) -> None:
+        self._end_table()
+        self._flush()
+        with self._zip.open("content.xml", "w", force_zip64=True) as content:
+            content.write(f"{_HEADER}<office:document-content {_XMLNS} office:version=\"1.2\">"
+                          f"<office:automatic-styles>{self._styles_xml()}</office:automatic-styles>"
+                          "<office:body><office:spreadsheet>".encode("utf-8"))
+            self._body.seek(0)
+            shutil.copyfileobj(self._body, content)
+            content.write(b"</office:spreadsheet></office:body></office:document-content>")
+        self._body.close()
+        self._zip.writestr(
+            "META-INF/manifest.xml",
+            f'{_HEADER}<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" '
+            'manifest:version="1.2">'
+            f'<manifest:file-entry manifest:full-path="/" manifest:version="1.2" manifest:media-type="{MIMETYPE}"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+            "</manifest:manifest>")
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._body.write("".join(self._buffer).encode("utf-8", "replace"))
+            self._buffer.clear()
+
+    def _end_table(self) -> None:
+        if self._in_table:
+            self._buffer.append("</table:table>")
+            self._in_table = False
+
+    def _styles_xml(self) -> str:
+        parts = ['<number:text-style style:name="text"><number:text-content/></number:text-style>']
+        for width, index in self._widths.items():
+            parts.append(f'<style:style style:name="co{index}" style:family="table-column">'
+                         f'<style:table-column-properties style:column-width="{(width * 7 + 5) / 96:.3f}in"/>'
+                         "</style:style>")
+        for height, index in self._heights.items():
+            parts.append(f'<style:style style:name="ro{index}" style:family="table-row">'
+                         f'<style:table-row-properties style:row-height="{height}pt" '
+                         'style:use-optimal-row-height="false"/></style:style>')
+        for cell_style, index in self._styles.items():
+            if index == 0:
+                continue
+            data_style = ' style:data-style-name="text"' if cell_style.number_format == "@" else ""
+            cell = "".join((
+                f' fo:background-color="#{cell_style.fill_color}"' if cell_style.fill_color else "",
+                f' fo:border="0.06pt solid #{cell_style.border_color}"' if cell_style.border_color else "",
+                f' style:vertical-align="{_VERTICAL[cell_style.vertical]}"' if cell_style.vertical else ""))
+            paragraph = (f'<style:paragraph-properties fo:text-align="{_ALIGN[cell_style.horizontal]}"/>'
+                         if cell_style.horizontal else "")
+            text = "".join((
+                f' fo:font-family="{cell_style.font_name}"' if cell_style.font_name else "",
+                f' fo:color="#{cell_style.font_color}"' if cell_style.font_color else "",
+                ' fo:font-style="italic"' if cell_style.italic else ""))
+            parts.append(f'<style:style style:name="ce{index}" style:family="table-cell"{data_style}>'
+                         f"<style:table-cell-properties{cell}/>{paragraph}<style:text-properties{text}/>"
+                         "</style:style>")
+        return "".join(parts)
+
+
+def read_rows(path: str, min_row: int = 1, max_col: int = None):
+    """
+    Streams the value rows of every table of an ODS file, in order.
+
+    Rows are parsed one at a time and dropped from the tree right after, so
+    memory does not grow with the sheet. Rows without any value are skipped.
+    min_row applies to each table, as paged workbooks repeat the layout.
+
+    Args:
+        path (str):     The file.
+        min_row (int):  The first row to return, starting at 1.
+        max_col (int):  The number of columns to return (None = all).
+    Returns:
+        Generator:      Tuples padded to max_col, with None for empty cells.
+    """
+    with zipfile.ZipFile(path) as archive, archive.open("content.xml") as content:
+        row_idx = 0
+        parents = []
+        for event, element in iterparse(content, events=("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag == _TABLE:
+                row_idx = 0  # The next table starts over
+                parents[-1].remove(element)
+                continue
+            if element.tag != _ROW:
+                continue
+            repeat = int(element.get(_ROWS_REPEATED, 1))
+            row = _row_values(element, max_col)
+            if any(value is not None for value in row):
+                for _ in range(repeat):
+                    row_idx += 1
+                    if row_idx >= min_row:
+                        yield row
+            else:
+                row_idx += repeat
+            parents[-1].remove(element)  # Keep memory flat
+
+
+def _row_values(row, max_col) -> tuple:
+    values = []
+    for cell in row:
+        if cell.tag not in (_CELL, _COVERED):
+            continue
+        repeat = int(cell.get(_COLUMNS_REPEATED, 1))
+        if max_col is not None:
+            repeat = min(repeat, max_col - len(values))
+        paragraphs = [_text(p) for p in cell if p.tag == _P]
+        values.extend([("\n".join(paragraphs) or None) if paragraphs else None] * repeat)
+        if max_col is not None and len(values) >= max_col:
+            break
+    if max_col is not None:
+        values.extend([None] * (max_col - len(values)))
+    return tuple(values)
+
+
+def _text(element) -> str:
+    parts = [element.text or ""]
+    for child in element:
+        if child.tag == _S:
+            parts.append(" " * int(child.get(_C, 1)))
+        elif child.tag == _TAB:
+            parts.append("\t")
+        elif child.tag == _LINE_BREAK:
+            parts.append("\n")
+        else:  # Spans, links
+            parts.append(_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def _paragraphs(text: str) -> str:
+    """
+    Encodes a value as text:p paragraphs. ODF collapses runs of spaces and
+    drops leading ones, so those are written as text:s elements.
+    """
+    if not _NEEDS_CARE(text):
+        return f"<text:p>{text}</text:p>"
+    paragraphs = []
+    for line in text.translate(_ESCAPE).split("\n"):
+        line = _SPACES.sub(_spaces, line).replace("\t", "<text:tab/>")
+        paragraphs.append(f"<text:p>{line}</text:p>")
+    return "".join(paragraphs)
+
+
+def _spaces(match) -> str:
+    count = len(match.group())
+    if match.start() == 0 or match.end() == len(match.string):
+        return f'<text:s text:c="{count}"/>'
+    return " " + (f'<text:s text:c="{count - 1}"/>' if count > 1 else "")
+
+
+def _cell_position(ref: str) -> tuple[int, int]:
+    letters = ref.rstrip("0123456789")
+    col = 0
+    for letter in letters:
+        col = col * 26 + ord(letter.upper()) - 64
+    return int(ref[len(letters):]), col
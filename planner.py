@@ -0,0 +1,286 @@
+import os
+import re
+import uuid
+
+from collections import Counter, deque, namedtuple
+from typing import Iterable, Iterator
+
+from entry import path_map
+from utils import Conflict, Type
+
+# One os.rename, relative to the plan directory; temp marks a move to a
+# temporary name that breaks a cycle
+Move = namedtuple("Move", ["source", "target", "temp"], defaults=[False])
+
+# A row that is left out of the plan, and why
+Skip = namedtuple("Skip", ["name", "target", "conflict"])
+
+# The folders to create: unique paths as tuples of parts, sorted, the rows
+# that are not a path inside the directory, and the number of rows
+FolderPlan = namedtuple("FolderPlan", ["paths", "invalid", "rows"])
+
+_SEPARATORS = re.compile(r"[\\/]")  # Either separator, whatever the platform
+
+
+class Plan:
+    """
+    The renames of a sheet, checked against each other and against the
+    directory, in an order where no rename lands on a name that is still
+    taken. Swaps and other cycles go through a temporary name.
+
+    The moves come in chains: a chain has to run in order, but different
+    chains share no names and can run at the same time.
+    """
+
+    def __init__(self, dir: str):
+        self.dir = dir
+        self.chains = []
+        self.skipped = []
+
+    @property
+    def moves(self) -> list:
+        return [move for chain in self.chains for move in chain]
+
+    def __len__(self) -> int:
+        return sum(1 for chain in self.chains for move in chain if not move.temp)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+
+def plan(rows: Iterable[tuple],
+         entries,
+         dir: str,
+         entry_type: Type = Type.FILE,
+         suffix: bool = False) -> Plan:
+    """
+    Builds the rename plan of the edited rows without touching the disk,
+    apart from listing each target directory once.
+
+    A new name can not be an existing name, unless that entry is renamed
+    too, nor the new name of an earlier row. Names that differ only in case
+    count as the same name, as they do on Windows, macOS and most network
+    shares.
+
+    Args:
+        rows (Iterable):        The (name, rename) rows loaded from the spreadsheet.
+        entries (EntryTable):   The files or folders the sheet was made of.
+        dir (str):              The directory of the entries.
+        entry_type (Type):      The data type, to keep file extensions when suffixing.
+        suffix (bool):          Rename a taken name to "name (2)" instead of skipping it.
+    Returns:
+        Plan:                   The ordered moves and the skipped rows.
+    """
+    result = Plan(dir)
+    known = path_map(entries)
+    listings = _Listings(dir)
+
+    # The requested renames, first row wins
+    renames = {}
+    for row in rows:
+        name, target = row[0], row[-1]
+        if name in known and target not in (None, "") and name not in renames and str(target) != name:
+            renames[name] = str(target)
+
+    # Among the new names
+    claimed = {}  # Name key -> target
+    for name, target in list(renames.items()):
+        key = _key(target)
+        if key in claimed:
+            if suffix:
+                target = renames[name] = _free_name(target, entry_type, claimed, listings)
+            else:
+                conflict = Conflict.DUPLICATE if claimed[key] == target else Conflict.CASE
+                result.skipped.append(Skip(name, target, conflict))
+                del renames[name]
+                continue
+        claimed[_key(target)] = target
+
+    # Against the names in the directory; a name is free once its entry moves
+    # away, so a skipped row can take the name of another row back
+    moving = Counter(_key(name) for name in renames)
+    waiting = {_key(target): name for name, target in renames.items()}  # Name key -> row that wants it
+    check = deque(renames)
+    while check:
+        name = check.popleft()
+        target = renames.get(name)
+        if target is None:
+            continue
+        if listings.count(target) <= moving[_key(target)]:
+            continue  # Free, or only taken by entries that move away
+        conflict = Conflict.EXISTS if listings.exists(target) else Conflict.CASE
+        if suffix:
+            renames[name] = _free_name(target, entry_type, claimed, listings)
+            claimed[_key(renames[name])] = renames[name]
+            continue
+        result.skipped.append(Skip(name, target, conflict))
+        del renames[name]
+        moving[_key(name)] -= 1
+        if _key(name) in waiting:
+            check.append(waiting[_key(name)])  # Its name stays taken
+
+    result.chains = _order(renames)
+    return result
+
+
+def plan_folders(names: Iterable) -> FolderPlan:
+    """
+    Normalizes and dedupes the requested folder paths, such as
+    "2024/Q1/invoices", and sorts them by their parts so that a parent
+    always comes before the folders inside it.
+
+    Args:
+        names (Iterable):   The folder names of the rows; None is left out.
+    Returns:
+        FolderPlan:         The sorted paths, the invalid names and the row count.
+    """
+    paths = set()
+    invalid = []
+    rows = 0
+    for name in names:
+        if name is None:
+            continue
+        rows += 1
+        parts = folder_parts(name)
+        if parts is None:
+            invalid.append(name)
+        elif parts:
+            paths.add(parts)
+    return FolderPlan(sorted(paths), invalid, rows)
+
+
+def walk_folders(paths: Iterable[tuple]) -> Iterator[tuple[tuple, bool]]:
+    """
+    Streams every folder to create for the sorted paths, parents first.
+    A parent shared by several paths comes once: each path is compared
+    with the one before it, and only the parts after their common prefix
+    are new.
+
+    Args:
+        paths (Iterable):   The sorted, unique paths as tuples of parts.
+    Returns:
+        Iterator:           (parts, requested) pairs; requested is False for parents only.
+    """
+    previous = ()
+    for parts in paths:
+        common = 0
+        for old, new in zip(previous, parts):
+            if old != new:
+                break
+            common += 1
+        for depth in range(common + 1, len(parts) + 1):
+            yield parts[:depth], depth == len(parts)
+        previous = parts
+
+
+def folder_parts(name) -> tuple | None:
+    """
+    Splits a folder path on either separator and drops empty and "." parts.
+
+    Returns:
+        tuple:  The parts, or None for an absolute path or one that leaves the directory.
+    """
+    text = str(name).strip()
+    if _SEPARATORS.match(text) or os.path.splitdrive(text)[0]:
+        return None
+    parts = tuple(part.strip() for part in _SEPARATORS.split(text))
+    parts = tuple(part for part in parts if part not in ("", "."))
+    if ".." in parts:
+        return None
+    return parts
+
+
+def _order(renames: dict) -> list:
+    """
+    Orders the moves so each one runs after the move that frees its name.
+    Every name is wanted by one move at most, so the moves form chains and
+    cycles; a cycle starts with a move to a temporary name.
+    """
+    names = list(renames)
+    frees = {}  # Name key -> move freeing it
+    for name in names:
+        frees.setdefault(_key(name), name)
+    first = {}  # Move -> the move that has to run before it
+    then = {}  # Move -> the move waiting for it
+    for name in names:
+        target = renames[name]
+        before = target if target in renames else frees.get(_key(target))
+        if before is not None and before != name:
+            first[name] = before
+            then[before] = name
+
+    chains = []
+    done = set()
+    for name in names:  # Chains, from the move whose name is free
+        if name in first:
+            continue
+        chain = []
+        while name is not None:
+            chain.append(Move(name, renames[name]))
+            done.add(name)
+            name = then.get(name)
+        chains.append(chain)
+
+    for name in names:  # What is left are cycles
+        if name in done:
+            continue
+        temp = os.path.join(os.path.dirname(name), f".rename-{uuid.uuid4().hex[:12]}")
+        chain = [Move(name, temp, temp=True)]
+        done.add(name)
+        current = then[name]
+        while current != name:
+            chain.append(Move(current, renames[current]))
+            done.add(current)
+            current = then[current]
+        chain.append(Move(temp, renames[name]))
+        chains.append(chain)
+    return chains
+
+
+def _free_name(target: str, entry_type: Type, claimed: dict, listings) -> str:
+    """
+    Returns "name (2)", "name (3)"... the first one that nothing has taken.
+    """
+    stem, ext = os.path.splitext(target) if entry_type == Type.FILE else (target, "")
+    number = 2
+    while True:
+        candidate = f"{stem} ({number}){ext}"
+        if _key(candidate) not in claimed and not listings.count(candidate):
+            return candidate
+        number += 1
+
+
+def _key(name: str) -> str:
+    return name.casefold()
+
+
+class _Listings:
+    """
+    The names in the directories the targets go to, each listed once.
+    """
+
+    def __init__(self, dir: str):
+        self.dir = dir
+        self._names = {}
+
+    def _listing(self, name: str) -> tuple:
+        parent = os.path.dirname(name)
+        listing = self._names.get(parent)
+        if listing is None:
+            try:
+                found = os.listdir(os.path.join(self.dir, parent))
+            except OSError:
+                found = []
+            prefix = parent + os.sep if parent else ""
+            listing = self._names[parent] = (set(prefix + name for name in found),
+                                             Counter(_key(prefix + name) for name in found))
+        return listing
+
+    def exists(self, name: str) -> bool:
+        return name in self._listing(name)[0]
+
+    def count(self, name: str) -> int:
+        """
+        Returns the number of names that match this one, ignoring case.
+        """
+        return self._listing(name)[1][_key(name)]
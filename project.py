@@ -1,21 +1,39 @@
+import argparse
 import os
-import action as act
+import re
 import sys
 
-from utils import Action, Type, Strings, clear_terminal
-from sheet import Sheet
-import entry
+from colorama import init
+from datetime import datetime
+from itertools import chain
+from utils import WORKERS, Action, Exit, Format, Type, Split, Strings, clear_terminal, lazy_import
+
+# Loaded on the paths that use them, so the first prompt shows at once
+act = lazy_import("action")
+classify = lazy_import("classify")
+duplicates = lazy_import("duplicates")
+entry = lazy_import("entry")
+index = lazy_import("index")
+journal = lazy_import("journal")
+rules = lazy_import("rules")
+snapshot = lazy_import("snapshot")
+spreadsheet = lazy_import("sheet")
 
 
 def main():
     """
-    This is the entry point of the program.
+    This is the entry point of the program. Without arguments it asks the
+    user what to do; with arguments it runs one batch command, see
+    parse_args(), and exits with its Exit code.
 
     Args:
 
     Returns:
         None
     """
+    init()  # Colored output on Windows consoles too
+    if len(sys.argv) > 1:
+        sys.exit(run(parse_args(sys.argv[1:])))
     try:
         update_directory()
     except (KeyboardInterrupt, EOFError):
@@ -111,7 +129,7 @@ def select_action_from_user(entry_type: Type) -> Action:
 
 
 def launch_sheet_window(action: Action,
-                        entry_type: Type) -> tuple[Sheet, str, list]:
+                        entry_type: Type) -> tuple["spreadsheet.Sheet", str, list]:
     """
     Opens a spreadsheet application from the user's computer.
 
@@ -124,7 +142,7 @@ def launch_sheet_window(action: Action,
         entries:    The file or folder items in the directory.
     """
     print()
-    sheet = Sheet()
+    sheet = spreadsheet.Sheet()
     input_dir = input(Strings.input_path).strip("'\"")
     if not os.path.isdir(input_dir):
         print(Strings.err_dir_not_found.format(dir=input_dir))
@@ -138,11 +156,18 @@ def launch_sheet_window(action: Action,
                              ).show()
             case Action.RENAME:
                 entries = entry.get_entries(type=entry_type,
-                                            dir=input_dir)
+                                            dir=input_dir,
+                                            count_limit=entry.FILE_COUNT_LIMIT,
+                                            workers=entry.SCAN_WORKERS,
+                                            snapshots=snapshot.Snapshots())
+                for name, error in getattr(entries, "errors", []):
+                    print(Strings.err_entry_skipped.format(name=name, err=error.strerror or error))
                 if len(entries) > 0:
                     sheet.rename(input_dir=input_dir,
                                  entries=entries,
-                                 headers=entry.header_rename(entry_type)
+                                 headers=entry.header_rename(entry_type),
+                                 page_size=spreadsheet.PAGE_SIZE,
+                                 split=Split.SHEETS  # One file to save before the changes are applied
                                  ).show()
                 else:
                     print(Strings.err_entries_not_found.format(dir=input_dir))
@@ -150,13 +175,13 @@ def launch_sheet_window(action: Action,
         return sheet, input_dir, entries
 
 
-def ask_to_save_changes(sheet: Sheet,
+def ask_to_save_changes(sheet: "spreadsheet.Sheet",
                         action: Action,
                         entry_type: Type,
                         input_dir: str,
                         entries: list):
     """
-    Asks the user to save the changes made in the spreadsheet.
+    Waits until the user saves the spreadsheet, then asks to apply the changes.
 
     Args:
         sheet:      The spreadsheet object.
@@ -167,6 +192,13 @@ def ask_to_save_changes(sheet: Sheet,
     Retruns:
         None
     """
+    print(Strings.wait_save)
+    try:
+        sheet.wait_for_save()
+    except KeyboardInterrupt:
+        print(Strings.err_rename_cancelled)
+        sheet.delete()
+        return
     while True:
         ans = input(Strings.input_save).lower()
         workbook = sheet.load()
@@ -175,13 +207,18 @@ def ask_to_save_changes(sheet: Sheet,
                 match action:
                     case Action.CREATE:
                         act.create(workbook=workbook,
-                                   input_dir=input_dir)
+                                   input_dir=input_dir,
+                                   workers=WORKERS)
                         break
                     case Action.RENAME:
+                        journal_path = journal.new_path()
                         act.rename(workbook=workbook,
                                    entry_dir=input_dir,
                                    entry_type=entry_type,
-                                   entries=entries)
+                                   entries=entries,
+                                   workers=WORKERS,
+                                   journal_path=journal_path)
+                        print(Strings.result_journal.format(path=journal_path))
                         break
                 break
             case "n" | "no":
@@ -207,5 +244,374 @@ def print_options(options):
     print()
 
 
+def parse_args(argv: list) -> argparse.Namespace:
+    """
+    Parses the arguments of a batch run, which never asks anything, opens
+    no spreadsheet application and does not wait:
+
+        sheet DIR -o FILE       Writes the rename sheet of DIR to FILE, to edit elsewhere.
+        rename DIR -m FILE      Renames as the edited sheet FILE says.
+        rename DIR --sub A B    Renames by rules, without a sheet; sheet DIR takes rules to fill it in.
+        create DIR -m FILE      Creates the folders FILE lists, or -t TEMPLATE expands to.
+        resume JOURNAL          Finishes an interrupted rename.
+        undo JOURNAL            Reverts a rename.
+        query --ext .pdf ...    Lists the indexed entries that match, or writes their sheet.
+
+    Args:
+        argv (list):        The arguments, without the program name.
+    Returns:
+        Namespace:          The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(prog="project.py", description="Create and rename files and folders in bulk.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = argparse.ArgumentParser(add_help=False)
+    scan.add_argument("dir", help="the directory of the files or folders")
+    scan.add_argument("--type", choices=["file", "folder"], default="file", help="the entries to manage")
+    scan.add_argument("--recursive", action="store_true", help="include the subfolders")
+    scan.add_argument("--max-depth", type=int, help="levels of subfolders to include")
+    scan.add_argument("--refresh", action="store_true", help="scan the whole directory, ignoring its snapshot")
+    scan.add_argument("--sniff", action="store_true", help="tell the file types from their first bytes too")
+    scan.add_argument("--scan-workers", type=int,
+                      help="stat calls to run at once, e.g. 32 on network drives (default: one after another)")
+
+    apply = argparse.ArgumentParser(add_help=False)
+    apply.add_argument("--dry-run", action="store_true", help="print the plan, change nothing")
+    apply.add_argument("--workers", type=int, default=WORKERS, help="operations to run at once")
+
+    renaming = argparse.ArgumentParser(add_help=False)
+    renaming.add_argument("--sub", nargs=2, metavar=("PATTERN", "REPLACEMENT"), dest="rules", action=RuleAction,
+                          help="rule: substitute a regular expression in the names")
+    renaming.add_argument("--ext", metavar="[OLD:]NEW", dest="rules", action=RuleAction,
+                          help="rule: swap the extension of the files, or only of the OLD ones")
+    renaming.add_argument("--date-prefix", nargs="?", const="%Y-%m-%d", metavar="FORMAT", dest="rules",
+                          action=RuleAction, help="rule: put the modification date before the names")
+    renaming.add_argument("--sequence", nargs="?", const="name", choices=["name", "size", "date_modified",
+                          "date_created"], dest="rules", action=RuleAction,
+                          help="rule: number the names in this order (default: by name)")
+
+    indexed = argparse.ArgumentParser(add_help=False)
+    indexed.add_argument("--index", nargs="?", const="",
+                         help="keep the scanned entries in this SQLite index (default: one in the user cache folder)")
+
+    mapping = argparse.ArgumentParser(add_help=False)
+    mapping.add_argument("--mapping", "-m", help="the edited sheet (.xlsx, .ods, .csv or .tsv)")
+    mapping.add_argument("--plain", action="store_true", help="the sheet has no instruction and header rows")
+
+    sheet = commands.add_parser("sheet", parents=[scan, renaming, indexed],
+                                help="write the rename sheet of a directory, filled in by the rules if given")
+    sheet.add_argument("--output", "-o", required=True, help="the sheet file; the extension sets the format")
+    sheet.add_argument("--page-size", type=int, help="rows per worksheet")
+    sheet.add_argument("--from-index", action="store_true", help="list the directory from the index, not the disk")
+    sheet.add_argument("--duplicates", action="store_true", help="add a Duplicate column grouping the same files")
+
+    rename = commands.add_parser("rename", parents=[scan, mapping, renaming, apply, indexed],
+                                 help="rename as an edited sheet or the rules say")
+    rename.add_argument("--suffix", action="store_true", help='rename to "name (2)" when a new name is taken')
+    rename.add_argument("--journal", help="the journal to write (default: a new one in the user cache folder)")
+    rename.add_argument("--no-journal", action="store_true", help="do not write a journal")
+
+    create = commands.add_parser("create", parents=[mapping, apply, indexed], help="create folders")
+    create.add_argument("dir", help="the directory to create the folders in")
+    create.add_argument("--template", "-t", action="append", default=[],
+                        help='folders to create, e.g. "Client_{001..500}/{raw,export}"')
+
+    for command in ("resume", "undo"):
+        journalled = commands.add_parser(command, help=f"{command} a rename from its journal")
+        journalled.add_argument("journal", help="the journal of the rename")
+        journalled.add_argument("--workers", type=int, default=WORKERS, help="operations to run at once")
+
+    query = commands.add_parser("query", parents=[indexed], help="find entries in the index")
+    query.add_argument("--type", choices=["file", "folder"], default="file", help="the entries to find")
+    query.add_argument("--under", help="only entries inside this directory, at any depth")
+    query.add_argument("--ext", help="the file extension, e.g. .pdf")
+    query.add_argument("--min-size", type=size, help="the smallest size, e.g. 100M")
+    query.add_argument("--max-size", type=size, help="the largest size")
+    query.add_argument("--since", type=timestamp, help="modified on or after this date, e.g. 2024-06-01")
+    query.add_argument("--until", type=timestamp, help="modified before this date")
+    query.add_argument("--output", "-o", help="write the rename sheet of the entries found (needs --under)")
+
+    args = parser.parse_args(argv)
+    for path in (getattr(args, "output", None), getattr(args, "mapping", None)):
+        if path is not None and os.path.splitext(path)[1][1:].lower() not in [format.value for format in Format]:
+            parser.error(f"'{path}' is not a .xlsx, .ods, .csv or .tsv file")
+    if args.command == "create" and not args.mapping and not args.template:
+        parser.error("create needs --mapping or --template")
+    if args.command == "rename" and not args.mapping and not args.rules:
+        parser.error("rename needs --mapping or rules")
+    if args.command == "rename" and args.mapping and args.rules:
+        parser.error("rename takes --mapping or rules, not both")
+    if args.command == "rename" and args.type == "folder" and (args.recursive or args.max_depth):
+        parser.error("rename --type folder renames one level; a renamed folder would move the folders in it")
+    if args.command == "rename" and args.journal and os.path.exists(args.journal):
+        parser.error(f"'{args.journal}' exists; the journal must be a new file")
+    if args.command == "query" and args.output and not args.under:
+        parser.error("query --output needs --under, the directory of the sheet")
+    return args
+
+
+class RuleAction(argparse.Action):
+    """
+    Compiles each rule option into a rules.Rule, keeping the order in
+    which they were given: that is the order they apply in.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        try:
+            match option_string:
+                case "--sub":
+                    rule = rules.Regex(*values)
+                case "--ext":
+                    old, _, new = values.rpartition(":")
+                    rule = rules.Extension(new, old=old or None)
+                case "--date-prefix":
+                    rule = rules.DatePrefix(values)
+                case _:
+                    rule = rules.Sequence(by=values)
+        except re.error as e:
+            raise argparse.ArgumentError(self, f"'{values[0]}' is not a regular expression: {e}")
+        setattr(namespace, self.dest, (getattr(namespace, self.dest) or []) + [rule])
+
+
+def size(text: str) -> int:
+    """
+    Returns:
+        int:    The bytes of a size argument such as 1500, 64K, 100M or 2G.
+    """
+    text = text.strip().upper().removesuffix("B")
+    factor = 1024 ** ("KMGT".index(text[-1]) + 1) if text and text[-1] in "KMGT" else 1
+    try:
+        return int(float(text[:-1] if factor > 1 else text) * factor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a size")
+
+
+def timestamp(text: str) -> float:
+    """
+    Returns:
+        float:  The seconds since the epoch of a date argument such as 2024-06-01.
+    """
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a date")
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    Runs one batch command.
+
+    Args:
+        args (Namespace):   The arguments from parse_args().
+    Returns:
+        int:                The Exit code.
+    """
+    if args.command in ("resume", "undo"):
+        if not os.path.isfile(args.journal):
+            print(Strings.err_dir_not_found.format(dir=args.journal))
+            return Exit.NOT_FOUND
+        replay = act.resume if args.command == "resume" else act.undo
+        return exit_code(replay(args.journal, workers=args.workers))
+    if args.command == "query":
+        return run_query(args)
+
+    if not os.path.isdir(args.dir):
+        print(Strings.err_dir_not_found.format(dir=args.dir))
+        return Exit.NOT_FOUND
+    if getattr(args, "mapping", None) and not os.path.isfile(args.mapping):
+        print(Strings.err_dir_not_found.format(dir=args.mapping))
+        return Exit.NOT_FOUND
+
+    match args.command:
+        case "sheet":
+            entry_type = Type(args.type.upper())
+            find_copies = args.duplicates and entry_type == Type.FILE
+            if (args.recursive or args.max_depth is not None) and not args.rules and not find_copies:
+                entries = walk_entries(args, entry_type)  # Written as it is walked, never held whole
+            else:
+                entries = scan_entries(args, entry_type)
+            renames = rules.Rules(args.rules).names(entries) if args.rules else None
+            copies = None
+            if find_copies:
+                copies = duplicates.Duplicates().find(entries)
+            write_sheet(args.output, args.dir, entries, entry_type, args.page_size, renames, copies)
+            return Exit.OK
+        case "rename":
+            entry_type = Type(args.type.upper())
+            entries = scan_entries(args, entry_type)
+            if args.rules:
+                workbook = rules.Rules(args.rules).rows(entries)
+            elif args.plain:
+                workbook = spreadsheet.Sheet.from_file(args.mapping, columns=(0, 1), first_row=1).load()
+            else:
+                columns = (0, len(entry.header_rename(entry_type)) - 1)
+                workbook = spreadsheet.Sheet.from_file(args.mapping, columns=columns).load()
+            journal_path = None if args.no_journal or args.dry_run else args.journal or journal.new_path()
+            outcome = act.rename(workbook=workbook,
+                                 entry_dir=args.dir,
+                                 entry_type=entry_type,
+                                 entries=entries,
+                                 suffix=args.suffix,
+                                 workers=args.workers,
+                                 journal_path=journal_path,
+                                 dry_run=args.dry_run)
+            if journal_path:
+                print(Strings.result_journal.format(path=journal_path))
+            if not args.dry_run and not args.recursive and args.max_depth is None:
+                update_index(args, entry_type)
+            return exit_code(outcome)
+        case "create":
+            rows = [(text,) for text in args.template]
+            if args.mapping:
+                sheet = spreadsheet.Sheet.from_file(args.mapping, columns=(0,), first_row=1 if args.plain else spreadsheet.ENTRY)
+                rows = chain(rows, sheet.load())
+            outcome = act.create(workbook=rows,
+                                 input_dir=args.dir,
+                                 workers=args.workers,
+                                 dry_run=args.dry_run)
+            if not args.dry_run:
+                update_index(args, Type.FOLDER)
+            return exit_code(outcome, existing_ok=True)
+
+
+def run_query(args: argparse.Namespace) -> int:
+    """
+    Prints the indexed entries that match the query, or writes their sheet.
+
+    Args:
+        args (Namespace):   The arguments from parse_args().
+    Returns:
+        int:                The Exit code.
+    """
+    path = args.index or index.default_path()
+    if not os.path.isfile(path):
+        print(Strings.err_dir_not_found.format(dir=path))
+        return Exit.NOT_FOUND
+    entry_type = Type(args.type.upper())
+    with index.Index(path) as entry_index:
+        entries = entry_index.query(type=entry_type,
+                                    under=args.under,
+                                    ext=args.ext,
+                                    min_size=args.min_size,
+                                    max_size=args.max_size,
+                                    modified_after=args.since,
+                                    modified_before=args.until,
+                                    count_limit=entry.FILE_COUNT_LIMIT)
+    if args.output:
+        write_sheet(args.output, args.under, entries, entry_type)
+    else:
+        for found in entries:
+            print(found.dir)
+    print(Strings.result_found.format(num=len(entries),
+                                      type="File(s)" if entry_type == Type.FILE else "Folder(s)"))
+    return Exit.OK
+
+
+def write_sheet(output: str, input_dir: str, entries, entry_type: Type, page_size: int = None,
+                renames: list = None, duplicates: list = None) -> None:
+    """
+    Writes the rename sheet of the entries to the output file, whose
+    extension sets the format, with the Rename and Duplicate columns filled
+    in if given.
+    """
+    output = os.path.abspath(output)
+    sheet = spreadsheet.Sheet(Format(os.path.splitext(output)[1][1:].lower()))
+    sheet.filepath, sheet.filename = os.path.dirname(output), output
+    sheet.rename(input_dir=input_dir,
+                 entries=entries,
+                 headers=entry.header_rename(entry_type, duplicates=duplicates is not None),
+                 page_size=page_size,
+                 renames=renames,
+                 duplicates=duplicates)
+
+
+def scan_entries(args: argparse.Namespace, entry_type: Type):
+    """
+    Lists the files or folders of a batch run, recursively if asked, and
+    reports the ones that could not be read.
+
+    Args:
+        args (Namespace):   The arguments from parse_args().
+        entry_type (Type):  The data type.
+    Returns:
+        EntryTable | list:  The entries.
+    """
+    if args.recursive or args.max_depth is not None:
+        return list(walk_entries(args, entry_type))
+    entries = None
+    if getattr(args, "from_index", False) and args.index is not None:
+        with index.Index(args.index or None) as entry_index:
+            entries = entry_index.entries(entry_type, args.dir, count_limit=entry.FILE_COUNT_LIMIT)
+    if entries is None:
+        entries = entry.get_entries(type=entry_type, dir=args.dir, count_limit=entry.FILE_COUNT_LIMIT,
+                                    workers=args.scan_workers, snapshots=snapshot.Snapshots(refresh=args.refresh))
+        if args.sniff and entry_type == Type.FILE:
+            classify.Classifier(sniff=True).classify(entries)
+        update_index(args, entry_type, entries)
+    for name, error in entries.errors:
+        print(Strings.err_entry_skipped.format(name=name, err=error.strerror or error))
+    return entries
+
+
+def walk_entries(args: argparse.Namespace, entry_type: Type):
+    """
+    Walks the directory tree of a recursive batch run, one folder at a time,
+    so a sheet can be written while the tree is still being scanned. The
+    entries that could not be read are reported once the walk is over.
+
+    Args:
+        args (Namespace):   The arguments from parse_args().
+        entry_type (Type):  The data type.
+    Returns:
+        Generator:          The File or Folder views.
+    """
+    errors = []
+    classifier = classify.Classifier(sniff=True) if args.sniff and entry_type == Type.FILE else None
+    table = None
+    for found in entry.iter_entries(type=entry_type, dir=args.dir, max_depth=args.max_depth,
+                                    count_limit=entry.FILE_COUNT_LIMIT, workers=args.scan_workers, errors=errors):
+        if classifier is not None and found.table is not table:  # One table per folder
+            table = found.table
+            classifier.classify(table)
+        yield found
+    for name, error in errors:
+        print(Strings.err_entry_skipped.format(name=name, err=error.strerror or error))
+
+
+def update_index(args: argparse.Namespace, entry_type: Type, entries=None) -> None:
+    """
+    Brings the index of the directory up to date, when the run keeps one.
+    Without entries, the directory is scanned again through its snapshot,
+    so after a rename or create only the changed names are stat-ed.
+
+    Args:
+        args (Namespace):       The arguments from parse_args().
+        entry_type (Type):      The data type.
+        entries (EntryTable):   A scan of the directory (None = scan it now).
+    """
+    if args.index is None:
+        return
+    if entries is None:
+        entries = entry.get_entries(type=entry_type, dir=args.dir, count_limit=entry.FILE_COUNT_LIMIT,
+                                    workers=getattr(args, "scan_workers", None), snapshots=snapshot.Snapshots())
+    with index.Index(args.index or None) as entry_index:
+        entry_index.update(entry_type, entries)
+
+
+def exit_code(outcome: "act.Outcome", existing_ok: bool = False) -> int:
+    """
+    Args:
+        outcome (Outcome):  What an action did.
+        existing_ok (bool): Skipped rows are fine, e.g. folders that exist.
+    Returns:
+        int:                The Exit code: FAILED, then SKIPPED, else OK.
+    """
+    if outcome.failed:
+        return Exit.FAILED
+    if outcome.skipped and not existing_ok:
+        return Exit.SKIPPED
+    return Exit.OK
+
+
 if __name__ == '__main__':
     main()
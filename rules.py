@@ -0,0 +1,195 @@
+import os
+import re
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, Iterator
+
+from entry import COLUMNS, EntryTable, Folder, KIND_FILE, KIND_FOLDER
+
+_SECONDS = ("%S", "%f", "%s", "%c", "%X", "%T")  # Directives finer than a minute
+
+
+class Rule(ABC):
+    """
+    One step of a rename chain. The rule is compiled once; bind() then
+    prepares it for a table, e.g. ranks the rows, and returns the function
+    that renames the name of one row.
+    """
+
+    @abstractmethod
+    def bind(self, entries: EntryTable):
+        """
+        Returns:
+            Callable:   The function of (name, row index) giving the new name.
+        """
+
+
+class Regex(Rule):
+    """
+    Substitutes a regular expression in the name, as re.sub does:
+    Regex(r"\\s+", "_") turns "My File.txt" into "My_File.txt".
+    """
+
+    def __init__(self, pattern: str, replacement: str, flags: int = 0, count: int = 0):
+        self.pattern = re.compile(pattern, flags)
+        self.replacement = replacement
+        self.count = count
+
+    def bind(self, entries: EntryTable):
+        sub, replacement, count = self.pattern.sub, self.replacement, self.count
+        return lambda name, index: sub(replacement, name, count)
+
+
+class Extension(Rule):
+    """
+    Swaps the extension of files: Extension(".jpeg", old=".jpg") renames
+    "a.JPG" to "a.jpeg". Without old, every extension is swapped; an empty
+    new extension removes it. Folders keep their names.
+    """
+
+    def __init__(self, new: str, old: str = None):
+        self.new = _dotted(new)
+        self.old = None if old is None else _dotted(old).casefold()
+
+    def bind(self, entries: EntryTable):
+        kinds, new, old = entries.kinds, self.new, self.old
+
+        def apply(name, index):
+            if kinds[index] == KIND_FOLDER:
+                return name
+            stem, ext = os.path.splitext(name)
+            if old is not None and ext.casefold() != old:
+                return name
+            return stem + new
+
+        return apply
+
+
+class DatePrefix(Rule):
+    """
+    Puts the date of the entry before its name, e.g. "2024-01-31_report.pdf".
+    The date comes from the raw stat column, formatted once per minute.
+    """
+
+    def __init__(self, format: str = "%Y-%m-%d", key: str = "date_modified", separator: str = "_"):
+        if key not in ("date_modified", "date_created"):
+            raise ValueError(key)
+        self.format = format
+        self.key = key
+        self.separator = separator
+
+    def bind(self, entries: EntryTable):
+        times = getattr(entries, COLUMNS[self.key][0])
+        format, separator = self.format, self.separator
+        if any(directive in format for directive in _SECONDS):
+            return lambda name, index: datetime.fromtimestamp(times[index]).strftime(format) + separator + name
+        return lambda name, index: _format_minute(format, int(times[index] // 60)) + separator + name
+
+
+class Sequence(Rule):
+    """
+    Numbers the entries after their name and before the extension, e.g.
+    "photo_001.jpg", in the order of a column. The width is that of the
+    last number unless given.
+    """
+
+    def __init__(self,
+                 start: int = 1,
+                 step: int = 1,
+                 width: int = None,
+                 by: str = "name",
+                 reverse: bool = False,
+                 separator: str = "_",
+                 prefix: bool = False):
+        if by != "name" and by not in COLUMNS:
+            raise ValueError(by)
+        self.start = start
+        self.step = step
+        self.width = width
+        self.by = by
+        self.reverse = reverse
+        self.separator = separator
+        self.prefix = prefix
+
+    def bind(self, entries: EntryTable):
+        values = entries.names if self.by == "name" else getattr(entries, COLUMNS[self.by][0])
+        ranks = [0] * len(values)
+        for rank, index in enumerate(sorted(range(len(values)), key=values.__getitem__, reverse=self.reverse)):
+            ranks[index] = rank
+        start, step, separator, prefix, kinds = self.start, self.step, self.separator, self.prefix, entries.kinds
+        width = self.width or len(str(start + step * max(len(values) - 1, 0)))
+
+        def apply(name, index):
+            number = f"{start + ranks[index] * step:0{width}d}"
+            if prefix:
+                return number + separator + name
+            stem, ext = (name, "") if kinds[index] == KIND_FOLDER else os.path.splitext(name)
+            return stem + separator + number + ext
+
+        return apply
+
+
+class Rules:
+    """
+    A chain of rename rules, applied in order to every entry of a table.
+    Only the last part of a name is renamed, so entries of a recursive
+    scan stay in their folders.
+    """
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules = list(rules)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def names(self, entries) -> list[str]:
+        """
+        Computes the new names in one pass over the table.
+
+        Args:
+            entries (EntryTable):   The files or folders (a list of entries also works).
+        Returns:
+            list:                   The new name of each row, in table order; "" when it does not change.
+        """
+        entries = _table(entries)
+        steps = [rule.bind(entries) for rule in self.rules]
+        renames = []
+        for index, name in enumerate(entries.names):
+            folder, base = os.path.split(name)
+            new = base
+            for step in steps:
+                new = step(new, index)
+            renames.append("" if new == base else os.path.join(folder, new))
+        return renames
+
+    def rows(self, entries) -> Iterator[tuple[str, str]]:
+        """
+        Returns:
+            Iterator:   The (name, rename) rows of the names that change, as action.rename takes them.
+        """
+        entries = _table(entries)
+        for name, new in zip(entries.names, self.names(entries)):
+            if new:
+                yield name, new
+
+
+def _table(entries) -> EntryTable:
+    """
+    Returns the table, or gathers the raw values of a list of entries into one.
+    """
+    if isinstance(entries, EntryTable):
+        return entries
+    return EntryTable.from_rows("", ((view.name, KIND_FOLDER if isinstance(view, Folder) else KIND_FILE, view.size,
+                                      view.date_modified, view.date_created, view.table.inodes[view.index], None)
+                                     for view in entries))
+
+
+def _dotted(ext: str) -> str:
+    return "" if not ext else "." + ext.lstrip(".")
+
+
+@lru_cache(maxsize=4096)
+def _format_minute(format: str, minute: int) -> str:
+    return datetime.fromtimestamp(minute * 60).strftime(format)
@@ -1,119 +1,143 @@
-import utils
-import openpyxl
+import delimited
+import enum
+import ods
 import os
-import time
 import uuid
-
-from utils import Strings, Colors
-from openpyxl import utils, Workbook
-from openpyxl.styles import Font, Alignment, Side, Border
-from openpyxl.styles.fills import PatternFill
+import xlsx
+
+from utils import Strings, Colors, Format, Split
+from entry import format_rows
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain, islice
+from delimited import CsvWriter, TsvWriter
+from ods import OdsWriter
+from xlsx import XlsxWriter, CellStyle, column_letter
+from watcher import Watcher
 from platform import system
 from subprocess import Popen
-from typing import Self
+from typing import Iterator, Self
 
 INSTRUCTION = 1
 HEADER = 2
 ENTRY = 3
+PAGE_SIZE = 50000  # Rows per workbook the spreadsheet apps still open quickly
 
 
 class Sheet:
 
-    def __init__(self):
+    def __init__(self, format: Format = None):
         """
         Initialize sheet object.
 
         Args:
-            self:   The instance of this class.
+            self:               The instance of this class.
+            format (Format):    The file format (None = the platform default).
         Return
             None
         """
-        self.filename = str(uuid.uuid4()) + ".xlsx"
+        self.format = format or default_format()
+        self.filename = str(uuid.uuid4()) + "." + self.format.value
         self.filepath = os.getcwd()
+        self.filenames = [self.filename]  # Every shard, when the sheet is split into workbooks
+        self.columns = None  # Columns load() returns, set when the sheet is written
+        self.first_row = ENTRY  # First row load() returns
+        self._watcher = None
+
+    @classmethod
+    def from_file(cls, path: str, columns: tuple = None, first_row: int = ENTRY) -> Self:
+        """
+        Opens a sheet file that was edited elsewhere, e.g. by a script in a
+        batch run, so that load() can read it. The format comes from the
+        file extension.
+
+        Args:
+            path (str):         The sheet file.
+            columns (tuple):    The columns load() returns (None = whole rows).
+            first_row (int):    The first row to load; 1 for a file without instructions and headers.
+        Returns:
+            Self:               A sheet for the file.
+        """
+        sheet = cls(Format(os.path.splitext(path)[1][1:].lower()))
+        sheet.filepath, sheet.filename = os.path.split(os.path.abspath(path))
+        sheet.filenames = [sheet.filename]
+        sheet.columns = columns
+        sheet.first_row = first_row
+        return sheet
 
     def rename(self,
                input_dir: str,
                entries: list,
-               headers: list
+               headers: list,
+               page_size: int = None,
+               split: Split = None,
+               workers: int = None,
+               renames: list = None,
+               duplicates: list = None
                ) -> Self:
         """
         This opens a spreadsheet for renaming files or folders.
 
+        With a page size, the entries are split into pages of that many rows,
+        each with its own instructions and headers: worksheets of one workbook,
+        or workbooks of their own, written in parallel. CSV and TSV files hold
+        a single table, so their pages are always workbooks. With renames,
+        e.g. computed by rules.Rules, the Rename column is filled in for review;
+        with duplicates, from duplicates.Duplicates, so is the Duplicate column.
+
         Args:
-            self:               The instance of this class.
-            input_dir (str):    The user-defined directory of the files and folders.
-            entries (list):     The list of files of folders to manage.
-            headers (list):     The headers of the spreadsheet.
+            self:                   The instance of this class.
+            input_dir (str):        The user-defined directory of the files and folders.
+            entries (EntryTable):   The files or folders to manage.
+            headers (list):         The headers of the spreadsheet.
+            page_size (int):        The rows per page (None = a single page).
+            split (Split):          Pages as worksheets or workbooks (None = worksheets).
+            workers (int):          The processes writing workbooks (None = one per CPU).
+            renames (list):         The new name of each entry, in entry order (None = an empty column).
+            duplicates (list):      The Duplicate cell of each entry, in entry order (None = no column).
         Returns:
-            Self:               The instance of this class.
+            Self:                   The instance of this class.
         """
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = Strings.spreadsheet_name
-
-        headers_len = len(headers)
-
-        # Row 1 = add instructions
-        sheet.merge_cells(f"A1:{utils.get_column_letter(headers_len)}1")
-        cell = sheet["A1"]
-        cell.value = Strings.instructions_rename.format(
-            working_dir=input_dir,
-            filename=self.filename,
-            filename_dir=self.filepath)
-        cell.font = Font(
-            name=font,
-            color=Colors.gray_dark,
-            italic=True)
-        cell.alignment = Alignment(
-            horizontal="left",
-            vertical="center")
-        sheet.row_dimensions[INSTRUCTION].height = 100
-
-        # Row 2 = add header names
-        for col, header in enumerate(headers, start=1):  # Start at column 1 since there is no 0
-            cell = sheet.cell(row=HEADER, column=col)
-            cell.value = header
-            cell.font = Font(
-                name=font,
-                color=Colors.white)
-            cell.alignment = Alignment(
-                horizontal="center",
-                vertical="center")
-            cell.border = border_style
-            cell.fill = PatternFill(
-                fgColor=Colors.blue_dodger,
-                fill_type="solid")
-            sheet.column_dimensions[utils.get_column_letter(col)].width = 25
-        sheet.row_dimensions[HEADER].height = 26
-
-        # Row 3 = add data
-        for row, entry in enumerate(entries, start=ENTRY):
-            for col, value in enumerate(entry.values(), start=1):  # Start at column 1 since there is no 0
-
-                if col == 1:  # Name
-                    font_color = Colors.gray_dark
-                    horizontal_alignment = "left"
-                elif col == headers_len:  # Rename
-                    font_color = Colors.purple
-                    horizontal_alignment = "left"
-                else:  # Details
-                    font_color = Colors.gray_dark_medium
-                    horizontal_alignment = "right"
-
-                cell = sheet.cell(row=row, column=col)
-                cell.value = value
-                cell.font = Font(
-                    name=font,
-                    color=font_color)
-                cell.alignment = Alignment(
-                    horizontal=horizontal_alignment,
-                    vertical="center"
-                )
-                cell.border = border_style
-                cell.number_format = "@"  # Format cells as a string
-
-        # Save the spreadsheet
-        workbook.save(self.filename)
+        self.columns = (0, headers.index(Strings.rename))  # Name and Rename
+        instructions = partial(Strings.instructions_rename.format,
+                               working_dir=input_dir,
+                               filename_dir=self.filepath)
+        rows = format_rows(entries)
+        if renames is not None:
+            rows = (values[:-1] + [new] for values, new in zip(rows, renames))
+        if duplicates is not None:
+            rows = (values + [cell] for values, cell in zip(rows, duplicates))
+
+        if page_size is None:
+            self.filenames = [self.filename]
+            _write_rename(self.format, self.filename, instructions(filename=self.filename), headers, [rows])
+            return self
+
+        pages = _pages(rows, page_size)
+        first, second = next(pages), next(pages, None)
+        pages = chain([first], [] if second is None else chain([second], pages))
+        if second is None or (split is not Split.WORKBOOKS and self.format not in (Format.CSV, Format.TSV)):
+            self.filenames = [self.filename]
+            _write_rename(self.format, self.filename, instructions(filename=self.filename), headers, pages)
+            return self
+
+        # One workbook per page; a page is sent to a worker process as plain
+        # string rows, and only a few pages are in flight at a time
+        root, ext = os.path.splitext(self.filename)
+        self.filenames = []
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for number, page in enumerate(pages, start=1):
+                filename = f"{root}_{number}{ext}"
+                self.filenames.append(filename)
+                pending.append(pool.submit(_write_rename, self.format, filename,
+                                           instructions(filename=filename), headers, [page]))
+                if len(pending) > 2 * workers:
+                    pending.popleft().result()
+            for future in pending:
+                future.result()
         return self
 
     def create(self,
@@ -129,112 +153,239 @@ class Sheet:
         Returns:
             Self:               The instance of this class.
         """
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = Strings.spreadsheet_name
-
-        sheet.column_dimensions["A"].width = 67
-
-        # Row 1 = add instructions
-        sheet.row_dimensions[INSTRUCTION].height = 100
-        cell_instruction = sheet["A1"]
-        cell_instruction.value = Strings.instructions_create.format(
-            working_dir=input_dir,
-            filename=self.filename,
-            filename_dir=self.filepath)
-        cell_instruction.font = Font(
-            name=font,
-            color=Colors.gray_dark,
-            italic=True)
-        cell_instruction.alignment = Alignment(
-            horizontal="left",
-            vertical="center")
-
-        # Row 2 = add header names
-        sheet.row_dimensions[HEADER].height = 25
-        cell_header = sheet["A2"]
-        cell_header.value = headers[0]
-        cell_header.font = Font(
-            name=font,
-            color=Colors.white)
-        cell_header.alignment = Alignment(
-            horizontal="center",
-            vertical="center")
-        cell_header.border = border_style
-        cell_header.fill = PatternFill(
-            fgColor=Colors.blue_dodger,
-            fill_type="solid")
-
-        for row in range(ENTRY, 12):  # Initial empty rows
-            cell = sheet.cell(row, 1)
-            cell.value = ""
-            cell.font = Font(
-                name=font,
-                color=Colors.purple)
-            cell.border = border_style
-            cell.number_format = "@"  # Format cells as a string
-
-        workbook.save(self.filename)
+        self.columns = (0,)  # Folder Name
+        self.filenames = [self.filename]
+
+        with WRITERS[self.format](self.filename) as workbook:
+            workbook.add_sheet(Strings.spreadsheet_name, widths=[67])
+            styles = workbook.styles(STYLES)
+
+            # Row 1 = add instructions
+            workbook.append([Strings.instructions_create.format(
+                working_dir=input_dir,
+                filename=self.filename,
+                filename_dir=self.filepath)],
+                [styles[Role.INSTRUCTION]],
+                height=100)
+
+            # Row 2 = add header names
+            workbook.append(headers[:1], [styles[Role.HEADER]], height=25)
+
+            for _ in range(ENTRY, 12):  # Initial empty rows
+                workbook.append([""], [styles[Role.RENAME]])
         return self
 
     def show(self) -> Self:
         """
-        Opens an application for this spreadsheet.
+        Opens an application for this spreadsheet. The files are watched
+        from here on, so that wait_for_save() sees even a quick save.
 
         Args:
             self:   The instance of this class.
         Returns:
             Self:   the instance of this class.
         """
-        file_name = self.filename
-        match system():
-            case "Darwin":
-                Popen(["open", file_name])  # macOS
-            case "Linux":
-                Popen(["libreoffice", file_name])
-            case "Windows":
-                Popen(["excel.exe", file_name])
-            case _:
-                print("Please open the spreadsheet manually.")
-                return self
+        self._watcher = Watcher(self.paths())
+        for file_name in self.filenames:
+            match system():
+                case "Darwin":
+                    Popen(["open", file_name])  # macOS
+                case "Linux":
+                    Popen(["libreoffice", file_name])
+                case "Windows":
+                    Popen(["excel.exe", file_name])
+                case _:
+                    print("Please open the spreadsheet manually.")
+                    return self
 
         print(Strings.init_sheet)
-        time.sleep(3)  # Set delay for opening application
         return self
 
-    def load(self) -> Workbook:
+    def wait_for_save(self, timeout: float = None) -> str | None:
+        """
+        Blocks until the user saves the spreadsheet, or one of its files,
+        and the write is over, so that load() never reads a stale or a
+        half-written file.
+
+        Args:
+            self:               The instance of this class.
+            timeout (float):    Seconds to wait at most (None = no limit).
+        Returns:
+            str:                The saved file, or None when the time ran out.
+        """
+        if self._watcher is None:
+            self._watcher = Watcher(self.paths())
+        try:
+            return self._watcher.wait(timeout)
+        finally:
+            self._watcher.close()
+            self._watcher = None
+
+    def paths(self) -> list[str]:
+        """
+        Returns:
+            list:   The full path of every file of this spreadsheet.
+        """
+        return [os.path.join(self.filepath, filename) for filename in self.filenames]
+
+    def load(self) -> Iterator[tuple]:
         """
         Loads the saved spreadsheet file.
 
+        The workbook is opened read-only and streamed: only the name and
+        rename columns are returned, rows without a value in the last of
+        them are skipped, and the file is closed once the rows run out.
+        The edits of every page and workbook come out as one stream.
+
         Args:
             self:       The instance of this class.
         Returns:
-            Workbook:   The spreadsheet object.
+            Iterator:   The (name, rename) or (name,) value rows.
         """
-        row_start = ENTRY  # Data starts at row 3
-        file_path = os.path.join(self.filepath, self.filename)
-        workbook = openpyxl.load_workbook(file_path, data_only=True)
-        return workbook.active.iter_rows(values_only=True, min_row=row_start)
+        max_col = None if self.columns is None else self.columns[-1] + 1
+        rows = chain.from_iterable(
+            READERS[self.format](os.path.join(self.filepath, filename), min_row=self.first_row, max_col=max_col)
+            for filename in self.filenames)
+        return _edited_rows(rows, self.columns)
 
     def delete(self) -> None:
         """
-        Deletes the saved spreadsheet file.
+        Deletes the saved spreadsheet files.
 
         Args:
             self:   The instance of this class.
         Returns:
             None
         """
-        file_path = os.path.join(self.filepath, self.filename)
-        try:
-            os.remove(file_path)
-        except FileNotFoundError:
-            print(f"Folder '{file_path}' not found.")
+        for filename in self.filenames:
+            file_path = os.path.join(self.filepath, filename)
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                print(f"Folder '{file_path}' not found.")
+
+
+def default_format() -> Format:
+    """
+    Returns:
+        Format:     ODS on Linux, where LibreOffice opens it natively, otherwise XLSX.
+    """
+    return Format.ODS if system() == "Linux" else Format.XLSX
+
+
+def _write_rename(format: Format, filename: str, instructions: str, headers: list, pages) -> str:
+    """
+    Writes a rename workbook with one worksheet per page of rows. Module
+    level, so that worker processes can run it.
+    """
+    headers_len = len(headers)
+    # Rows are streamed to disk as they come, so memory stays flat
+    with WRITERS[format](filename) as workbook:
+        styles = workbook.styles(STYLES)
+        row_styles = [styles[Role.NAME]] + [styles[Role.RENAME] if header == Strings.rename else styles[Role.DETAIL]
+                                            for header in headers[1:]]
+        for number, rows in enumerate(pages, start=1):
+            title = Strings.spreadsheet_name if number == 1 else f"{Strings.spreadsheet_name} {number}"
+            workbook.add_sheet(title,
+                               widths=[25] * headers_len,
+                               merged=[f"A1:{column_letter(headers_len)}1"])
+
+            # Row 1 = add instructions
+            workbook.append([instructions], [styles[Role.INSTRUCTION]], height=100)
+
+            # Row 2 = add header names
+            workbook.append(headers, [styles[Role.HEADER]] * headers_len, height=26)
+
+            # Row 3 = add data, one row at a time
+            for values in rows:
+                workbook.append(values, row_styles)
+    return filename
+
+
+def _pages(rows, page_size: int):
+    """
+    Splits the rows into lists of page_size rows; there is always one page.
+    """
+    rows = iter(rows)
+    page = list(islice(rows, page_size))
+    yield page
+    while page := list(islice(rows, page_size)):
+        yield page
+
+
+def _edited_rows(rows, columns):
+    """
+    Keeps the name and rename columns of the rows that have a new value.
+    """
+    if columns is None:  # Unknown layout, return whole rows
+        yield from rows
+        return
+    last = columns[-1]
+    for row in rows:
+        if len(row) > last and row[last] not in (None, ""):
+            yield tuple(row[col] for col in columns)
 
 
-border_style = Border(left=Side(style="thin", color=Colors.gray_light),
-                      right=Side(style="thin", color=Colors.gray_light),
-                      top=Side(style="thin", color=Colors.gray_light),
-                      bottom=Side(style="thin", color=Colors.gray_light))
-
 font = "Verdana"
+
+
+class Role(enum.Enum):
+    INSTRUCTION = "INSTRUCTION"
+    HEADER = "HEADER"
+    NAME = "NAME"
+    DETAIL = "DETAIL"
+    RENAME = "RENAME"
+
+
+# Sheet backends: each writer streams rows, each reader yields value tuples
+WRITERS = {
+    Format.XLSX: XlsxWriter,
+    Format.ODS: OdsWriter,
+    Format.CSV: CsvWriter,
+    Format.TSV: TsvWriter,
+}
+READERS = {
+    Format.XLSX: xlsx.read_rows,
+    Format.ODS: ods.read_rows,
+    Format.CSV: delimited.read_rows,
+    Format.TSV: partial(delimited.read_rows, delimiter="\t"),
+}
+
+# Style registry: the only cell styles the sheets use, built once per process
+# and looked up by role
+STYLES = {
+    Role.INSTRUCTION: CellStyle(
+        font_name=font,
+        font_color=Colors.gray_dark,
+        italic=True,
+        horizontal="left",
+        vertical="center"),
+    Role.HEADER: CellStyle(
+        font_name=font,
+        font_color=Colors.white,
+        horizontal="center",
+        vertical="center",
+        border_color=Colors.gray_light,
+        fill_color=Colors.blue_dodger),
+    Role.NAME: CellStyle(
+        font_name=font,
+        font_color=Colors.gray_dark,
+        horizontal="left",
+        vertical="center",
+        border_color=Colors.gray_light,
+        number_format="@"),  # Format cells as a string
+    Role.DETAIL: CellStyle(
+        font_name=font,
+        font_color=Colors.gray_dark_medium,
+        horizontal="right",
+        vertical="center",
+        border_color=Colors.gray_light,
+        number_format="@"),
+    Role.RENAME: CellStyle(
+        font_name=font,
+        font_color=Colors.purple,
+        horizontal="left",
+        vertical="center",
+        border_color=Colors.gray_light,
+        number_format="@"),
+}
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import time
+
+from array import array
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import entry
+from utils import Type, cache_path, load_cache, save_cache
+
+VERSION = 4
+RACY_NS = 2_000_000_000  # A directory changed this close to its scan may change again unseen
+
+# The stat values a snapshot keeps of a row, read by EntryTable.append as a stat result
+_Row = namedtuple("_Row", ["st_size", "st_mtime", "st_ctime", "st_ino"])
+
+
+class Snapshots:
+    """
+    Remembers the listing of each scanned directory, so scanning it again
+    costs next to nothing.
+
+    A snapshot holds the names, inodes, sizes and times of the entries, and
+    the mtime of the directory itself. Adding, removing or renaming an entry
+    changes that mtime, so while it is unchanged the snapshot is the
+    listing and the directory is not read at all. Once it has changed, the
+    directory is listed again, but only the entries with a new name or inode
+    are stat-ed; a file saved through a temporary file gets a new inode.
+
+    Folders and symlinks are stat-ed on every listing, since their times
+    move with what they point at, and a directory holding symlinks is
+    always listed. A file rewritten in place keeps its name and inode and
+    leaves the directory mtime alone, so its new size shows up on a refresh
+    only, as does a directory changed within RACY_NS of its last scan.
+    """
+
+    def __init__(self, cache_dir: str = None, refresh: bool = False):
+        self.cache_dir = cache_dir or default_dir()
+        self.refresh = refresh
+
+    def scan(self, type: Type, dir: str, count_limit=None, workers=None) -> entry.EntryTable:
+        """
+        Lists the directory as entry.get_entries does, through its snapshot.
+
+        Args:
+            type (Type):        The data type to list.
+            dir (str):          The directory to scan.
+            count_limit (int):  Cap for the lazy folder file count.
+            workers (int):      Number of stat threads (None = stat one after another).
+        Returns:
+            EntryTable:         The files or folders, in directory order.
+        """
+        path = self.path(type, dir)
+        stat = os.stat(dir)
+        scanned_ns = time.time_ns()
+        snapshot = None if self.refresh else _load(path, type, dir, stat)
+        if snapshot is not None and stat.st_mtime_ns == snapshot["mtime_ns"] \
+                and snapshot["scanned_ns"] - snapshot["mtime_ns"] >= RACY_NS and not snapshot["links"]:
+            return _table(snapshot, type, dir, count_limit)
+
+        entries, links = _list(type, dir, snapshot, count_limit, workers)
+        if not entries.errors:  # A missing entry would be missing from every scan after
+            save_cache(path, {
+                "dir": os.path.abspath(dir),
+                "type": type.value,
+                "device": stat.st_dev,
+                "inode": stat.st_ino,
+                "mtime_ns": stat.st_mtime_ns,
+                "scanned_ns": scanned_ns,
+                "links": links,
+                "names": entries.names,
+                "inodes": entries.inodes,
+                "sizes": entries.sizes,
+                "mtimes": entries.mtimes,
+                "ctimes": entries.ctimes,
+            }, VERSION)
+        return entries
+
+    def path(self, type: Type, dir: str) -> str:
+        """
+        Returns:
+            str:    The snapshot file of the directory and data type.
+        """
+        key = f"{os.path.abspath(dir)}\0{type.value}".encode("utf-8", "surrogateescape")
+        return os.path.join(self.cache_dir, hashlib.sha1(key).hexdigest() + ".snapshot")
+
+
+def default_dir() -> str:
+    """
+    Returns:
+        str:    The snapshot folder, in the user cache folder of the platform.
+    """
+    return cache_path("snapshots")
+
+
+def _list(type: Type, dir: str, snapshot: dict | None, count_limit=None, workers=None) -> tuple:
+    """
+    Lists the directory, reusing the rows of the snapshot whose name and
+    inode are unchanged and stat-ing the rest.
+
+    Returns:
+        tuple:  The entries, and whether the directory holds symlinks.
+    """
+    known = {} if snapshot is None else {name: index for index, name in enumerate(snapshot["names"])}
+    folders = type == Type.FOLDER
+    links = False
+    matches = []
+    stats = []  # The snapshot row of each match, None to stat it
+    with os.scandir(dir) as it:
+        for dir_entry in it:
+            if not entry._matches(type, dir_entry):
+                continue
+            link = dir_entry.is_symlink()
+            links = links or link
+            index = known.get(dir_entry.name)
+            if index is not None and not folders and not link and snapshot["inodes"][index] == dir_entry.inode():
+                stats.append(_Row(snapshot["sizes"][index], snapshot["mtimes"][index],
+                                  snapshot["ctimes"][index], snapshot["inodes"][index]))
+            else:
+                stats.append(None)
+            matches.append(dir_entry)
+
+    changed = [dir_entry for dir_entry, stat in zip(matches, stats) if stat is None]
+    if workers and changed:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fresh = list(pool.map(entry._stat, changed))
+    else:
+        fresh = [entry._stat(dir_entry) for dir_entry in changed]
+    fresh = iter(fresh)
+    stats = [next(fresh) if stat is None else stat for stat in stats]
+
+    entries = entry.EntryTable(dir, count_limit=count_limit)
+    entry._append_stats(entries, entry.KIND_FOLDER if folders else entry.KIND_FILE, "", zip(matches, stats))
+    return entries, links
+
+
+def _table(snapshot: dict, type: Type, dir: str, count_limit=None) -> entry.EntryTable:
+    entries = entry.EntryTable(dir, count_limit=count_limit)
+    entries.names = list(snapshot["names"])
+    entries.sizes = array("q", snapshot["sizes"])
+    entries.mtimes = array("d", snapshot["mtimes"])
+    entries.ctimes = array("d", snapshot["ctimes"])
+    entries.inodes = array("Q", snapshot["inodes"])
+    entries.kinds = array("b", [entry.KIND_FOLDER if type == Type.FOLDER else entry.KIND_FILE]) * len(entries.names)
+    return entries
+
+
+def _load(path: str, type: Type, dir: str, stat) -> dict | None:
+    """
+    Returns:
+        dict:   The snapshot, or None when there is none or it is not of this directory.
+    """
+    snapshot = load_cache(path, VERSION)
+    if not isinstance(snapshot, dict):
+        return None
+    if (snapshot["dir"], snapshot["type"]) != (os.path.abspath(dir), type.value):
+        return None
+    if (snapshot["device"], snapshot["inode"]) != (stat.st_dev, stat.st_ino):
+        return None  # Another directory now has the path
+    return snapshot
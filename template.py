@@ -0,0 +1,164 @@
+import re
+
+from typing import Iterator
+
+_NUMBERS = re.compile(r"^(-?\d+)\.\.(-?\d+)(?:\.\.(-?\d+))?$")
+_LETTERS = re.compile(r"^([a-zA-Z])\.\.([a-zA-Z])(?:\.\.(-?\d+))?$")
+
+
+class Range:
+    """
+    A {first..last..step} range of numbers or letters, generated on demand.
+    Numbers keep the width of a zero-padded end, as in {001..500}.
+    """
+
+    def __init__(self, first, last, step, width=0, letters=False):
+        self.first = first
+        self.last = last
+        self.step = abs(step) or 1
+        self.width = width
+        self.letters = letters
+
+    def __iter__(self) -> Iterator[str]:
+        step = self.step if self.last >= self.first else -self.step
+        for value in range(self.first, self.last + (1 if step > 0 else -1), step):
+            yield chr(value) if self.letters else f"{value:0{self.width}d}"
+
+    def __len__(self) -> int:
+        return abs(self.last - self.first) // self.step + 1
+
+
+def expand(template: str) -> Iterator[str]:
+    """
+    Lazily expands the braces of a template, as a shell does:
+    "Client_{001..500}/{raw,processed,export}" gives "Client_001/raw",
+    "Client_001/processed" and so on. Only the current path is held in
+    memory, however many paths the template makes. A brace without a
+    comma or a range is kept as it is.
+
+    Args:
+        template (str):     The template.
+    Returns:
+        Iterator:           The paths, the leftmost brace changing slowest.
+    """
+    return _expand(_parse(template), 0)
+
+
+def count(template: str) -> int:
+    """
+    Returns:
+        int:    The number of paths the template expands to, without expanding it.
+    """
+    return _count(_parse(template))
+
+
+def is_template(text) -> bool:
+    """
+    Returns:
+        bool:   True when the text has a brace that expands.
+    """
+    return isinstance(text, str) and "{" in text and any(not isinstance(node, str) for node in _parse(text))
+
+
+def _parse(text: str) -> list:
+    """
+    Parses a template into nodes: strings, Ranges and lists of
+    alternatives, each of which is a list of nodes again.
+    """
+    nodes = []
+    literal = []
+    i = 0
+    while i < len(text):
+        if text[i] == "{":
+            end = _closing(text, i)
+            if end is not None:
+                node = _group(text[i + 1:end])
+                if node is not None:
+                    if literal:
+                        nodes.append("".join(literal))
+                        literal = []
+                    nodes.append(node)
+                    i = end + 1
+                    continue
+        literal.append(text[i])
+        i += 1
+    if literal:
+        nodes.append("".join(literal))
+    return nodes
+
+
+def _closing(text: str, start: int) -> int | None:
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def _group(body: str):
+    match = _NUMBERS.match(body)
+    if match:
+        first, last, step = match.groups()
+        padded = any(len(end.lstrip("-")) > 1 and end.lstrip("-").startswith("0") for end in (first, last))
+        width = max(len(first), len(last)) if padded else 0
+        return Range(int(first), int(last), int(step or 1), width)
+    match = _LETTERS.match(body)
+    if match:
+        first, last, step = match.groups()
+        return Range(ord(first), ord(last), int(step or 1), letters=True)
+    alternatives = _split(body)
+    if len(alternatives) < 2:
+        return None
+    return [_parse(alternative) for alternative in alternatives]
+
+
+def _split(body: str) -> list:
+    """
+    Splits on the commas that are not inside a nested brace.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(body):
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(body[start:i])
+            start = i + 1
+    parts.append(body[start:])
+    return parts
+
+
+def _expand(nodes: list, index: int) -> Iterator[str]:
+    if index == len(nodes):
+        yield ""
+        return
+    for head in _options(nodes[index]):
+        for tail in _expand(nodes, index + 1):
+            yield head + tail
+
+
+def _options(node) -> Iterator[str]:
+    if isinstance(node, str):
+        yield node
+    elif isinstance(node, Range):
+        yield from node
+    else:
+        for alternative in node:
+            yield from _expand(alternative, 0)
+
+
+def _count(nodes: list) -> int:
+    total = 1
+    for node in nodes:
+        if isinstance(node, Range):
+            total *= len(node)
+        elif isinstance(node, list):
+            total *= sum(_count(alternative) for alternative in node)
+    return total
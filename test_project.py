@@ -1,4 +1,8 @@
+import os
+import shutil
+import tempfile
 import unittest
+from datetime import datetime
 from io import StringIO
 from typing import AnyStr
 from unittest.mock import Mock, \
@@ -9,12 +13,32 @@ from project import launch_sheet_window, \
     ask_to_save_changes, \
     print_options
 from utils import Action, \
+    Format, \
+    Split, \
     Strings, \
     Type
+import entry
 
 
 class TestProject(unittest.TestCase):
 
+    #
+    # --> Module: import project
+    #
+    def test_import_is_light(self):
+        """
+        --> Test: importing the program, or listing a directory by name, loads no spreadsheet, NumPy,
+        SQLite or process pool code.
+        """
+        import subprocess
+        import sys
+        heavy = ["openpyxl.workbook", "numpy.linalg", "sqlite3", "concurrent.futures.process", "xlsx"]
+        for run in ("", "project.entry.get_entries(project.Type.FILE, '.'); "):
+            script = f"import project, sys; {run}print([name for name in {heavy!r} if name in sys.modules])"
+            result = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    capture_output=True, text=True, check=True)
+            self.assertEqual(result.stdout.strip(), "[]")
+
     #
     # --> Method: print_options(options)
     #
@@ -315,12 +339,13 @@ class TestProject(unittest.TestCase):
         Initializing spreadsheet...
         """
         mock_isdir.return_value = True
-        mock_get_entries.return_value = []
+        mock_get_entries.return_value = [Mock()]
         mock_sheet_rename.return_value = Mock()
         mock_sheet_rename.return_value.show = mock_sheet_show
         result = launch_sheet_window(action=Action.RENAME,
                                      entry_type=AnyStr)
         self.assertIsInstance(result, tuple)
+        self.assertEqual(mock_sheet_rename.call_args.kwargs["split"], Split.SHEETS)
 
     @patch("sys.exit")
     @patch("builtins.print")
@@ -631,3 +656,861 @@ class TestProject(unittest.TestCase):
         mock_sheet_load.assert_called_once()
         mock_action_rename.assert_called_once()
         mock_sheet_delete.assert_called_once()
+
+
+class TempDirTestCase(unittest.TestCase):
+    """
+    A test case with a temporary folder, self.tmp, removed after each test.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+
+class TestEntry(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = self.tmp.name
+        for name, content in (("b.txt", "hello"), ("a.pdf", ""), (".hidden", "")):
+            with open(os.path.join(self.dir, name), "w") as f:
+                f.write(content)
+        os.mkdir(os.path.join(self.dir, "folder"))
+
+    #
+    # --> Method: get_entries(type, dir)
+    #
+    def test_get_entries_files(self):
+        """
+        Test: files are listed from one scandir pass, sorted, without hidden entries.
+        """
+        entries = entry.get_entries(Type.FILE, self.dir)
+        self.assertEqual([e.name for e in entries], ["a.pdf", "b.txt"])
+        self.assertEqual(entries[1].dir, os.path.join(self.dir, "b.txt"))
+        self.assertEqual(entries[1].size, 5)
+        self.assertEqual([e.type for e in entries], [e.values()[4] for e in entries])  # The Type column
+
+    def test_get_entries_folders(self):
+        """
+        Test: only folders are listed for Type.FOLDER.
+        """
+        entries = entry.get_entries(Type.FOLDER, self.dir)
+        self.assertEqual([e.name for e in entries], ["folder"])
+
+    def test_folder_file_count_lazy(self):
+        """
+        Test: the folder file count is computed on first values() call and capped.
+        """
+        folder_dir = os.path.join(self.dir, "folder")
+        for i in range(5):
+            open(os.path.join(folder_dir, f"{i}.txt"), "w").close()
+        folder = entry.Folder.from_path(folder_dir, count_limit=3)
+        self.assertIsNone(folder.table.file_counts)
+        self.assertEqual(folder.values()[2], "3+")
+        self.assertEqual(entry.Folder.from_path(folder_dir).values()[2], "5")
+        self.assertEqual(entry.count_entries(folder_dir, limit=3), 4)
+
+    def test_get_entries_sort_by_size(self):
+        """
+        Test: sorting by size compares the raw byte counts.
+        """
+        entries = entry.get_entries(Type.FILE, self.dir, sort_by="size", reverse=True)
+        self.assertEqual([e.name for e in entries], ["b.txt", "a.pdf"])
+        self.assertEqual(entries[0].values()[3], "5 B")
+
+    def test_format_date_memoized(self):
+        """
+        Test: timestamps within the same minute share one cached string.
+        """
+        entry._format_minute.cache_clear()
+        first = entry.format_date(1_700_000_000)
+        self.assertEqual(first, entry.format_date(1_700_000_010))
+        self.assertEqual(entry._format_minute.cache_info().hits, 1)
+
+    def test_entry_table_sort_filter_aggregate(self):
+        """
+        Test: the columnar table sorts, filters and aggregates on raw values.
+        """
+        table = entry.get_entries(Type.FILE, self.dir)
+        self.assertIsInstance(table, entry.EntryTable)
+        self.assertEqual([e.name for e in table.sort(by="size")], ["a.pdf", "b.txt"])
+        self.assertEqual([e.name for e in table.where(min_size=1)], ["b.txt"])
+        self.assertEqual([e.name for e in table.filter([True, False])], ["a.pdf"])
+        self.assertEqual(table.aggregate("size"), 5)
+        self.assertEqual(entry.path_map(table), {"a.pdf": os.path.join(self.dir, "a.pdf"),
+                                                 "b.txt": os.path.join(self.dir, "b.txt")})
+
+    def test_entry_table_sort_reverse_ties(self):
+        """
+        Test: a descending sort keeps tied rows in table order, with and without NumPy.
+        """
+        table = entry.EntryTable(self.dir)
+        for name, size in (("a", 5), ("b", 7), ("c", 5), ("d", 7), ("e", 1)):
+            table.names.append(name)
+            table.sizes.append(size)
+            table.mtimes.append(0)
+            table.ctimes.append(0)
+            table.kinds.append(entry.KIND_FILE)
+            table.inodes.append(0)
+        expected = ["b", "d", "a", "c", "e"]
+        self.assertEqual(table.sort(by="size", reverse=True).names, expected)
+        with patch("entry.numpy", None):
+            self.assertEqual(table.sort(by="size", reverse=True).names, expected)
+
+    def test_get_entries_workers(self):
+        """
+        Test: the thread-pooled scan returns the same sorted rows and records stat failures.
+        """
+        sequential = entry.get_entries(Type.FILE, self.dir)
+        pooled = entry.get_entries(Type.FILE, self.dir, workers=4)
+        self.assertEqual(pooled.names, sequential.names)
+        self.assertEqual(list(pooled.sizes), list(sequential.sizes))
+
+        error = FileNotFoundError(2, "No such file or directory")
+        with patch("entry._stat", side_effect=lambda d: error if d.name == "a.pdf" else d.stat()):
+            pooled = entry.get_entries(Type.FILE, self.dir, workers=4)
+        self.assertEqual(pooled.names, ["b.txt"])
+        self.assertEqual(pooled.errors, [("a.pdf", error)])
+
+    def test_iter_entries_recursive(self):
+        """
+        Test: the recursive walk yields relative names, honors max_depth and survives symlink loops.
+        """
+        nested = os.path.join(self.dir, "folder", "nested")
+        os.mkdir(nested)
+        open(os.path.join(nested, "c.txt"), "w").close()
+        os.symlink(self.dir, os.path.join(nested, "loop"))
+        names = [e.name for e in entry.iter_entries(Type.FILE, self.dir)]
+        self.assertEqual(names, ["a.pdf", "b.txt", os.path.join("folder", "nested", "c.txt")])
+        names = [e.name for e in entry.iter_entries(Type.FOLDER, self.dir, max_depth=1)]
+        self.assertEqual(names, ["folder", os.path.join("folder", "nested")])
+
+    def test_get_entries_snapshot(self):
+        """
+        Test: an unchanged directory is neither listed nor stat-ed, a changed one only stats what
+        changed, and a refresh stats everything; each gives the rows of a full scan.
+        """
+        from snapshot import Snapshots
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache = cache_dir.name
+
+        def settle():  # Not changed right before the scan
+            past = os.stat(self.dir).st_mtime_ns - 10_000_000_000
+            os.utime(self.dir, ns=(past, past))
+
+        def same_as_full_scan(table):
+            full = entry.get_entries(Type.FILE, self.dir)
+            self.assertEqual((table.names, table.sizes, table.mtimes, table.ctimes, table.inodes),
+                             (full.names, full.sizes, full.mtimes, full.ctimes, full.inodes))
+
+        stated = []
+        stat = lambda dir_entry: stated.append(dir_entry.name) or dir_entry.stat()
+        settle()
+        same_as_full_scan(entry.get_entries(Type.FILE, self.dir, snapshots=Snapshots(cache)))
+        with patch("os.scandir", side_effect=AssertionError("the directory was listed")), \
+                patch("entry._stat", side_effect=AssertionError("an entry was stat-ed")):
+            table = entry.get_entries(Type.FILE, self.dir, snapshots=Snapshots(cache))
+        same_as_full_scan(table)
+
+        with open(os.path.join(self.dir, "c.txt"), "w") as f:
+            f.write("new")
+        with open(os.path.join(self.dir, "b.tmp"), "w") as f:
+            f.write("saved again")
+        os.replace(os.path.join(self.dir, "b.tmp"), os.path.join(self.dir, "b.txt"))
+        os.remove(os.path.join(self.dir, "a.pdf"))
+        with patch("entry._stat", side_effect=stat):
+            table = entry.get_entries(Type.FILE, self.dir, snapshots=Snapshots(cache))
+        same_as_full_scan(table)
+        self.assertEqual(sorted(stated), ["b.txt", "c.txt"])
+
+        stated.clear()
+        with patch("entry._stat", side_effect=stat):
+            entry.get_entries(Type.FILE, self.dir, snapshots=Snapshots(cache))
+            self.assertEqual(stated, [])
+            same_as_full_scan(entry.get_entries(Type.FILE, self.dir, snapshots=Snapshots(cache, refresh=True)))
+        self.assertEqual(sorted(stated), ["b.txt", "b.txt", "c.txt", "c.txt"])  # The refresh and the full scan
+
+        os.symlink(os.path.join(self.dir, "c.txt"), os.path.join(self.dir, "link.txt"))
+        settle()
+        entry.get_entries(Type.FILE, self.dir, snapshots=Snapshots(cache))
+        stated.clear()
+        with patch("entry._stat", side_effect=stat):
+            entry.get_entries(Type.FILE, self.dir, snapshots=Snapshots(cache))
+        self.assertEqual(stated, ["link.txt"])  # A symlink target may change without the directory
+
+
+class TestSheet(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = self.tmp.name
+        for name in ("a & b.txt", " spaced .txt"):
+            open(os.path.join(self.dir, name), "w").close()
+
+    #
+    # --> Method: Sheet.rename(input_dir, entries, headers)
+    #
+    @patch("os.getcwd")
+    def test_rename_streamed_workbook(self, mock_getcwd):
+        """
+        Test: the streamed workbook keeps the instruction and header rows and reads back every name.
+        """
+        import openpyxl
+        from sheet import Sheet
+        mock_getcwd.return_value = self.dir
+        sheet = Sheet(Format.XLSX)
+        sheet.filename = os.path.join(self.dir, sheet.filename)
+        entries = entry.get_entries(Type.FILE, self.dir)
+        sheet.rename(input_dir=self.dir, entries=entries, headers=entry.header_rename(Type.FILE))
+        worksheet = openpyxl.load_workbook(sheet.filename).active
+        self.assertEqual(worksheet.title, Strings.spreadsheet_name)
+        self.assertIn("A1:F1", worksheet.merged_cells)
+        self.assertTrue(worksheet["A1"].font.i)
+        self.assertEqual([c.value for c in worksheet[2]], entry.header_rename(Type.FILE))
+        self.assertEqual([worksheet.cell(row, 1).value for row in (3, 4)], [" spaced .txt", "a & b.txt"])
+        self.assertIsNone(worksheet["F3"].value)
+
+    #
+    # --> Method: Sheet.load()
+    #
+    def test_load_edited_rows_only(self):
+        """
+        Test: load streams (name, rename) pairs and skips rows without a new name.
+        """
+        import openpyxl
+        from sheet import Sheet
+        sheet = Sheet(Format.XLSX)
+        sheet.filepath = self.dir
+        sheet.filename = os.path.join(self.dir, sheet.filename)
+        entries = entry.get_entries(Type.FILE, self.dir)
+        sheet.rename(input_dir=self.dir, entries=entries, headers=entry.header_rename(Type.FILE))
+        workbook = openpyxl.load_workbook(sheet.filename)  # Edit and save like a spreadsheet app
+        workbook.active["F4"] = "c.txt"
+        workbook.save(sheet.filename)
+        self.assertEqual(list(sheet.load()), [("a & b.txt", "c.txt")])
+
+    def test_backends_round_trip(self):
+        """
+        Test: every backend writes the same layout and load() returns the same edited rows.
+        """
+        from sheet import Sheet, WRITERS
+        entries = entry.get_entries(Type.FILE, self.dir)
+        for format in WRITERS:
+            with self.subTest(format=format):
+                sheet = Sheet(format)
+                sheet.filename = os.path.join(self.dir, sheet.filename)
+                sheet.rename(input_dir=self.dir, entries=[], headers=entry.header_rename(Type.FILE))
+                with WRITERS[format](sheet.filename) as workbook:
+                    workbook.add_sheet("Sheet", merged=["A1:F1"])
+                    workbook.append(["Instructions"], [0])
+                    workbook.append(entry.header_rename(Type.FILE), [0] * 6)
+                    for values in entry.format_rows(entries):
+                        workbook.append(values[:-1] + ["  new  name.txt"], [0] * 6)
+                    workbook.append(["c.txt", "", "", "", "", ""], [0] * 6)
+                self.assertEqual(list(sheet.load()), [(" spaced .txt", "  new  name.txt"),
+                                                      ("a & b.txt", "  new  name.txt")])
+
+    def test_rename_pages_merge_on_load(self):
+        """
+        Test: pages split into worksheets or workbooks all load back as one stream of edits.
+        """
+        import openpyxl
+        from sheet import Sheet
+        entries = entry.get_entries(Type.FILE, self.dir)
+        headers = entry.header_rename(Type.FILE)
+        for split, files in ((Split.SHEETS, 1), (Split.WORKBOOKS, 2)):
+            with self.subTest(split=split):
+                sheet = Sheet(Format.XLSX)
+                sheet.filepath = self.dir
+                sheet.filename = os.path.join(self.dir, sheet.filename)
+                sheet.rename(input_dir=self.dir, entries=entries, headers=headers,
+                             page_size=1, split=split, workers=2)
+                self.assertEqual(len(sheet.filenames), files)
+                workbook = openpyxl.load_workbook(sheet.filenames[-1])  # Edit the last page
+                worksheet = workbook.worksheets[-1]
+                self.assertEqual(worksheet["A2"].value, headers[0])
+                self.assertEqual(worksheet["A3"].value, "a & b.txt")
+                worksheet["F3"] = "c.txt"
+                workbook.save(sheet.filenames[-1])
+                self.assertEqual(list(sheet.load()), [("a & b.txt", "c.txt")])
+                sheet.delete()
+                self.assertFalse(any(name.endswith(".xlsx") for name in os.listdir(self.dir)))
+
+
+class TestPlanner(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = self.tmp.name
+        for name in ("a.txt", "b.txt", "c.txt", "d.txt"):
+            with open(os.path.join(self.dir, name), "w") as f:
+                f.write(name)
+        self.entries = entry.get_entries(Type.FILE, self.dir)
+
+    def contents(self):
+        return {name: open(os.path.join(self.dir, name)).read() for name in sorted(os.listdir(self.dir))}
+
+    #
+    # --> Function: planner.plan(rows, entries, dir)
+    #
+    def test_plan_swap_and_chain(self):
+        """
+        Test: a swap goes through a temporary name and a chain runs from its end.
+        """
+        import action as act
+        import planner
+        rows = [("a.txt", "b.txt"), ("b.txt", "a.txt"), ("c.txt", "d.txt"), ("d.txt", "e.txt")]
+        plan = planner.plan(rows, self.entries, self.dir)
+        self.assertEqual(plan.skipped, [])
+        self.assertEqual(len(plan), 4)
+        self.assertEqual(len(plan.moves), 5)
+        sources = [move.source for move in plan.moves]
+        self.assertLess(sources.index("d.txt"), sources.index("c.txt"))
+        with patch("sys.stdout", new_callable=StringIO):
+            outcome = act.rename(rows, self.dir, Type.FILE, self.entries)
+        self.assertEqual(outcome, (4, 0, 0))
+        self.assertEqual(self.contents(), {"a.txt": "b.txt", "b.txt": "a.txt", "d.txt": "c.txt", "e.txt": "d.txt"})
+
+    def test_plan_conflicts(self):
+        """
+        Test: existing, duplicate and case-only clashes are skipped, and a skipped row keeps its name taken.
+        """
+        import planner
+        from utils import Conflict
+        rows = [("a.txt", "c.txt"), ("b.txt", "x.txt"), ("c.txt", "X.TXT"), ("d.txt", "x.txt")]
+        plan = planner.plan(rows, self.entries, self.dir)
+        self.assertEqual(plan.skipped, [planner.Skip("c.txt", "X.TXT", Conflict.CASE),
+                                        planner.Skip("d.txt", "x.txt", Conflict.DUPLICATE),
+                                        planner.Skip("a.txt", "c.txt", Conflict.EXISTS)])
+        self.assertEqual(plan.moves, [planner.Move("b.txt", "x.txt")])
+
+    def test_plan_suffix(self):
+        """
+        Test: with suffix, taken names get the first free "name (n)".
+        """
+        import planner
+        open(os.path.join(self.dir, "e (2).txt"), "w").close()
+        rows = [("a.txt", "e.txt"), ("b.txt", "e.txt"), ("c.txt", "d.txt")]
+        plan = planner.plan(rows, self.entries, self.dir, suffix=True)
+        self.assertEqual(plan.skipped, [])
+        self.assertEqual(sorted(m.target for m in plan.moves), ["d (2).txt", "e (3).txt", "e.txt"])
+
+    #
+    # --> Function: action.rename(..., workers) / action.create(..., workers)
+    #
+    def test_actions_with_workers(self):
+        """
+        Test: renaming and creating on a pool gives the same result and counts as one at a time.
+        """
+        import action as act
+        rows = [("a.txt", "b.txt"), ("b.txt", "a.txt"), ("c.txt", "c.txt"), ("d.txt", "c.txt")]
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            outcome = act.rename(rows, self.dir, Type.FILE, self.entries, workers=4)
+            self.assertEqual(outcome, (2, 1, 0))
+            self.assertIn(Strings.err_file_exists.format(name="c.txt"), stdout.getvalue())
+            self.assertEqual(self.contents(), {"a.txt": "b.txt", "b.txt": "a.txt", "c.txt": "c.txt", "d.txt": "d.txt"})
+            outcome = act.create([("x",), (os.path.join("x", "y"),), ("x",), (None,)], self.dir, workers=4)
+        self.assertEqual(outcome, (2, 0, 0))
+        self.assertTrue(os.path.isdir(os.path.join(self.dir, "x", "y")))
+
+    #
+    # --> Functions: action.rename(..., journal_path), action.resume(path), action.undo(path)
+    #
+    def test_journal_resume_and_undo(self):
+        """
+        Test: an interrupted run resumes from its journal and a finished one is undone.
+        """
+        import action as act
+        import journal
+        import planner
+        original = self.contents()
+        rows = [("a.txt", "b.txt"), ("b.txt", "a.txt"), ("c.txt", "e.txt")]
+        path = journal.new_path(self.dir + "_journal")
+        os.mkdir(os.path.dirname(path))
+        self.addCleanup(lambda: [os.remove(path), os.rmdir(os.path.dirname(path))])
+        plan = planner.plan(rows, self.entries, self.dir)
+        journal.Journal.start(path, self.dir, Type.FILE, plan.chains).close()
+        first = plan.chains[0][0]
+        os.rename(plan.path(first.source), plan.path(first.target))  # Crash before the marker is written
+        with patch("sys.stdout", new_callable=StringIO):
+            self.assertEqual(act.resume(path), (len(plan) - (not first.temp), 0, 0))
+            self.assertEqual(self.contents(), {"a.txt": "b.txt", "b.txt": "a.txt", "d.txt": "d.txt", "e.txt": "c.txt"})
+            self.assertEqual(len(journal.read(path).done), len(plan.moves))
+            self.assertEqual(act.undo(path), (3, 0, 0))
+            self.assertEqual(self.contents(), original)
+            self.assertEqual(act.undo(path), (0, 0, 0))  # Nothing left to undo
+
+    def test_journal_resume_lost_markers(self):
+        """
+        Test: a swap and a chain that finished before their markers reached the disk are not run again.
+        """
+        import action as act
+        import journal
+        import planner
+        rows = [("a.txt", "b.txt"), ("b.txt", "a.txt"), ("c.txt", "d.txt"), ("d.txt", "e.txt")]
+        path = journal.new_path(self.dir + "_journal")
+        os.mkdir(os.path.dirname(path))
+        self.addCleanup(lambda: shutil.rmtree(os.path.dirname(path)))
+        plan = planner.plan(rows, self.entries, self.dir)
+        with journal.Journal.start(path, self.dir, Type.FILE, plan.chains) as run_journal:
+            for move in plan.moves:
+                os.rename(plan.path(move.source), plan.path(move.target))
+            cycle = next(chain for chain in plan.chains if chain[0].temp)
+            run_journal.mark(cycle[0], sync=True)  # The only marker synced before the crash
+        renamed = {"a.txt": "b.txt", "b.txt": "a.txt", "d.txt": "c.txt", "e.txt": "d.txt"}
+        self.assertEqual(self.contents(), renamed)
+        with patch("sys.stdout", new_callable=StringIO):
+            self.assertEqual(act.resume(path), (0, 0, 0))
+        self.assertEqual(self.contents(), renamed)
+        self.assertEqual(len(journal.read(path).done), len(plan.moves))
+        with self.assertRaises(FileExistsError):  # A journal is never written twice
+            journal.Journal.start(path, self.dir, Type.FILE, plan.chains)
+
+    #
+    # --> Function: journal.new_path()
+    #
+    def test_journal_default_folder_keeps_last(self):
+        """
+        Test: new journals go to the user cache folder, which keeps only the newest KEEP of them.
+        """
+        import journal
+        cache = self.dir + "_cache"
+        self.addCleanup(lambda: shutil.rmtree(cache, ignore_errors=True))
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": cache}), patch("journal.KEEP", 3):
+            names = []
+            for second in range(5):
+                with patch("time.strftime", return_value=f"rename-20240101-12000{second}-"):
+                    path = journal.new_path()
+                open(path, "w").close()
+                names.append(os.path.basename(path))
+            self.assertEqual(os.path.dirname(path), os.path.join(cache, "directory-management", "journals"))
+            self.assertEqual(sorted(os.listdir(os.path.dirname(path))), names[-3:])
+
+    #
+    # --> Functions: action.rename(..., dry_run=True), action.create(..., dry_run=True)
+    #
+    def test_dry_run_changes_nothing(self):
+        """
+        Test: a dry run prints the plan, counts and timings and leaves the directory alone.
+        """
+        import action as act
+        original = self.contents()
+        rows = [("a.txt", "b.txt"), ("b.txt", "a.txt"), ("c.txt", "d.txt")]
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            self.assertEqual(act.rename(iter(rows), self.dir, Type.FILE, self.entries, dry_run=True), (2, 1, 0))
+            self.assertEqual(act.create([("new",), ("new",), ("a.txt",)], self.dir, dry_run=True), (1, 1, 0))
+        output = stdout.getvalue()
+        self.assertIn(Strings.dry_run_rename.format(old="a.txt", new="b.txt"), output)
+        self.assertIn(Strings.dry_run_rename.format(old="b.txt", new="a.txt"), output)
+        self.assertIn(Strings.dry_run_skip.format(old="c.txt", new="d.txt", reason=Strings.reason_exists), output)
+        self.assertIn(Strings.dry_run_create.format(name="new"), output)
+        self.assertIn("apply (estimate)", output)
+        self.assertEqual(self.contents(), original)
+
+    #
+    # --> Functions: planner.plan_folders(names), planner.walk_folders(paths), action.create(...)
+    #
+    def test_create_nested_deduped(self):
+        """
+        Test: folder paths are deduped, parents are created once and first, and bad paths fail.
+        """
+        import action as act
+        import planner
+        names = ["2024/Q1/invoices", "2024/Q1", "2024\\Q2", " 2024/Q1/invoices ", "../out", None, "a.txt/x"]
+        folder_plan = planner.plan_folders(names)
+        self.assertEqual(folder_plan.invalid, ["../out"])
+        self.assertEqual(folder_plan.rows, 6)
+        self.assertEqual(list(planner.walk_folders(folder_plan.paths)),
+                         [(("2024",), False), (("2024", "Q1"), True), (("2024", "Q1", "invoices"), True),
+                          (("2024", "Q2"), True), (("a.txt",), False), (("a.txt", "x"), True)])
+        for workers in (None, 4):
+            with self.subTest(workers=workers), patch("sys.stdout", new_callable=StringIO):
+                outcome = act.create([(name,) for name in names], self.dir, workers=workers)
+                self.assertEqual(outcome, (4, 0, 3) if workers is None else (0, 3, 3))
+        self.assertTrue(os.path.isdir(os.path.join(self.dir, "2024", "Q1", "invoices")))
+
+    #
+    # --> Functions: template.expand(text), template.count(text), action.create(...) with templates
+    #
+    def test_create_from_template(self):
+        """
+        Test: a template row expands lazily, zero-padded and nested, into the folders it names.
+        """
+        import action as act
+        import template
+        self.assertEqual(list(template.expand("C_{08..10}/{raw,out{1,2}}"))[:4],
+                         ["C_08/raw", "C_08/out1", "C_08/out2", "C_09/raw"])
+        self.assertEqual(template.count("Client_{001..500}/{raw,processed,export}"), 1500)
+        self.assertEqual(list(template.expand("{a..e..2}{x}")), ["a{x}", "c{x}", "e{x}"])
+        self.assertFalse(template.is_template("plain {name}"))
+        rows = [("Client_{1..3}/{raw,export}",), ("Client_1",), ("../{a,b}",)]
+        for workers in (None, 4):
+            with self.subTest(workers=workers), patch("sys.stdout", new_callable=StringIO):
+                outcome = act.create(rows, self.dir, workers=workers)
+                self.assertEqual(outcome, (9, 0, 2) if workers is None else (0, 7, 2))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir, "Client_2"))), ["export", "raw"])
+
+
+class TestBatch(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = os.path.join(self.tmp.name, "dir")
+        os.mkdir(self.dir)
+        for name in ("a.txt", "b.txt"):
+            open(os.path.join(self.dir, name), "w").close()
+        self.cache = patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache")})
+        self.cache.start()
+        self.addCleanup(self.cache.stop)
+
+    def batch(self, *argv):
+        from project import parse_args, run
+        with patch("sys.stdout", new_callable=StringIO):
+            return run(parse_args(list(argv)))
+
+    #
+    # --> Functions: parse_args(argv), run(args)
+    #
+    def test_batch_sheet_then_rename(self):
+        """
+        Test: a sheet written in batch, edited by a script, renames with a journal and undoes.
+        """
+        import csv
+        from utils import Exit
+        mapping = os.path.join(self.tmp.name, "rename.csv")
+        journal_path = os.path.join(self.tmp.name, "rename.journal")
+        self.assertEqual(self.batch("sheet", self.dir, "-o", mapping, "--scan-workers", "4"), Exit.OK)
+        with open(mapping, newline="", encoding="utf-8-sig") as file:
+            rows = list(csv.reader(file))
+        rows[2][-1], rows[3][-1] = "b.txt", "a.txt"  # Swap
+        with open(mapping, "w", newline="", encoding="utf-8-sig") as file:
+            csv.writer(file).writerows(rows)
+        self.assertEqual(self.batch("rename", self.dir, "-m", mapping, "--dry-run"), Exit.OK)
+        self.assertFalse(os.path.exists(journal_path))
+        self.assertEqual(self.batch("rename", self.dir, "-m", mapping, "--journal", journal_path), Exit.OK)
+        self.assertEqual(self.batch("undo", journal_path), Exit.OK)
+        self.assertEqual(sorted(os.listdir(self.dir)), ["a.txt", "b.txt"])
+
+    def test_batch_sheet_recursive_streams(self):
+        """
+        Test: a recursive sheet is written from the walk itself, without first listing the tree.
+        """
+        import csv
+        from utils import Exit
+        os.mkdir(os.path.join(self.dir, "sub"))
+        open(os.path.join(self.dir, "sub", "c.txt"), "w").close()
+        output = os.path.join(self.tmp.name, "tree.csv")
+        with patch("project.scan_entries", side_effect=AssertionError("the tree was listed first")):
+            self.assertEqual(self.batch("sheet", self.dir, "--recursive", "-o", output), Exit.OK)
+        with open(output, newline="", encoding="utf-8-sig") as file:
+            names = [row[0] for row in csv.reader(file)]
+        self.assertEqual(names[-3:], ["a.txt", "b.txt", os.path.join("sub", "c.txt")])
+
+    def test_batch_exit_codes(self):
+        """
+        Test: plain mappings, templates and missing paths give their exit codes.
+        """
+        from utils import Exit
+        mapping = os.path.join(self.tmp.name, "plain.tsv")
+        with open(mapping, "w") as file:
+            file.write("a.txt\tb.txt\n")
+        self.assertEqual(self.batch("rename", self.dir, "-m", mapping, "--plain", "--no-journal"), Exit.SKIPPED)
+        self.assertEqual(self.batch("create", self.dir, "-t", "x_{1..3}", "-t", "a.txt"), Exit.FAILED)
+        self.assertEqual(self.batch("create", self.dir, "-t", "x_{1..3}"), Exit.OK)
+        self.assertEqual(self.batch("resume", os.path.join(self.tmp.name, "missing.journal")), Exit.NOT_FOUND)
+        self.assertEqual(self.batch("create", os.path.join(self.tmp.name, "missing"), "-t", "x"), Exit.NOT_FOUND)
+        with patch("sys.stderr", new_callable=StringIO), self.assertRaises(SystemExit) as raised:
+            self.batch("create", self.dir)
+        self.assertEqual(raised.exception.code, Exit.USAGE)
+        with patch("sys.stderr", new_callable=StringIO), self.assertRaises(SystemExit) as raised:
+            self.batch("rename", self.dir, "-m", mapping, "--plain", "--journal", mapping)  # Never written over
+        self.assertEqual(raised.exception.code, Exit.USAGE)
+        with patch("sys.stderr", new_callable=StringIO), self.assertRaises(SystemExit) as raised:
+            self.batch("rename", self.dir, "-m", mapping, "--type", "folder", "--recursive")  # Parents move children
+        self.assertEqual(raised.exception.code, Exit.USAGE)
+
+
+class TestIndex(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = os.path.join(self.tmp.name, "client")
+        os.makedirs(os.path.join(self.dir, "archive"))
+        for name, size in (("report.PDF", 2000), ("notes.txt", 10), (os.path.join("archive", "old.pdf"), 5000)):
+            with open(os.path.join(self.dir, name), "wb") as f:
+                f.write(b"x" * size)
+        self.path = os.path.join(self.tmp.name, "index.sqlite3")
+
+    #
+    # --> Class: index.Index(path)
+    #
+    def test_index_update_list_and_query(self):
+        """
+        Test: the index lists a directory as its scan did, writes only what changed and answers filtered queries.
+        """
+        from index import Index
+        with Index(self.path) as entry_index:
+            self.assertIsNone(entry_index.entries(Type.FILE, self.dir))
+            scan = entry.get_entries(Type.FILE, self.dir)
+            self.assertEqual(entry_index.update(Type.FILE, scan), 2)
+            archive = entry.get_entries(Type.FILE, os.path.join(self.dir, "archive"))
+            self.assertEqual(entry_index.update(Type.FILE, archive), 1)
+            listed = entry_index.entries(Type.FILE, self.dir)
+            self.assertEqual((listed.names, listed.sizes, listed.mtimes, listed.inodes),
+                             (scan.names, scan.sizes, scan.mtimes, scan.inodes))
+            self.assertEqual(list(listed.rows()), list(scan.rows()))
+
+            os.rename(os.path.join(self.dir, "notes.txt"), os.path.join(self.dir, "todo.txt"))
+            self.assertEqual(entry_index.update(Type.FILE, entry.get_entries(Type.FILE, self.dir)), 2)
+            self.assertEqual(entry_index.entries(Type.FILE, self.dir).names, ["report.PDF", "todo.txt"])
+
+            found = entry_index.query(under=self.tmp.name, ext="pdf", min_size=1000)
+            self.assertEqual(found.names, [os.path.join("client", "archive", "old.pdf"),
+                                           os.path.join("client", "report.PDF")])
+            self.assertEqual(found[1].dir, os.path.join(self.dir, "report.PDF"))
+            self.assertEqual(entry_index.query(ext=".pdf", max_size=3000).names,
+                             [os.path.join(self.dir, "report.PDF")])
+
+    def test_index_batch(self):
+        """
+        Test: batch scans and renames keep the index up to date, and query reads it.
+        """
+        from index import Index
+        from project import parse_args, run
+        sheet_path = os.path.join(self.tmp.name, "names.csv")
+        with patch("sys.stdout", new_callable=StringIO), \
+                patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(self.tmp.name, "cache")}):
+            run(parse_args(["sheet", self.dir, "-o", sheet_path, "--index", self.path]))
+            with open(sheet_path, "w") as f:
+                f.write("notes.txt,notes.md\n")
+            run(parse_args(["rename", self.dir, "-m", sheet_path, "--plain", "--no-journal", "--index", self.path]))
+            with patch("sys.stdout", new_callable=StringIO) as stdout:
+                code = run(parse_args(["query", "--index", self.path, "--ext", "md"]))
+        self.assertEqual(code, 0)
+        self.assertIn(os.path.join(self.dir, "notes.md"), stdout.getvalue())
+        with Index(self.path) as entry_index:
+            self.assertEqual(entry_index.entries(Type.FILE, self.dir).names, ["notes.md", "report.PDF"])
+
+
+class TestRules(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = self.tmp.name
+        for day, name in ((3, "Holiday Photo.JPG"), (1, "beach.jpg"), (2, "notes.txt")):
+            path = os.path.join(self.dir, name)
+            open(path, "w").close()
+            moment = datetime(2024, 1, day, 12, 0).timestamp()
+            os.utime(path, (moment, moment))
+
+    #
+    # --> Class: rules.Rules(rules)
+    #
+    def test_rules_chain(self):
+        """
+        Test: the rules apply in order, with dates and sequence numbers from the raw stat columns.
+        """
+        import rules
+        entries = entry.get_entries(Type.FILE, self.dir)
+        chain = rules.Rules([rules.Regex(r"\s+", "_"),
+                             rules.Extension(".jpeg", old="jpg"),
+                             rules.DatePrefix("%Y%m%d"),
+                             rules.Sequence(by="date_modified", width=2)])
+        self.assertEqual(chain.names(entries), ["20240103_Holiday_Photo_03.jpeg",
+                                                "20240101_beach_01.jpeg",
+                                                "20240102_notes_02.txt"])
+        self.assertEqual(rules.Rules([rules.Extension("jpeg", old=".jpg")]).names(entries),
+                         ["Holiday Photo.jpeg", "beach.jpeg", ""])
+        self.assertEqual(list(rules.Rules([rules.Regex("^notes", "todo")]).rows(entries)),
+                         [("notes.txt", "todo.txt")])
+        self.assertEqual(rules.Rules([rules.Regex("^notes", "todo")]).names(list(entries)), ["", "", "todo.txt"])
+        with self.assertRaises(TypeError):  # A rule has to bind
+            rules.Rule()
+
+    def test_rules_apply_and_review(self):
+        """
+        Test: rules rename without a sheet, or fill in the Rename column of the sheet for review.
+        """
+        import csv
+        from project import parse_args, run
+        from utils import Exit
+        review = os.path.join(self.dir, "review.csv")
+        rules = ["--sub", " ", "-", "--sequence", "date_modified"]
+        with patch("sys.stdout", new_callable=StringIO), \
+                patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(self.dir, ".cache")}):
+            self.assertEqual(run(parse_args(["sheet", self.dir, "-o", review, *rules])), Exit.OK)
+            with open(review, newline="", encoding="utf-8-sig") as file:
+                renames = [row[-1] for row in list(csv.reader(file))[2:]]
+            self.assertEqual(renames, ["Holiday-Photo_3.JPG", "beach_1.jpg", "notes_2.txt"])
+            os.remove(review)
+            self.assertEqual(run(parse_args(["rename", self.dir, "--no-journal", *rules])), Exit.OK)
+        self.assertEqual(sorted(os.listdir(self.dir)), [".cache", "Holiday-Photo_3.JPG", "beach_1.jpg", "notes_2.txt"])
+
+
+class TestClassify(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = os.path.join(self.tmp.name, "dir")
+        os.mkdir(self.dir)
+        for name, head in (("scan", b"%PDF-1.7"), ("image.txt", b"\x89PNG\r\n\x1a\n"),
+                           ("notes.txt", b"BMW service"), ("letter.docx", b"PK\x03\x04"), ("backup.tar.gz", b"")):
+            with open(os.path.join(self.dir, name), "wb") as f:
+                f.write(head)
+        self.cache = os.path.join(self.tmp.name, "cache")
+
+    #
+    # --> Function: utils.suffix_type(name)
+    #
+    def test_suffix_type(self):
+        """
+        Test: the longest known suffix matches, in any case; hidden names and unknown suffixes have none.
+        """
+        from utils import suffix_type
+        self.assertEqual(suffix_type("backup.tar.gz"), "Tar Gzip Archive")
+        self.assertEqual(suffix_type("old.backup.gz"), "Gzip Compressed Archive")
+        self.assertEqual(suffix_type("PHOTO.JPG"), "JPEG Image File")
+        self.assertIsNone(suffix_type(".gz"))
+        self.assertIsNone(suffix_type("README"))
+        self.assertEqual(entry.get_entries(Type.FILE, self.dir)[0].values()[4], "Tar Gzip Archive")
+
+    #
+    # --> Class: classify.Classifier(sniff)
+    #
+    def test_classifier_sniffs_once(self):
+        """
+        Test: magic bytes tell the type of files without or with the wrong extension, and are cached.
+        """
+        from classify import Classifier
+        entries = entry.get_entries(Type.FILE, self.dir)
+        types = dict(zip(entries.names, Classifier(sniff=True, cache_dir=self.cache).classify(entries)))
+        self.assertEqual(types, {"backup.tar.gz": "Tar Gzip Archive",
+                                 "image.txt": "PNG Image File",
+                                 "letter.docx": "Microsoft Word Document",
+                                 "notes.txt": "Plain Text File",
+                                 "scan": "Portable Document Format File"})
+        self.assertEqual([row[4] for row in entries.rows()], list(types.values()))
+
+        with patch("classify.read_ends", side_effect=AssertionError("a file was read")):
+            Classifier(sniff=True, cache_dir=self.cache).classify(entry.get_entries(Type.FILE, self.dir))
+        with open(os.path.join(self.dir, "notes.txt"), "wb") as f:
+            f.write(b"%PDF-1.4")
+        os.utime(os.path.join(self.dir, "notes.txt"), (0, 0))
+        read = []
+        with patch("classify.read_ends", side_effect=lambda path, head: read.append(path) or b"%PDF-1.4"):
+            entries = entry.get_entries(Type.FILE, self.dir)
+            Classifier(sniff=True, cache_dir=self.cache).classify(entries)
+        self.assertEqual(read, [os.path.join(self.dir, "notes.txt")])
+        self.assertEqual(entries.types[entries.names.index("notes.txt")], "Portable Document Format File")
+
+
+class TestDuplicates(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = os.path.join(self.tmp.name, "dir")
+        os.mkdir(self.dir)
+        big = os.urandom(300 * 1024)
+        middle = bytearray(big)
+        middle[150 * 1024] ^= 0xFF  # Same size and ends, other contents
+        for name, data in (("a.bin", big), ("b.bin", big), ("c.bin", bytes(middle)), ("d.txt", b"notes"),
+                           ("e.txt", b"notes"), ("f.txt", b"other"), ("g.txt", b"unique size"), ("h.txt", b"")):
+            with open(os.path.join(self.dir, name), "wb") as f:
+                f.write(data)
+        self.cache = os.path.join(self.tmp.name, "cache")
+
+    #
+    # --> Class: duplicates.Duplicates()
+    #
+    def test_find_in_stages(self):
+        """
+        Test: same files share a group; a unique size is never read, and the hashes are cached.
+        """
+        from duplicates import Duplicates
+        entries = entry.get_entries(Type.FILE, self.dir)
+        cells = dict(zip(entries.names, Duplicates(workers=1, cache_dir=self.cache).find(entries)))
+        self.assertEqual(cells, {"a.bin": "Group 1 (2 copies)", "b.bin": "Group 1 (2 copies)", "c.bin": "",
+                                 "d.txt": "Group 2 (2 copies)", "e.txt": "Group 2 (2 copies)", "f.txt": "",
+                                 "g.txt": "", "h.txt": ""})
+
+        with patch("duplicates._ends", side_effect=AssertionError("a file was read")):
+            entries = entry.get_entries(Type.FILE, self.dir)
+            self.assertEqual(Duplicates(workers=1, cache_dir=self.cache).find(entries), list(cells.values()))
+
+        from classify import Classifier
+        self.assertEqual(os.path.splitext(os.path.basename(Duplicates(cache_dir=self.cache)._path(entries)))[0],
+                         os.path.splitext(os.path.basename(Classifier(cache_dir=self.cache)._path(entries)))[0])
+
+        from duplicates import _ends
+        read = []
+        with patch("duplicates._ends", side_effect=lambda path: read.append(os.path.basename(path)) or _ends(path)):
+            Duplicates(workers=1, threads=2, cache_dir=os.path.join(self.tmp.name, "other")).find(entries)
+        self.assertEqual(sorted(read), ["a.bin", "b.bin", "c.bin", "d.txt", "e.txt", "f.txt"])
+
+    #
+    # --> Method: Sheet.rename(..., duplicates)
+    #
+    def test_sheet_duplicate_column(self):
+        """
+        Test: the Duplicate column follows Rename, so the columns read back stay Name and Rename.
+        """
+        import csv
+        from duplicates import Duplicates
+        from sheet import Sheet
+        entries = entry.get_entries(Type.FILE, self.dir)
+        sheet = Sheet(Format.CSV)
+        sheet.filepath, sheet.filename = self.tmp.name, os.path.join(self.tmp.name, "review.csv")
+        sheet.rename(input_dir=self.dir, entries=entries,
+                     headers=entry.header_rename(Type.FILE, duplicates=True),
+                     renames=["" if name != "b.bin" else "b copy.bin" for name in entries.names],
+                     duplicates=Duplicates(workers=1, cache_dir=self.cache).find(entries))
+        with open(sheet.filename, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        self.assertIn(entry.header_rename(Type.FILE) + [Strings.duplicate], rows)
+        self.assertIn(["b.bin", "b copy.bin", "Group 1 (2 copies)"], [[row[0]] + row[-2:] for row in rows])
+        self.assertEqual(sheet.columns, (0, 5))
+        self.assertEqual(list(sheet.load()), [("b.bin", "b copy.bin")])
+
+
+class TestWatcher(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp.name, "sheet.ods")
+        with open(self.path, "w") as file:
+            file.write("old")
+
+    def save(self):
+        import time
+        time.sleep(0.1)
+        with open(self.path + ".tmp", "w") as file:  # Saved the way LibreOffice does: write, then rename over
+            file.write("new")
+            file.flush()
+            time.sleep(0.1)
+            file.write(" and complete")
+        os.replace(self.path + ".tmp", self.path)
+
+    #
+    # --> Class: watcher.Watcher(paths)
+    #
+    def test_wait_for_save(self):
+        """
+        Test: the watcher returns once the save is over, with inotify and by polling, and times out otherwise.
+        """
+        import threading
+        import watcher
+        for inotify in (True, False):
+            with self.subTest(inotify=inotify), patch("watcher._inotify", wraps=watcher._inotify) as mock_inotify:
+                if not inotify:
+                    mock_inotify.side_effect = lambda paths: None
+                with watcher.Watcher([self.path], settle=0.2, interval=0.05) as save_watcher:
+                    self.assertIsNone(save_watcher.wait(timeout=0.1))
+                    thread = threading.Thread(target=self.save)
+                    thread.start()
+                    self.assertEqual(save_watcher.wait(timeout=5), self.path)
+                    thread.join()
+                with open(self.path) as file:
+                    self.assertEqual(file.read(), "new and complete")
+
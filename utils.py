@@ -1,6 +1,11 @@
+import importlib.util
 import os
 import enum
-from colorama import init, Fore, Style
+import sys
+from functools import lru_cache
+from colorama import Fore, Style
+
+WORKERS = 16  # Files read, renamed or created at once; mostly waiting on the disk or the network
 
 
 class Action(enum.Enum):
@@ -13,9 +18,33 @@ class Type(enum.Enum):
     FOLDER = "FOLDER"
 
 
-class Strings:
-    init()
+class Format(enum.Enum):
+    XLSX = "xlsx"
+    ODS = "ods"
+    CSV = "csv"
+    TSV = "tsv"
+
+
+class Conflict(enum.Enum):
+    EXISTS = "EXISTS"
+    DUPLICATE = "DUPLICATE"
+    CASE = "CASE"
+
+
+class Exit(enum.IntEnum):
+    OK = 0
+    FAILED = 1  # Some operations failed
+    USAGE = 2  # Bad arguments, as argparse exits with
+    NOT_FOUND = 3  # The directory, sheet or journal does not exist
+    SKIPPED = 4  # Some rows were skipped, nothing failed
+
 
+class Split(enum.Enum):
+    SHEETS = "SHEETS"
+    WORKBOOKS = "WORKBOOKS"
+
+
+class Strings:
     back = ".."
 
     # *** Sheet Headers *** 
@@ -45,6 +74,8 @@ Instructions:
     file_type = "Type"
 
     rename = "Rename"
+    duplicate = "Duplicate"
+    duplicate_group = "Group {group} ({count} copies)"
     document_file = "Document File"
 
     # *** Headers *** 
@@ -67,6 +98,21 @@ Instructions:
 
     # *** Others ***
     init_sheet = Fore.MAGENTA + "\nInitializing spreadsheet...\n" + Style.RESET_ALL
+    wait_save = Fore.MAGENTA + "Waiting for the spreadsheet to be saved... (Ctrl+C to cancel)\n" + Style.RESET_ALL
+
+    # *** Dry run ***
+    dry_run_header = Fore.YELLOW + Style.BRIGHT + "*** Dry Run: Nothing Will Be Changed ***\n" + Style.RESET_ALL
+    dry_run_rename = Fore.RED + "- {old}" + Style.RESET_ALL + "\n" + Fore.GREEN + "+ {new}" + Style.RESET_ALL
+    dry_run_create = Fore.GREEN + "+ {name}" + Style.RESET_ALL
+    dry_run_skip = Fore.LIGHTBLACK_EX + "  {old} -> {new}  (skipped: {reason})" + Style.RESET_ALL
+    dry_run_counts = Style.BRIGHT + "\n{done} to {action}, {skipped} skipped, {steps} step(s) for {rows} row(s)" \
+        + Style.RESET_ALL
+    dry_run_timing = Fore.LIGHTBLACK_EX + "  {phase:<16}{seconds:9.3f}s" + Style.RESET_ALL
+
+    reason_exists = "the name exists"
+    reason_duplicate = "the new name of another row"
+    reason_case = "only differs in case from another name"
+    reason_invalid = "not a folder inside the directory"
 
     # *** Success messages ***
     result_renaming_successful = (
@@ -75,13 +121,17 @@ Instructions:
             + "*** Renamed {num} {type} Successfully! ***\n"
             + Style.RESET_ALL
     )
-    result_creating_successful = (
+    result_creating_summary = (
             Fore.GREEN
             + Style.BRIGHT
-            + "*** Created {num} Folder(s) Successfully! ***\n"
+            + "*** Created {created} Folder(s), {existing} Already Existed, {failed} Failed ***\n"
             + Style.RESET_ALL
     )
 
+    result_found = Fore.GREEN + Style.BRIGHT + "*** Found {num} {type} ***\n" + Style.RESET_ALL
+
+    result_journal = Fore.LIGHTBLACK_EX + "Journal: {path}\n" + Style.RESET_ALL
+
     # *** Error messages ***
     err_input_interrupted = Fore.RED + Style.BRIGHT + "*** Input Interrupted! ***\n" + Style.RESET_ALL
     err_invalid_choice = Fore.RED + Style.BRIGHT + "Invalid Choice!\n" + Style.RESET_ALL
@@ -116,6 +166,33 @@ Instructions:
             + "File '{name}' already exists. Skipping..."
             + Style.RESET_ALL
     )
+    err_invalid_folder = (
+            Fore.RED
+            + Style.BRIGHT
+            + "'{name}' is not a folder inside the directory. Skipping..."
+            + Style.RESET_ALL
+    )
+    err_parent_failed = (
+            Fore.RED
+            + Style.BRIGHT
+            + "'{name}' not created, as its parent folder could not be. Skipping..."
+            + Style.RESET_ALL
+    )
+    err_name_taken = (
+            Fore.RED
+            + Style.BRIGHT
+            + "'{name}' is already the new name of another entry. Skipping..."
+            + Style.RESET_ALL
+    )
+    err_name_case = (
+            Fore.RED
+            + Style.BRIGHT
+            + "'{name}' only differs in case from another name. Skipping..."
+            + Style.RESET_ALL
+    )
+    err_entry_skipped = (
+            Fore.RED + Style.BRIGHT + "Could not read '{name}': {err}. Skipping..." + Style.RESET_ALL
+    )
     err_entries_not_found = (
             Fore.RED + Style.BRIGHT + "No entries found in '{dir}'.\n" + Style.RESET_ALL
     )
@@ -227,6 +304,147 @@ file_extensions = {
     ".ani": "Animated Cursor File"
 }
 
+# The extensions by their lower-cased suffix, and the most parts a suffix
+# has: ".tar.gz" has two, so only the last two suffixes of a name are looked up
+_SUFFIXES = {ext.lower(): file_type for ext, file_type in file_extensions.items()}
+_SUFFIX_PARTS = max(ext.count(".") for ext in _SUFFIXES)
+
+
+def suffix_type(name: str) -> str | None:
+    """
+    Looks up the longest known suffix of a name, in any case, so
+    "a.tar.gz" is a Tar Gzip Archive rather than a Gzip file. Only the last
+    few suffixes are looked at, from the end of the name backwards.
+
+    Returns:
+        str:    The type, or None when no suffix is known.
+    """
+    start = len(name)
+    for _ in range(_SUFFIX_PARTS):
+        dot = name.rfind(".", 0, start)
+        if dot <= 0:  # No dot, or the dot of a hidden file
+            break
+        start = dot
+    return _tail_type(name[start:]) if start < len(name) else None
+
+
+@lru_cache(maxsize=4096)
+def _tail_type(tail: str) -> str | None:
+    # The last suffixes of a name, e.g. ".tar.gz": a few thousand distinct
+    # ones cover a whole disk, so each is looked up once
+    lower = tail.lower()
+    start = len(lower)
+    found = None
+    while (start := lower.rfind(".", 0, start)) >= 0:
+        found = _SUFFIXES.get(lower[start:], found)
+    return found
+
+
+def lazy_import(name: str):
+    """
+    Imports a module on first use instead of now: the module object is
+    returned at once, and its code runs when one of its attributes is
+    first read. Keeps the start of the program fast when a heavy module is
+    only needed on some paths.
+
+    Args:
+        name (str):     The module name.
+    Returns:
+        module:         The module, or None when it is not installed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def cache_path(*parts) -> str:
+    """
+    Returns:
+        str:    A path in the cache folder of the application, in the user cache folder of the platform.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "directory-management", *parts)
+
+
+pickle = lazy_import("pickle")  # Only the runs that read or write a cache need it
+
+
+def load_cache(path: str, version: int):
+    """
+    Args:
+        path (str):     The cache file.
+        version (int):  The version of the cache format the caller reads.
+    Returns:
+        object:         What save_cache() stored, or None when there is no cache of this version.
+    """
+    try:
+        with open(path, "rb") as file:
+            saved, value = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError, TypeError):
+        return None
+    return value if saved == version else None
+
+
+def save_cache(path: str, value, version: int) -> None:
+    """
+    Writes a cache file through a temporary file, so a reader never sees
+    half of it. A cache is only a cache: failing to write it is not an
+    error.
+
+    Args:
+        path (str):     The cache file.
+        value:          What to store.
+        version (int):  The version of the cache format.
+    """
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp, "wb") as file:
+            pickle.dump((version, value), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+    except OSError:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+
+def read_ends(path: str, head: int, tail: int = 0) -> bytes | None:
+    """
+    Reads the first head bytes of a file and its last tail bytes, or all
+    of a file of up to head + tail bytes.
+
+    Args:
+        path (str):     The file.
+        head (int):     Bytes read from the start.
+        tail (int):     Bytes read from the end.
+    Returns:
+        bytes:          The bytes read, or None when the file was removed or is unreadable since the scan.
+    """
+    try:
+        with open(path, "rb", buffering=0) as file:
+            data = file.read(head)
+            if tail:
+                if os.fstat(file.fileno()).st_size > head + tail:
+                    file.seek(-tail, os.SEEK_END)
+                    data += file.read(tail)
+                else:
+                    data += file.read()
+            return data
+    except OSError:
+        return None
+
 
 def clear_terminal():
     if os.name == "nt":
@@ -0,0 +1,142 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+SETTLE = 0.5  # Seconds without a write before a save counts as finished
+INTERVAL = 0.25  # Seconds between two looks at the files when polling
+
+# inotify(7) event flags
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; the name follows
+
+
+class Watcher:
+    """
+    Waits until one of the files is saved, then until the write is over.
+
+    On Linux, inotify reports the writes, closes and renames in the folders
+    of the files, so nothing runs while the user edits. Elsewhere, or when
+    inotify is not available, the files are stat-ed every INTERVAL seconds.
+    Either way, a save counts once the file has not changed for SETTLE
+    seconds, so a half-written file is never read. Applications that save
+    to a temporary file and rename it over the original are seen too, as
+    the inode changes.
+    """
+
+    def __init__(self, paths: list, settle: float = SETTLE, interval: float = INTERVAL):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.settle = settle
+        self.interval = interval
+        self._baseline = {path: _signature(path) for path in self.paths}
+        self._fd = _inotify(self.paths)
+
+    def wait(self, timeout: float = None) -> str | None:
+        """
+        Blocks until a file is saved and the save is over.
+
+        Args:
+            timeout (float):    Seconds to wait at most (None = no limit).
+        Returns:
+            str:                The saved file, or None when the time ran out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if remaining == 0:
+                return None
+            if self._fd is not None:
+                self._events(remaining)
+            else:
+                time.sleep(self.interval if remaining is None else min(self.interval, remaining))
+            for path in self.paths:
+                if _signature(path) != self._baseline[path]:
+                    self._settle(path)
+                    self._baseline[path] = _signature(path)
+                    return path
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _events(self, timeout: float | None) -> bool:
+        """
+        Waits for inotify events, reads them all and tells if any was
+        about one of the files.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return False
+        names = {os.path.basename(path) for path in self.paths}
+        touched = False
+        try:
+            while True:
+                data = os.read(self._fd, 65536)
+                offset = 0
+                while offset < len(data):
+                    _, _, _, length = _EVENT.unpack_from(data, offset)
+                    name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                    touched |= os.fsdecode(name) in names
+                    offset += _EVENT.size + length
+        except BlockingIOError:
+            pass
+        return touched
+
+    def _settle(self, path: str) -> None:
+        """
+        Returns once the file has stayed the same for the settle time.
+        """
+        signature = _signature(path)
+        while True:
+            if self._fd is not None:
+                changed = self._events(self.settle)
+            else:
+                time.sleep(self.settle)
+                changed = False
+            current = _signature(path)
+            if not changed and current == signature and current is not None:
+                return
+            signature = current
+
+
+def _signature(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _inotify(paths: list) -> int | None:
+    """
+    Returns:
+        int:    A non-blocking inotify descriptor watching the folders of the files, or None.
+    """
+    if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    for folder in {os.path.dirname(path) for path in paths}:
+        if libc.inotify_add_watch(fd, os.fsencode(folder), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            os.close(fd)
+            return None  # Out of watches, poll instead
+    return fd
@@ -0,0 +1,275 @@
+import re
+import zipfile
+from collections import namedtuple
+
+from utils import lazy_import
+
+openpyxl = lazy_import("openpyxl")  # Only loaded to read a workbook
+
+# Formatting of one cell; the writer dedupes these into the styles table
+CellStyle = namedtuple(
+    "CellStyle",
+    ["font_name", "font_color", "italic", "horizontal", "vertical", "border_color", "fill_color", "number_format"],
+    defaults=[None, None, False, None, None, None, None, None])
+
+NUMBER_FORMATS = {None: 0, "@": 49}  # Built-in number formats
+
+# Characters XML needs escaped, and control characters XML 1.0 does not allow
+_ESCAPE = {ord("&"): "&amp;", ord("<"): "&lt;", ord(">"): "&gt;"}
+_ESCAPE.update({code: None for code in range(32) if code not in (9, 10, 13)})
+_NEEDS_ESCAPE = re.compile(r"[&<>\x00-\x08\x0b\x0c\x0e-\x1f]").search
+
+_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_CHUNK_ROWS = 1000  # Rows joined per write to the zip stream
+
+
+class XlsxWriter:
+    """
+    A row-at-a-time XLSX writer.
+
+    Rows go straight into the deflate stream of the worksheet part, with
+    inline strings instead of a shared string table, so memory stays flat no
+    matter how many rows are written. Cells are written in order without a
+    cell reference, which the format allows. Only the features the sheets use are
+    supported: column widths, row heights, merged ranges and cell styles.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        self._styles = {CellStyle(): 0}  # Index 0 is the default style
+        self._sheets = []
+        self._stream = None
+        self._buffer = []
+        self._templates = {}
+        self._row = 0
+        self._merged = ()
+
+    def style(self, cell_style: CellStyle) -> int:
+        """
+        Registers a cell style.
+
+        Args:
+            cell_style (CellStyle): The formatting.
+        Returns:
+            int:                    The style index to pass to append().
+        """
+        return self._styles.setdefault(cell_style, len(self._styles))
+
+    def styles(self, registry: dict) -> dict:
+        """
+        Registers every style of a registry.
+
+        Args:
+            registry (dict):    CellStyle by role.
+        Returns:
+            dict:               Style index by role.
+        """
+        return {role: self.style(cell_style) for role, cell_style in registry.items()}
+
+    def add_sheet(self, title: str, widths=(), merged=()) -> None:
+        """
+        Starts a new worksheet; the previous one is finished first.
+
+        Args:
+            title (str):        The worksheet name.
+            widths (list):      The width of each column, starting at column A.
+            merged (list):      Ranges to merge, e.g. "A1:F1".
+        Returns:
+            None
+        """
+        self._end_sheet()
+        self._sheets.append(title)
+        self._stream = self._zip.open(f"xl/worksheets/sheet{len(self._sheets)}.xml", "w", force_zip64=True)
+        self._row = 0
+        self._merged = merged
+        cols = "".join(
+            f'<col min="{col}" max="{col}" width="{width}" customWidth="1"/>'
+            for col, width in enumerate(widths, start=1))
+        self._write(f'{_HEADER}<worksheet xmlns="{_NS}">'
+                    + (f"<cols>{cols}</cols>" if cols else "")
+                    + "<sheetData>")
+
+    def append(self, values, styles, height=None) -> None:
+        """
+        Writes the next row.
+
+        Args:
+            values (list):  The cell values; None or "" leaves only the style.
+            styles (list):  The style index of each cell.
+            height (float): The row height, or None for the default.
+        Returns:
+            None
+        """
+        self._row += 1
+        row = f'<row r="{self._row}" ht="{height}" customHeight="1">' if height else f'<row r="{self._row}">'
+        texts = [value for value in values if value is not None and value != ""]
+        try:
+            joined = "\t".join(texts)
+        except TypeError:  # Not only strings
+            joined = None
+        if joined is None or _NEEDS_ESCAPE(joined) or list(map(str.strip, texts)) != texts:
+            self._buffer.append(row + self._cells(values, styles) + "</row>")
+        else:
+            # Fast path, for rows with nothing to escape and no surrounding
+            # whitespace: one template per style and empty-cell combination,
+            # filled with the whole row at once
+            key = (tuple(styles), tuple(map(bool, values)))
+            template = self._templates.get(key)
+            if template is None:
+                template = self._templates[key] = "".join(
+                    f'<c s="{style}" t="inlineStr"><is><t>%s</t></is></c>' if present else f'<c s="{style}"/>'
+                    for style, present in zip(styles, key[1])) + "</row>"
+            self._buffer.append(row + template % tuple(texts))
+        if len(self._buffer) >= _CHUNK_ROWS:
+            self._flush()
+
+    def _cells(self, values, styles) -> str:
+        parts = []
+        for value, style in zip(values, styles):
+            if value is None or value == "":
+                parts.append(f'<c s="{style}"/>')
+                continue
+            text = str(value)
+            if _NEEDS_ESCAPE(text):
+                text = text.translate(_ESCAPE)
+            space = ' xml:space="preserve"' if text != text.strip() else ""  # Keep the surrounding whitespace
+            parts.append(f'<c s="{style}" t="inlineStr"><is><t{space}>{text}</t></is></c>')
+        return "".join(parts)
+
+    def close(self) -> None:
+        """
+        Finishes the last worksheet and writes the workbook parts.
+        """
+        self._end_sheet()
+        sheets = "".join(
+            f'<sheet name="{title.translate(_ESCAPE)}" sheetId="{i}" r:id="rId{i}"/>'
+            for i, title in enumerate(self._sheets, start=1))
+        self._zip.writestr("xl/workbook.xml",
+                           f'{_HEADER}<workbook xmlns="{_NS}" xmlns:r="{_NS_R}"><sheets>{sheets}</sheets></workbook>')
+        rels = "".join(
+            f'<Relationship Id="rId{i}" Type="{_NS_R}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, len(self._sheets) + 1))
+        rels += f'<Relationship Id="rId{len(self._sheets) + 1}" Type="{_NS_R}/styles" Target="styles.xml"/>'
+        self._zip.writestr("xl/_rels/workbook.xml.rels", _relationships(rels))
+        self._zip.writestr("xl/styles.xml", self._styles_xml())
+        self._zip.writestr("_rels/.rels", _relationships(
+            f'<Relationship Id="rId1" Type="{_NS_R}/officeDocument" Target="xl/workbook.xml"/>'))
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(self._sheets) + 1))
+        self._zip.writestr(
+            "[Content_Types].xml",
+            f'{_HEADER}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f"{overrides}</Types>")
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, text: str) -> None:
+        self._stream.write(text.encode("utf-8", "replace"))
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._write("".join(self._buffer))
+            self._buffer.clear()
+
+    def _end_sheet(self) -> None:
+        if self._stream is None:
+            return
+        self._flush()
+        merged = "".join(f'<mergeCell ref="{ref}"/>' for ref in self._merged)
+        self._write("</sheetData>"
+                    + (f'<mergeCells count="{len(self._merged)}">{merged}</mergeCells>' if merged else "")
+                    + "</worksheet>")
+        self._stream.close()
+        self._stream = None
+
+    def _styles_xml(self) -> str:
+        fonts, fills, borders, xfs = {}, {"none": 0, "gray125": 1}, {None: 0}, []
+        for cell_style in self._styles:
+            font = (cell_style.font_name, cell_style.font_color, cell_style.italic)
+            font_id = fonts.setdefault(font, len(fonts))
+            fill_id = fills.setdefault(cell_style.fill_color, len(fills)) if cell_style.fill_color else 0
+            border_id = borders.setdefault(cell_style.border_color, len(borders))
+            alignment = "".join(
+                f' {name}="{value}"'
+                for name, value in (("horizontal", cell_style.horizontal), ("vertical", cell_style.vertical))
+                if value)
+            xfs.append(
+                f'<xf numFmtId="{NUMBER_FORMATS[cell_style.number_format]}" fontId="{font_id}" '
+                f'fillId="{fill_id}" borderId="{border_id}" xfId="0" applyNumberFormat="1" '
+                f'applyFont="1" applyFill="1" applyBorder="1" applyAlignment="1">'
+                f'<alignment{alignment}/></xf>')
+        font_xml = "".join(
+            "<font>" + ("<i/>" if italic else "") + '<sz val="11"/>'
+            + (f'<color rgb="FF{color}"/>' if color else "")
+            + f'<name val="{name or "Calibri"}"/></font>'
+            for name, color, italic in fonts)
+        fill_xml = '<fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill>'
+        fill_xml += "".join(
+            f'<fill><patternFill patternType="solid"><fgColor rgb="FF{color}"/></patternFill></fill>'
+            for color in list(fills)[2:])
+        border_xml = "".join(
+            "<border>" + "".join(
+                f'<{side} style="thin"><color rgb="FF{color}"/></{side}>' if color else f"<{side}/>"
+                for side in ("left", "right", "top", "bottom")) + "<diagonal/></border>"
+            for color in borders)
+        return (f'{_HEADER}<styleSheet xmlns="{_NS}">'
+                f'<fonts count="{len(fonts)}">{font_xml}</fonts>'
+                f'<fills count="{len(fills)}">{fill_xml}</fills>'
+                f'<borders count="{len(borders)}">{border_xml}</borders>'
+                '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+                f'<cellXfs count="{len(xfs)}">{"".join(xfs)}</cellXfs>'
+                '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+                "</styleSheet>")
+
+
+def read_rows(path: str, min_row: int = 1, max_col: int = None):
+    """
+    Streams the value rows of every worksheet of an XLSX file, in order.
+    min_row applies to each worksheet, as paged workbooks repeat the layout.
+
+    Args:
+        path (str):     The file.
+        min_row (int):  The first row to return, starting at 1.
+        max_col (int):  The number of columns to return (None = all).
+    Returns:
+        Generator:      Tuples padded to max_col, with None for empty cells.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield from worksheet.iter_rows(values_only=True, min_row=min_row, max_col=max_col)
+    finally:
+        workbook.close()
+
+
+def column_letter(number: int) -> str:
+    """
+    Returns:
+        str:    The letters of a column, starting at 1: A, B, ... Z, AA, AB...
+    """
+    letters = ""
+    while number > 0:
+        number, rest = divmod(number - 1, 26)
+        letters = chr(ord("A") + rest) + letters
+    return letters
+
+
+def _relationships(body: str) -> str:
+    return (f'{_HEADER}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f"{body}</Relationships>")